@@ -18,12 +18,17 @@ from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent))
 
 from sqlalchemy import text
-from common.db_utils import get_engine_from_env, get_tenant_id
+from common.db_utils import get_engine_from_env, get_tenant_id, run_with_retry
+from common.mapping_cache import mapping_cache
+from common.checkpoint import limpar_checkpoint
+from common.incremental import limpar_fingerprints
+from common.row_hash import limpar_hashes
+from common.prontuario_entries import limpar_hashes_entries
 import time
 
 
 def get_fresh_connection():
-    """Obtém um novo engine para conexão com o banco de dados."""
+    """Retorna o engine do banco destino (pool de conexões compartilhado)."""
     return get_engine_from_env("DEST_DB_URL")
 
 
@@ -61,43 +66,32 @@ def execute_delete_with_retry(table_name: str, tenant_id: str, step_number: str,
     
     total_deleted = 0
     
+    # Excluir em lotes (TOP N)
+    delete_sql = text(f"""
+        DELETE TOP ({batch_size}) FROM {table_name} 
+        WHERE sCdTenant = :tenant
+    """)
+    
+    def delete_lote(engine):
+        with engine.begin() as conn:
+            return conn.execute(delete_sql, {"tenant": tenant_id}).rowcount
+    
     # Loop até não ter mais registros para excluir
     while True:
-        deleted_in_batch = 0
+        try:
+            deleted_in_batch = run_with_retry(delete_lote, "DEST_DB_URL", retries=retry_count)
+        except Exception as e:
+            print(f"\n✗ Erro após {retry_count} tentativas: {e}")
+            raise
         
-        for attempt in range(retry_count):
-            try:
-                engine = get_fresh_connection()
-                
-                # Excluir em lotes (TOP N)
-                delete_sql = text(f"""
-                    DELETE TOP ({batch_size}) FROM {table_name} 
-                    WHERE sCdTenant = '{tenant_id}'
-                """)
-                
-                with engine.begin() as conn:
-                    result = conn.execute(delete_sql)
-                    deleted_in_batch = result.rowcount
-                
-                total_deleted += deleted_in_batch
-                
-                # Se deletou registros, mostrar progresso
-                if deleted_in_batch > 0:
-                    print(f"{total_deleted:,}...", end=" ", flush=True)
-                
-                break  # Sucesso, sair do retry
-                
-            except Exception as e:
-                if attempt < retry_count - 1:
-                    print(f"\n⚠ Tentativa {attempt + 1} falhou. Tentando novamente em 2 segundos...")
-                    time.sleep(2)
-                else:
-                    print(f"\n✗ Erro após {retry_count} tentativas: {e}")
-                    raise
+        total_deleted += deleted_in_batch
         
         # Se não deletou nada nesse lote, terminou
         if deleted_in_batch == 0:
             break
+        
+        # Mostrar progresso
+        print(f"{total_deleted:,}...", end=" ", flush=True)
     
     print(f"✓ Total: {total_deleted:,} registros excluídos")
     return total_deleted
@@ -409,9 +403,20 @@ def clear_all_data(dry_run: bool = False):
         stats['clientes'] = clear_clientes(dest_engine, tenant_id, dry_run)
         stats['controle'] = clear_controle(dest_engine, tenant_id, dry_run)
         
+        # Checkpoints, fingerprints e hashes (inclusive das entries de prontuários) apontariam para dados que não existem mais
+        if not dry_run:
+            limpar_checkpoint(dest_engine, tenant_id)
+            limpar_fingerprints(dest_engine, tenant_id)
+            limpar_hashes(dest_engine, tenant_id)
+            limpar_hashes_entries(dest_engine, tenant_id)
+        
     except Exception as e:
         print(f"\n✗ Erro durante exclusão: {e}")
         return None
+    finally:
+        # Mapeamentos em memória deixam de valer após a exclusão (mesmo parcial)
+        if not dry_run:
+            mapping_cache.invalidate(tenant_id=tenant_id)
     
     # Mostrar contagens depois
     if not dry_run:
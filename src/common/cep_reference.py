@@ -0,0 +1,119 @@
+"""
+Base offline de faixas de CEP -> cidade/UF.
+
+Permite resolver CEPs sem acessar a ViaCEP. O arquivo de referência pode ser:
+
+- CSV com cabeçalho: cep_inicio,cep_fim,localidade,uf (separador ',' ou ';')
+- SQLite com a tabela faixas_cep (mesmas colunas)
+
+CEPs com menos de 8 dígitos recebem zeros à esquerda: colunas numéricas (SQLite,
+planilhas) perdem o zero inicial e 1000000 é o CEP 01000-000. Prefixos precisam
+ser marcados com '*' (ex: 89010* a 89099*): o início é completado com zeros e o
+fim com noves até 8 dígitos. As faixas (sem sobreposição) ficam em uma lista
+ordenada e a busca é binária (bisect).
+"""
+import csv
+import sqlite3
+from bisect import bisect_right
+from pathlib import Path
+
+from common.viacep_client import clean_cep
+
+
+COLUNAS_REFERENCIA = ["cep_inicio", "cep_fim", "localidade", "uf"]
+
+
+def _normalizar_cep(valor, completar: str):
+    """CEP da faixa como inteiro de 8 dígitos ('*' no fim = prefixo completado com `completar`)."""
+    if isinstance(valor, float) and valor.is_integer():
+        valor = int(valor)
+    texto = "" if valor is None else str(valor).strip()
+    digitos = clean_cep(texto)
+    if not digitos or len(digitos) > 8:
+        return None
+    if texto.endswith("*"):
+        return int(digitos.ljust(8, completar))
+    return int(digitos.zfill(8))
+
+
+def _normalizar_faixa(inicio, fim):
+    if fim is None or str(fim).strip() == "":
+        fim = inicio
+    inicio = _normalizar_cep(inicio, "0")
+    fim = _normalizar_cep(fim, "9")
+    if inicio is None or fim is None:
+        return None
+    return inicio, fim
+
+
+class CepRangeReference:
+    """
+    Faixas de CEP em memória com busca binária.
+
+    Args:
+        path: Arquivo CSV ou SQLite (.db/.sqlite/.sqlite3) com as faixas
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._inicios = []
+        self._faixas = []   # [(inicio, fim, localidade, uf)] ordenadas pelo início
+
+        if self.path.suffix.lower() in (".db", ".sqlite", ".sqlite3"):
+            linhas = self._ler_sqlite()
+        else:
+            linhas = self._ler_csv()
+
+        faixas = []
+        for linha in linhas:
+            faixa = _normalizar_faixa(linha["cep_inicio"], linha["cep_fim"])
+            if faixa and linha["localidade"] and linha["uf"]:
+                faixas.append((faixa[0], faixa[1], str(linha["localidade"]).strip(), str(linha["uf"]).strip().upper()))
+
+        faixas.sort()
+        self._faixas = faixas
+        self._inicios = [f[0] for f in faixas]
+
+    def _ler_csv(self):
+        with open(self.path, newline="", encoding="utf-8-sig") as f:
+            amostra = f.read(4096)
+            f.seek(0)
+            delimitador = ";" if amostra.count(";") > amostra.count(",") else ","
+            return [
+                {c: (row.get(c) or "") for c in COLUNAS_REFERENCIA}
+                for row in csv.DictReader(f, delimiter=delimitador)
+            ]
+
+    def _ler_sqlite(self):
+        conn = sqlite3.connect(str(self.path))
+        try:
+            cursor = conn.execute(f"SELECT {', '.join(COLUNAS_REFERENCIA)} FROM faixas_cep")
+            # CEPs ficam com o tipo da coluna (INTEGER/REAL/TEXT): _normalizar_faixa trata cada um
+            return [dict(zip(COLUNAS_REFERENCIA, ("" if v is None else v for v in row)))
+                    for row in cursor]
+        finally:
+            conn.close()
+
+    def __len__(self):
+        return len(self._faixas)
+
+    def buscar(self, cep):
+        """
+        Resolve um CEP pela faixa que o contém.
+
+        Returns:
+            dict: {'cep', 'localidade', 'uf'} no formato da ViaCEP, ou None se nenhuma faixa cobrir o CEP
+        """
+        cep_limpo = clean_cep(cep)
+        if len(cep_limpo) != 8:
+            return None
+
+        valor = int(cep_limpo)
+        posicao = bisect_right(self._inicios, valor) - 1
+        if posicao < 0:
+            return None
+
+        inicio, fim, localidade, uf = self._faixas[posicao]
+        if valor > fim:
+            return None
+        return {"cep": f"{cep_limpo[:5]}-{cep_limpo[5:]}", "localidade": localidade, "uf": uf}
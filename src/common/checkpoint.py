@@ -0,0 +1,102 @@
+"""
+Checkpoint (high-water mark) de migrações longas.
+
+Cada migração grava o último Codigo do legado já processado na tabela
+CONTROLE_MIGRACAO_CHECKPOINT, na MESMA transação do lote gravado. Se a execução
+cair no meio, a próxima retoma a partir do último lote confirmado.
+
+Ao terminar com sucesso o checkpoint é removido: a execução seguinte volta a
+percorrer toda a origem (reprocessando/atualizando os registros já migrados).
+"""
+from sqlalchemy import text
+
+
+CHECKPOINT_TABLE = "CONTROLE_MIGRACAO_CHECKPOINT"
+
+_checkpoint_verificado = set()
+
+SELECT_CHECKPOINT_SQL = text(f"""
+SELECT nUltimoCodigo FROM dbo.{CHECKPOINT_TABLE}
+WHERE sCdTenant = :tenant AND sMigracao = :migracao
+""")
+
+UPDATE_CHECKPOINT_SQL = text(f"""
+UPDATE dbo.{CHECKPOINT_TABLE}
+SET nUltimoCodigo = :ultimo_codigo, dtAtualizacao = GETDATE()
+WHERE sCdTenant = :tenant AND sMigracao = :migracao
+""")
+
+INSERT_CHECKPOINT_SQL = text(f"""
+INSERT INTO dbo.{CHECKPOINT_TABLE} (sCdTenant, sMigracao, nUltimoCodigo, dtAtualizacao)
+VALUES (:tenant, :migracao, :ultimo_codigo, GETDATE())
+""")
+
+DELETE_CHECKPOINT_SQL = text(f"""
+DELETE FROM dbo.{CHECKPOINT_TABLE}
+WHERE sCdTenant = :tenant AND sMigracao = :migracao
+""")
+
+
+def ensure_checkpoint_table(engine):
+    """Cria a tabela de checkpoints no banco destino se não existir (uma verificação por engine)."""
+    chave = str(engine.url)
+    if chave in _checkpoint_verificado:
+        return
+
+    create_sql = f"""
+IF OBJECT_ID(N'dbo.{CHECKPOINT_TABLE}', N'U') IS NULL
+BEGIN
+    CREATE TABLE dbo.{CHECKPOINT_TABLE} (
+        sCdTenant UNIQUEIDENTIFIER NOT NULL,
+        sMigracao NVARCHAR(200) NOT NULL,
+        nUltimoCodigo BIGINT NOT NULL,
+        dtAtualizacao DATETIME NOT NULL DEFAULT(GETDATE()),
+        CONSTRAINT PK_{CHECKPOINT_TABLE} PRIMARY KEY (sCdTenant, sMigracao)
+    );
+END
+"""
+    with engine.begin() as conn:
+        conn.execute(text(create_sql))
+
+    _checkpoint_verificado.add(chave)
+
+
+def carregar_checkpoint(engine, tenant_id: str, migracao: str):
+    """
+    Retorna o último Codigo confirmado da migração ou None se não houver checkpoint.
+
+    Args:
+        engine: Engine do banco destino
+        tenant_id: ID da tenant
+        migracao: Nome da migração (ex: 'aplicacoes_vacinas')
+    """
+    ensure_checkpoint_table(engine)
+    with engine.connect() as conn:
+        valor = conn.execute(SELECT_CHECKPOINT_SQL, {"tenant": tenant_id, "migracao": migracao}).scalar()
+    return int(valor) if valor is not None else None
+
+
+def salvar_checkpoint(conn, tenant_id: str, migracao: str, ultimo_codigo: int):
+    """
+    Grava o high-water mark usando a conexão/transação do lote (commit atômico com os dados).
+
+    Args:
+        conn: Conexão dentro da transação do lote
+        tenant_id: ID da tenant
+        migracao: Nome da migração
+        ultimo_codigo: Maior Codigo do legado incluído no lote
+    """
+    params = {"tenant": tenant_id, "migracao": migracao, "ultimo_codigo": int(ultimo_codigo)}
+    if conn.execute(UPDATE_CHECKPOINT_SQL, params).rowcount == 0:
+        conn.execute(INSERT_CHECKPOINT_SQL, params)
+
+
+def limpar_checkpoint(engine, tenant_id: str, migracao: str = None):
+    """Remove o checkpoint de uma migração (ou todos os da tenant se migracao=None)."""
+    ensure_checkpoint_table(engine)
+    with engine.begin() as conn:
+        if migracao is None:
+            conn.execute(text(f"DELETE FROM dbo.{CHECKPOINT_TABLE} WHERE sCdTenant = :tenant"),
+                         {"tenant": tenant_id})
+        else:
+            conn.execute(DELETE_CHECKPOINT_SQL, {"tenant": tenant_id, "migracao": migracao})
@@ -1,7 +1,11 @@
 import os
+import time
+import threading
 from pathlib import Path
 from sqlalchemy import create_engine, text
+from sqlalchemy.exc import DBAPIError
 from dotenv import load_dotenv
+from common.mapping_cache import mapping_cache
 
 # Carrega variáveis do arquivo .env
 env_path = Path(__file__).parent.parent.parent / ".env"
@@ -11,12 +15,50 @@ DEFAULT_TENANT = os.getenv("DEFAULT_TENANT", "dfedd5f4-f30c-45ea-bc1e-695081d841
 DEFAULT_CITY_ID = os.getenv("DEFAULT_CITY_ID", "b6099443-d5c4-5e2c-8b53-4bd1c02b9793")
 DEFAULT_VET_USER_ID = os.getenv("DEFAULT_VET_USER_ID", "f7cc3d41-12e9-4247-a828-69cfeeb52a74")
 
+# Configuração do pool de conexões (compartilhado por todo o processo)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1").lower() not in ("0", "false", "nao", "não")
+DB_MAX_RETRIES = int(os.getenv("DB_MAX_RETRIES", "3"))
+DB_RETRY_DELAY_SECONDS = float(os.getenv("DB_RETRY_DELAY_SECONDS", "2"))
 
-def get_engine_from_env(env_var_name: str):
-    """Cria um SQLAlchemy engine a partir de uma variável do arquivo .env."""
-    url = os.getenv(env_var_name)
-    if not url:
-        raise RuntimeError(f"Variável {env_var_name} não definida no arquivo .env")
+# Códigos de erro transitórios do SQL Server / Azure SQL
+TRANSIENT_ERROR_CODES = (
+    "40613", "40501", "40197", "40540", "40143", "49918", "49919", "49920",
+    "10928", "10929", "10053", "10054", "10060", "4060", "4221", "233", "64", "1205",
+)
+TRANSIENT_ERROR_MESSAGES = (
+    "timeout", "timed out", "connection reset", "connection is closed", "connection was closed",
+    "lost connection", "communication link", "broken pipe", "transport-level", "deadlock",
+    "adaptive server is unavailable",
+)
+
+# Limite de parâmetros por comando do SQL Server (2100) e de linhas por VALUES (1000)
+MSSQL_MAX_PARAMS = 2099
+MSSQL_MAX_ROWS_PER_VALUES = 1000
+
+CONTROLE_COLUMNS = [
+    "sCdTenant", "sTabelaOrigem", "sCampoChaveOrigem", "sValorChaveOrigem",
+    "sTabelaDestino", "sCampoChaveDestino", "sValorChaveDestino", "dtMigracao",
+]
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def _create_engine(url: str):
+    """Cria o engine com as configurações de pool padrão do projeto."""
+    pool_args = {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+    
+    # pyodbc: executemany com array binding (um round trip por lote, não por linha)
+    if "pyodbc" in url:
+        return create_engine(url, fast_executemany=True, **pool_args)
     
     # Para pymssql, precisamos passar parâmetros adicionais para Azure SQL
     if "pymssql" in url:
@@ -26,14 +68,179 @@ def get_engine_from_env(env_var_name: str):
                 "timeout": 300,  # 5 minutos timeout para operações pesadas
                 "login_timeout": 30,
                 "tds_version": "7.4"
-            }
+            },
+            **pool_args
         )
     
-    return create_engine(url)
+    return create_engine(url, **pool_args)
+
+
+def get_engine_from_env(env_var_name: str):
+    """
+    Retorna o SQLAlchemy engine da URL definida na variável do arquivo .env.
+    
+    O engine (e seu pool de conexões) é criado uma única vez por processo e
+    reutilizado em todas as chamadas seguintes com a mesma variável.
+    """
+    engine = _engines.get(env_var_name)
+    if engine is not None:
+        return engine
+    
+    url = os.getenv(env_var_name)
+    if not url:
+        raise RuntimeError(f"Variável {env_var_name} não definida no arquivo .env")
+    
+    with _engines_lock:
+        if env_var_name not in _engines:
+            _engines[env_var_name] = _create_engine(url)
+        return _engines[env_var_name]
+
+
+def dispose_engine(env_var_name: str = None):
+    """
+    Descarta as conexões do pool (de uma variável ou de todas).
+    
+    O engine continua registrado; novas conexões são abertas sob demanda.
+    """
+    with _engines_lock:
+        nomes = [env_var_name] if env_var_name else list(_engines)
+        for nome in nomes:
+            engine = _engines.get(nome)
+            if engine is not None:
+                engine.dispose()
+
+
+def is_transient_error(exc: Exception) -> bool:
+    """Indica se o erro é transitório (queda de conexão, timeout, throttling do Azure SQL)."""
+    if isinstance(exc, DBAPIError) and exc.connection_invalidated:
+        return True
+    
+    mensagem = str(exc).lower()
+    if any(trecho in mensagem for trecho in TRANSIENT_ERROR_MESSAGES):
+        return True
+    
+    args = getattr(getattr(exc, "orig", None), "args", None) or ()
+    codigos = {str(a) for a in args if isinstance(a, (int, str))}
+    return any(codigo in codigos for codigo in TRANSIENT_ERROR_CODES)
+
+
+def run_with_retry(func, env_var_name: str = "DEST_DB_URL", retries: int = None, delay: float = None):
+    """
+    Executa func(engine) reconectando em caso de erro transitório.
+    
+    A cada falha transitória o pool é descartado (conexões quebradas não voltam
+    a ser usadas) e a espera dobra a cada tentativa. Erros não transitórios são
+    relançados imediatamente.
+    
+    Args:
+        func: Função que recebe o engine e executa o trabalho
+        env_var_name: Variável do .env com a URL do banco
+        retries: Número máximo de tentativas (padrão DB_MAX_RETRIES; 0 ou 1 = sem nova tentativa)
+        delay: Espera inicial entre tentativas em segundos (padrão DB_RETRY_DELAY_SECONDS)
+    
+    Returns:
+        O retorno de func(engine)
+    """
+    retries = max(1, DB_MAX_RETRIES if retries is None else retries)
+    delay = DB_RETRY_DELAY_SECONDS if delay is None else delay
+    
+    for attempt in range(1, retries + 1):
+        try:
+            return func(get_engine_from_env(env_var_name))
+        except Exception as e:
+            if attempt >= retries or not is_transient_error(e):
+                raise
+            espera = delay * (2 ** (attempt - 1))
+            print(f"\n⚠ Tentativa {attempt} falhou ({e.__class__.__name__}). Reconectando em {espera:.0f} segundos...")
+            dispose_engine(env_var_name)
+            time.sleep(espera)
+
+
+CONTROLE_INDEX_NAME = "IX_CONTROLE_MIGRACAO_LEGADO_Busca"
+CONTROLE_UNIQUE_INDEX_NAME = "UX_CONTROLE_MIGRACAO_LEGADO_Origem"
+CONTROLE_INDEX_KEY = "sCdTenant, sTabelaOrigem, sTabelaDestino, sValorChaveOrigem"
+
+# Índice único por tenant/origem/destino/chave é opcional: migrações antigas podem ter gerado duplicatas
+CONTROLE_UNIQUE_INDEX = os.getenv("CONTROLE_UNIQUE_INDEX", "0").lower() in ("1", "true", "sim")
+
+_controle_verificado = set()
+
+
+def _indice_existe(conn, nome: str) -> bool:
+    result = conn.execute(text("""
+SELECT 1 FROM sys.indexes
+WHERE name = :nome AND object_id = OBJECT_ID(N'dbo.CONTROLE_MIGRACAO_LEGADO')
+"""), {"nome": nome})
+    return result.first() is not None
+
+
+def ensure_controle_indexes(engine, unique: bool = None):
+    """
+    Cria (se faltar) e verifica os índices de busca da CONTROLE_MIGRACAO_LEGADO.
+
+    - Índice não clusterizado em (sCdTenant, sTabelaOrigem, sTabelaDestino, sValorChaveOrigem)
+      com INCLUDE (sValorChaveDestino): as buscas de mapeamento viram seek sem lookup
+    - Opcional: índice único na mesma chave, criado apenas se não houver duplicatas
+
+    Args:
+        engine: Engine do banco destino
+        unique: Criar também o índice único (padrão: variável CONTROLE_UNIQUE_INDEX)
+
+    Returns:
+        dict: {'busca': bool, 'unico': bool} indicando quais índices existem
+    """
+    unique = CONTROLE_UNIQUE_INDEX if unique is None else unique
+
+    with engine.begin() as conn:
+        if not _indice_existe(conn, CONTROLE_INDEX_NAME):
+            print(f"🔧 Criando índice {CONTROLE_INDEX_NAME} na tabela de controle...")
+            conn.execute(text(f"""
+CREATE NONCLUSTERED INDEX {CONTROLE_INDEX_NAME}
+ON dbo.CONTROLE_MIGRACAO_LEGADO ({CONTROLE_INDEX_KEY})
+INCLUDE (sValorChaveDestino)
+"""))
+
+        if unique and not _indice_existe(conn, CONTROLE_UNIQUE_INDEX_NAME):
+            duplicadas = conn.execute(text(f"""
+SELECT COUNT(*) FROM (
+    SELECT 1 AS x
+    FROM dbo.CONTROLE_MIGRACAO_LEGADO
+    GROUP BY {CONTROLE_INDEX_KEY}
+    HAVING COUNT(*) > 1
+) d
+""")).scalar()
+
+            if duplicadas:
+                print(f"⚠ Índice único não criado: {duplicadas:,} chaves de origem duplicadas na tabela de controle")
+            else:
+                print(f"🔧 Criando índice único {CONTROLE_UNIQUE_INDEX_NAME} na tabela de controle...")
+                conn.execute(text(f"""
+CREATE UNIQUE NONCLUSTERED INDEX {CONTROLE_UNIQUE_INDEX_NAME}
+ON dbo.CONTROLE_MIGRACAO_LEGADO ({CONTROLE_INDEX_KEY})
+"""))
+
+        status = {
+            "busca": _indice_existe(conn, CONTROLE_INDEX_NAME),
+            "unico": _indice_existe(conn, CONTROLE_UNIQUE_INDEX_NAME),
+        }
+
+    if not status["busca"]:
+        print(f"⚠ Índice {CONTROLE_INDEX_NAME} não encontrado: buscas na tabela de controle farão table scan")
+
+    return status
 
 
 def ensure_controle_table(engine, tenant_id: str):
-    """Cria a tabela CONTROLE_MIGRACAO_LEGADO no banco destino se não existir."""
+    """
+    Cria a tabela CONTROLE_MIGRACAO_LEGADO no banco destino se não existir,
+    junto com os índices de busca.
+
+    A verificação é feita uma única vez por engine no processo.
+    """
+    chave = str(engine.url)
+    if chave in _controle_verificado:
+        return
+
     create_sql = """
 IF OBJECT_ID(N'dbo.CONTROLE_MIGRACAO_LEGADO', N'U') IS NULL
 BEGIN
@@ -53,6 +260,9 @@ END
     with engine.begin() as conn:
         conn.execute(text(create_sql))
 
+    ensure_controle_indexes(engine)
+    _controle_verificado.add(chave)
+
 
 def insert_controle(dest_engine, tenant_id: str, origem_table: str, campo_chave_origem: str, 
                    valor_chave_origem: str, destino_table: str, campo_chave_destino: str, 
@@ -79,6 +289,88 @@ VALUES (:tenant, :torig, :corig, :vorig, :tdest, :cdest, :vdest)
     with dest_engine.begin() as conn:
         conn.execute(insert_sql, params)
 
+    mapping_cache.register(tenant_id, origem_table, destino_table, {valor_chave_origem: valor_chave_destino})
+
+
+def _linhas_por_insert(num_colunas: int) -> int:
+    """Quantas linhas cabem em um único INSERT ... VALUES (...), (...) sem estourar os limites do SQL Server."""
+    return max(1, min(MSSQL_MAX_ROWS_PER_VALUES, MSSQL_MAX_PARAMS // num_colunas))
+
+
+def _sql_insert_multi_valores(table: str, columns: list, num_linhas: int):
+    """Monta o INSERT com num_linhas tuplas em VALUES (parâmetros :c<coluna>_<linha>)."""
+    tuplas = ",\n".join(
+        "(" + ", ".join(f":c{j}_{i}" for j in range(len(columns))) + ")"
+        for i in range(num_linhas)
+    )
+    return text(f"INSERT INTO {table} ({', '.join(columns)})\nVALUES\n{tuplas}")
+
+
+def bulk_insert(conn, table: str, columns: list, rows: list, chunk_size: int = 1000,
+                fast_executemany: bool = True):
+    """
+    Insere vários registros usando o caminho mais rápido disponível para o driver.
+
+    - mssql+pyodbc: executemany com fast_executemany (ativado no engine)
+    - pymssql e demais: INSERT com várias tuplas em VALUES, respeitando o
+      limite de 2100 parâmetros e 1000 linhas por comando
+
+    O fast_executemany do pyodbc aloca cada parâmetro pelo tamanho máximo da
+    coluna (nvarchar(max) explode a memória) e alguns drivers não enxergam
+    tabelas temporárias nele ("Invalid object name"). Nesses casos (#tabelas
+    sempre, colunas (max) com fast_executemany=False) usa-se o INSERT com VALUES.
+
+    Args:
+        conn: Conexão já aberta (dentro de uma transação)
+        table: Tabela destino
+        columns: Colunas a inserir (chaves dos dicts em rows)
+        rows: Lista de dicts
+        chunk_size: Registros por executemany (pyodbc)
+        fast_executemany: False para tabelas com colunas nvarchar(max)/varbinary(max)
+
+    Returns:
+        int: Quantidade de registros enviados
+    """
+    if not rows:
+        return 0
+
+    tabela_temporaria = table.lstrip("[").startswith("#")
+    if conn.dialect.driver == "pyodbc" and fast_executemany and not tabela_temporaria:
+        insert_sql = text(f"""
+INSERT INTO {table} ({", ".join(columns)})
+VALUES ({", ".join(f":{c}" for c in columns)})
+""")
+        for i in range(0, len(rows), chunk_size):
+            conn.execute(insert_sql, rows[i:i + chunk_size])
+        return len(rows)
+
+    por_insert = _linhas_por_insert(len(columns))
+    sql_cheio = _sql_insert_multi_valores(table, columns, por_insert)
+
+    for i in range(0, len(rows), por_insert):
+        chunk = rows[i:i + por_insert]
+        params = {
+            f"c{j}_{k}": row[col]
+            for k, row in enumerate(chunk)
+            for j, col in enumerate(columns)
+        }
+        insert_sql = sql_cheio if len(chunk) == por_insert else _sql_insert_multi_valores(table, columns, len(chunk))
+        conn.execute(insert_sql, params)
+
+    return len(rows)
+
+
+def insert_controle_bulk(conn, registros: list, chunk_size: int = 1000):
+    """
+    Registra vários mapeamentos na tabela de controle usando a conexão/transação recebida.
+
+    Args:
+        conn: Conexão já aberta (dentro de uma transação)
+        registros: Lista de dicts com as colunas da CONTROLE_MIGRACAO_LEGADO
+        chunk_size: Quantidade de registros por executemany
+    """
+    bulk_insert(conn, "dbo.CONTROLE_MIGRACAO_LEGADO", CONTROLE_COLUMNS, registros, chunk_size=chunk_size)
+
 
 def get_tenant_id():
     """Retorna o tenant ID padrão do .env."""
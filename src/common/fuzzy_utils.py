@@ -1,6 +1,16 @@
 """
 Utilitários para fuzzy matching de domínios (raças, cores, etc)
+
+Quando um domínio é informado (ex: 'RACA', 'COR'), as decisões de matching ficam
+gravadas no cache local (common.local_cache) e são reaproveitadas entre execuções
+e tenants. A chave inclui um hash do conjunto de opções: se RACA/COR mudar, as
+decisões antigas deixam de valer automaticamente.
 """
+import json
+import hashlib
+
+from common.local_cache import LocalCache
+
 try:
     from rapidfuzz import fuzz, process
     FUZZY_LIB = "rapidfuzz"
@@ -14,7 +24,35 @@ except ImportError:
         FUZZY_LIB = None
 
 
-def fuzzy_match(query: str, choices: dict, min_score: int = 80):
+# Incrementar ao mudar a regra de matching (scorer, normalização, etc)
+FUZZY_CACHE_VERSION = 1
+FUZZY_SCORER = f"{FUZZY_LIB}.ratio"
+
+_fuzzy_cache = LocalCache("fuzzy_match", version=FUZZY_CACHE_VERSION)
+
+
+def hash_choices(choices: dict) -> str:
+    """Hash estável do conjunto de opções {descricao: codigo} (muda se o catálogo mudar)."""
+    conteudo = json.dumps(sorted((str(d), str(c)) for d, c in choices.items()))
+    return hashlib.sha1(conteudo.encode("utf-8")).hexdigest()
+
+
+def _chave_cache(dominio: str, query: str, choices_hash: str, min_score: int) -> str:
+    # A consulta entra sem normalização: fuzz.ratio diferencia maiúsculas e espaços
+    return json.dumps([dominio, query, choices_hash, FUZZY_SCORER, min_score], ensure_ascii=False)
+
+
+def _decisao_do_cache(valor, choices: dict):
+    """Converte a decisão gravada ([descricao, score] ou None) no formato de fuzzy_match."""
+    if valor is None:
+        return (None, None, 0)
+    descricao, score = valor
+    if descricao not in choices:
+        return None
+    return (choices[descricao], descricao, score)
+
+
+def fuzzy_match(query: str, choices: dict, min_score: int = 80, dominio: str = None):
     """
     Faz fuzzy matching de uma string contra um dicionário de opções.
     
@@ -22,6 +60,7 @@ def fuzzy_match(query: str, choices: dict, min_score: int = 80):
         query: String a ser pesquisada
         choices: Dict {descricao: codigo} com as opções disponíveis
         min_score: Score mínimo para considerar match (0-100)
+        dominio: Se informado (ex: 'RACA'), usa o cache persistente de decisões
     
     Returns:
         tuple: (codigo_matched, descricao_matched, score) ou (None, None, 0) se não encontrar
@@ -29,6 +68,15 @@ def fuzzy_match(query: str, choices: dict, min_score: int = 80):
     if not query or not choices:
         return (None, None, 0)
     
+    if dominio is None:
+        return _fuzzy_match_sem_cache(query, choices, min_score)
+    
+    return fuzzy_match_many([query], choices, min_score, dominio=dominio)[query]
+
+
+def _fuzzy_match_sem_cache(query: str, choices: dict, min_score: int):
+    """Executa o matching de fato (sem consultar o cache)."""
+    
     # Se não temos biblioteca de fuzzy matching, tentar match exato
     if FUZZY_LIB is None:
         query_upper = query.upper().strip()
@@ -53,85 +101,80 @@ def fuzzy_match(query: str, choices: dict, min_score: int = 80):
     return (None, None, 0)
 
 
-def buscar_raca_por_nome(dest_engine, nome_raca: str, especie: int, min_score: int = 80):
+def fuzzy_match_many(queries, choices: dict, min_score: int = 80, dominio: str = None,
+                     choices_hash: str = None):
     """
-    Busca raça pelo nome usando fuzzy matching.
+    Faz fuzzy matching de várias strings de uma vez contra o mesmo dicionário de opções.
+    
+    Com rapidfuzz + numpy calcula uma única matriz de scores (process.cdist) para
+    todas as consultas distintas; sem numpy, resolve cada consulta distinta uma vez.
+    O resultado é o mesmo de chamar fuzzy_match para cada consulta.
     
     Args:
-        dest_engine: Engine do banco destino
-        nome_raca: Nome da raça a buscar
-        especie: Código da espécie (1=CANINA, 2=FELINA)
-        min_score: Score mínimo para match (padrão 80)
+        queries: Iterável de strings a pesquisar (repetições são resolvidas uma vez)
+        choices: Dict {descricao: codigo} com as opções disponíveis
+        min_score: Score mínimo para considerar match (0-100)
+        dominio: Se informado (ex: 'RACA'), usa o cache persistente de decisões
+        choices_hash: Hash já calculado de choices (evita recalcular a cada chamada)
     
     Returns:
-        tuple: (nCdRaca, sNmRaca_matched, score) ou (None, None, 0)
+        dict: {query: (codigo_matched, descricao_matched, score)} com (None, None, 0) quando não encontrar
     """
-    from sqlalchemy import text
-    
-    if not nome_raca:
-        return (None, None, 0)
-    
-    # Buscar todas as raças da espécie
-    select_sql = text("""
-SELECT nCdRaca, sNmRaca
-FROM RACA
-WHERE nCdEspecie = :especie AND bFlAtivo = 1
-""")
-    
-    racas = {}
-    with dest_engine.connect() as conn:
-        result = conn.execute(select_sql, {"especie": especie})
-        rows = result.fetchall()
-        for row in rows:
-            racas[row[1]] = row[0]  # {sNmRaca: nCdRaca}
-    
-    if not racas:
-        return (None, None, 0)
-    
-    # Fazer fuzzy matching
-    codigo, descricao, score = fuzzy_match(nome_raca, racas, min_score)
-    
-    return (codigo, descricao, score)
+    distintas = list(dict.fromkeys(q for q in queries if q))
+    resultado = {q: (None, None, 0) for q in distintas}
+    
+    if not distintas or not choices:
+        return resultado
+    
+    if dominio is None:
+        _pontuar(distintas, choices, min_score, resultado)
+        return resultado
+    
+    # Reaproveitar decisões já gravadas e pontuar apenas as consultas novas
+    choices_hash = choices_hash or hash_choices(choices)
+    chaves = {q: _chave_cache(dominio, q, choices_hash, min_score) for q in distintas}
+    gravadas = _fuzzy_cache.get_many(chaves.values())
+    
+    pendentes = []
+    for query, chave in chaves.items():
+        decisao = _decisao_do_cache(gravadas[chave], choices) if chave in gravadas else None
+        if decisao is None:
+            pendentes.append(query)
+        else:
+            resultado[query] = decisao
+    
+    if pendentes:
+        _pontuar(pendentes, choices, min_score, resultado)
+        _fuzzy_cache.set_many({
+            chaves[q]: ([resultado[q][1], resultado[q][2]] if resultado[q][0] is not None else None)
+            for q in pendentes
+        })
+    
+    return resultado
 
 
-def buscar_cor_por_nome(dest_engine, nome_cor: str, min_score: int = 80):
-    """
-    Busca cor pelo nome usando fuzzy matching.
-    
-    Args:
-        dest_engine: Engine do banco destino
-        nome_cor: Nome da cor a buscar
-        min_score: Score mínimo para match (padrão 80)
-    
-    Returns:
-        tuple: (nCdCor, sNmCor_matched, score) ou (None, None, 0)
-    """
-    from sqlalchemy import text
-    
-    if not nome_cor:
-        return (None, None, 0)
-    
-    # Buscar todas as cores
-    select_sql = text("""
-SELECT nCdCor, sNmCor
-FROM COR
-WHERE bFlAtivo = 1
-""")
-    
-    cores = {}
-    with dest_engine.connect() as conn:
-        result = conn.execute(select_sql)
-        rows = result.fetchall()
-        for row in rows:
-            cores[row[1]] = row[0]  # {sNmCor: nCdCor}
-    
-    if not cores:
-        return (None, None, 0)
-    
-    # Fazer fuzzy matching
-    codigo, descricao, score = fuzzy_match(nome_cor, cores, min_score)
-    
-    return (codigo, descricao, score)
+def _pontuar(distintas: list, choices: dict, min_score: int, resultado: dict):
+    """Preenche resultado[query] para as consultas informadas (matriz cdist quando possível)."""
+    
+    if FUZZY_LIB == "rapidfuzz":
+        try:
+            import numpy
+        except ImportError:
+            pass
+        else:
+            descricoes = list(choices.keys())
+            scores = process.cdist(distintas, descricoes, scorer=fuzz.ratio,
+                                   score_cutoff=min_score, dtype=numpy.float64)
+            melhores = scores.argmax(axis=1)
+            for i, query in enumerate(distintas):
+                j = int(melhores[i])
+                score = float(scores[i, j])
+                if score >= min_score and score > 0:
+                    resultado[query] = (choices[descricoes[j]], descricoes[j], score)
+            return
+    
+    for query in distintas:
+        resultado[query] = _fuzzy_match_sem_cache(query, choices, min_score)
 
 
 def mapear_sexo(codigo_sexo_legado: int):
@@ -187,29 +230,3 @@ def mapear_porte(codigo_porte_legado: int):
     if porte in [1, 2, 3, 4]:
         return porte
     return 1  # Default PEQUENO se inválido
-
-
-def mapear_especie_por_raca(codigo_raca_legado: int, legacy_engine):
-    """
-    Descobre a espécie (CANINA ou FELINA) baseado na raça do legado.
-    
-    Args:
-        codigo_raca_legado: Código da raça no banco legado
-        legacy_engine: Engine do banco legado
-    
-    Returns:
-        int: 1 para CANINA, 2 para FELINA
-    """
-    from sqlalchemy import text
-    
-    select_sql = text("""
-SELECT Especie FROM PET_RACA WHERE Codigo = :codigo
-""")
-    
-    with legacy_engine.connect() as conn:
-        result = conn.execute(select_sql, {"codigo": codigo_raca_legado})
-        row = result.fetchone()
-        if row:
-            return int(row[0])
-    
-    return 1  # Default CANINA se não encontrar
@@ -0,0 +1,308 @@
+"""
+Migração incremental (delta) por watermark de Codigo e detecção de alterações.
+
+Para cada registro do legado gravado no destino guardamos, na tabela
+CONTROLE_MIGRACAO_FINGERPRINT, o SHA-256 (BINARY(32)) da linha de origem. O hash
+é calculado no legado sobre a lista explícita de colunas da tabela
+(sys.columns), cada uma convertida para texto, inclusive
+text/ntext/image, que o BINARY_CHECKSUM(*) ignorava. Em modo incremental a
+migração lê apenas:
+
+- registros com Codigo acima do watermark (maior Codigo com fingerprint)
+- registros com Codigo até o watermark cujo hash atual difere do gravado
+  (ou que ainda não têm fingerprint, ex: pulados por falta de dependência)
+
+A comparação usa só (Codigo, hash) do legado, sem trafegar as linhas inteiras.
+Sem fingerprints gravados (primeira execução incremental) tudo é lido e os
+fingerprints são semeados.
+
+O hash usa CONCAT/ISNULL com separador explícito (SQL Server 2012+), mas o
+HASHBYTES sobre mais de 8000 bytes exige SQL Server 2016 (versão 13) no legado;
+em versões anteriores o modo incremental falha com erro explícito.
+"""
+from datetime import datetime
+from sqlalchemy import text, bindparam
+
+from common.db_utils import bulk_insert
+from common.parallel_reader import LEGACY_READ_PARTITIONS, iterar_paginas_paralelas
+
+
+FINGERPRINT_TABLE = "CONTROLE_MIGRACAO_FINGERPRINT"
+FINGERPRINT_COLUMNS = ["sCdTenant", "sTabelaOrigem", "nCodigoOrigem", "bFingerprint", "dtAtualizacao"]
+
+# Conversão para texto por tipo de coluna (os demais tipos: CAST para nvarchar(max))
+_TIPOS_BINARIOS = {"binary", "varbinary", "image", "timestamp", "rowversion",
+                   "geography", "geometry", "hierarchyid"}
+_TIPOS_DATA = {"date", "time", "datetime", "datetime2", "smalldatetime", "datetimeoffset"}
+_TIPOS_FLUTUANTES = {"float", "real", "money", "smallmoney"}
+
+# HASHBYTES sem o limite de 8000 bytes de entrada
+VERSAO_MINIMA_LEGADO = 13
+
+_fingerprint_verificado = set()
+_fingerprint_sql = {}
+
+DELETE_FINGERPRINTS_SQL = text(f"""
+DELETE FROM dbo.{FINGERPRINT_TABLE}
+WHERE sCdTenant = :tenant
+  AND sTabelaOrigem = :origem
+  AND nCodigoOrigem IN :codigos
+""").bindparams(bindparam("codigos", expanding=True))
+
+
+def ensure_fingerprint_table(engine):
+    """Cria a tabela de fingerprints no banco destino se não existir (uma verificação por engine)."""
+    chave = str(engine.url)
+    if chave in _fingerprint_verificado:
+        return
+
+    create_sql = f"""
+IF OBJECT_ID(N'dbo.{FINGERPRINT_TABLE}', N'U') IS NULL
+BEGIN
+    CREATE TABLE dbo.{FINGERPRINT_TABLE} (
+        sCdTenant UNIQUEIDENTIFIER NOT NULL,
+        sTabelaOrigem NVARCHAR(200) NOT NULL,
+        nCodigoOrigem BIGINT NOT NULL,
+        bFingerprint BINARY(32) NOT NULL,
+        dtAtualizacao DATETIME NOT NULL DEFAULT(GETDATE()),
+        CONSTRAINT PK_{FINGERPRINT_TABLE} PRIMARY KEY (sCdTenant, sTabelaOrigem, nCodigoOrigem)
+    );
+END
+"""
+    with engine.begin() as conn:
+        conn.execute(text(create_sql))
+
+    _fingerprint_verificado.add(chave)
+
+
+def montar_fingerprint_sql(colunas: list) -> str:
+    """
+    Expressão SQL do fingerprint (SHA-256) de uma linha a partir da lista de colunas.
+
+    Cada coluna é convertida para texto (text/ntext por CAST, binários em
+    hexadecimal, datas no formato ISO 8601, float/money com todas as casas) e
+    NULL vira CHAR(0), para não ser confundido com texto vazio. Cada coluna é
+    seguida do separador CHAR(31) no CONCAT (CONCAT_WS exigiria SQL Server 2017).
+
+    Args:
+        colunas: [(nome, tipo)] na ordem da tabela (ex: sys.columns)
+
+    Returns:
+        str: Expressão com o alias bFingerprint
+    """
+    partes = []
+    for nome, tipo in colunas:
+        coluna = "[" + nome.replace("]", "]]") + "]"
+        tipo = tipo.lower()
+        if tipo in _TIPOS_BINARIOS:
+            valor = f"CONVERT(varchar(max), CAST({coluna} AS varbinary(max)), 2)"
+        elif tipo in _TIPOS_DATA:
+            valor = f"CONVERT(varchar(40), {coluna}, 126)"
+        elif tipo in _TIPOS_FLUTUANTES:
+            valor = f"CONVERT(varchar(40), {coluna}, 2)"
+        else:
+            valor = f"CAST({coluna} AS nvarchar(max))"
+        partes.append(f"ISNULL({valor}, CHAR(0)), CHAR(31)")
+
+    return f"HASHBYTES('SHA2_256', CONCAT({', '.join(partes)})) AS bFingerprint"
+
+
+def fingerprint_sql(legacy_engine, tabela_origem: str) -> str:
+    """Expressão do fingerprint com as colunas atuais da tabela do legado (uma consulta por engine e tabela)."""
+    chave = (str(legacy_engine.url), tabela_origem)
+    if chave not in _fingerprint_sql:
+        with legacy_engine.connect() as conn:
+            versao = conn.execute(text(
+                "SELECT CAST(SERVERPROPERTY('ProductMajorVersion') AS int)"
+            )).scalar()
+            if versao is None or int(versao) < VERSAO_MINIMA_LEGADO:
+                raise RuntimeError(
+                    f"Modo incremental exige SQL Server 2016 (versão {VERSAO_MINIMA_LEGADO}) ou "
+                    f"superior no legado (HASHBYTES sobre a linha); versão encontrada: {versao}"
+                )
+
+            # OBJECT_ID resolve o nome como as consultas da migração (schema padrão)
+            result = conn.execute(text("""
+SELECT name, TYPE_NAME(system_type_id) FROM sys.columns
+WHERE object_id = OBJECT_ID(:tabela)
+ORDER BY column_id
+"""), {"tabela": tabela_origem})
+            colunas = [(row[0], row[1]) for row in result]
+        if not colunas:
+            raise ValueError(f"Tabela {tabela_origem} não encontrada no legado")
+        _fingerprint_sql[chave] = montar_fingerprint_sql(colunas)
+    return _fingerprint_sql[chave]
+
+
+def carregar_fingerprints(engine, tenant_id: str, tabela_origem: str) -> dict:
+    """Retorna {Codigo: fingerprint} gravados para a tabela de origem."""
+    ensure_fingerprint_table(engine)
+    with engine.connect() as conn:
+        result = conn.execute(text(f"""
+SELECT nCodigoOrigem, bFingerprint FROM dbo.{FINGERPRINT_TABLE}
+WHERE sCdTenant = :tenant AND sTabelaOrigem = :origem
+"""), {"tenant": tenant_id, "origem": tabela_origem})
+        return {int(row[0]): bytes(row[1]) for row in result}
+
+
+def calcular_delta(legacy_engine, dest_engine, tenant_id: str, tabela_origem: str):
+    """
+    Calcula o que uma execução incremental precisa ler.
+
+    Args:
+        legacy_engine: Engine do banco legado
+        dest_engine: Engine do banco destino (fingerprints)
+        tenant_id: ID da tenant
+        tabela_origem: Tabela do legado (ex: 'PET_ANIMAL')
+
+    Returns:
+        tuple: (watermark, codigos_alterados) - ler Codigo > watermark e os
+               Codigos alterados (ordenados); watermark = -1 sem fingerprints
+    """
+    fingerprints = carregar_fingerprints(dest_engine, tenant_id, tabela_origem)
+    if not fingerprints:
+        return -1, []
+
+    watermark = max(fingerprints)
+    expressao = fingerprint_sql(legacy_engine, tabela_origem)
+    alterados = []
+    with legacy_engine.connect() as conn:
+        result = conn.execution_options(stream_results=True).execute(text(f"""
+SELECT Codigo, {expressao} FROM {tabela_origem}
+WHERE Codigo <= :watermark
+"""), {"watermark": watermark})
+        for codigo, fingerprint in result:
+            codigo = int(codigo)
+            if fingerprints.get(codigo) != bytes(fingerprint):
+                alterados.append(codigo)
+
+    alterados.sort()
+    return watermark, alterados
+
+
+def preparar_incremental(legacy_engine, dest_engine, tenant_id: str, tabela_origem: str):
+    """Calcula o delta (calcular_delta) e imprime o resumo para o operador."""
+    print(f"⚡ Modo incremental: comparando fingerprints de {tabela_origem}...", end=" ", flush=True)
+    watermark, alterados = calcular_delta(legacy_engine, dest_engine, tenant_id, tabela_origem)
+    if watermark < 0:
+        print("sem fingerprints (leitura completa)")
+    else:
+        print(f"watermark Codigo {watermark}, {len(alterados):,} alterados/pendentes")
+    return watermark, alterados
+
+
+def iterar_paginas(legacy_engine, tabela_origem: str, colunas: str, batch_size: int,
+                   ultimo_codigo: int = -1, codigos_alterados=None, com_fingerprint: bool = False,
+                   particoes: int = None):
+    """
+    Lê a origem em páginas ordenadas por Codigo.
+
+    Primeiro as páginas dos Codigos alterados (se houver) e depois as páginas
+    com Codigo > ultimo_codigo (keyset), cada uma em uma consulta curta. Com
+    mais de uma partição o keyset é lido em paralelo por faixas de Codigo
+    (common.parallel_reader), mantendo a ordem das páginas.
+
+    Args:
+        legacy_engine: Engine do banco legado
+        tabela_origem: Tabela do legado
+        colunas: Lista de colunas do SELECT (ex: '*' ou 'Codigo, Animal, Peso')
+        batch_size: Registros por página
+        ultimo_codigo: Início do keyset (exclusivo)
+        codigos_alterados: Codigos a reler antes do keyset
+        com_fingerprint: Inclui a coluna bFingerprint (SHA-256 da linha, fingerprint_sql)
+        particoes: Conexões de leitura simultâneas (padrão: LEGACY_READ_PARTITIONS)
+
+    Yields:
+        list: Linhas da página
+    """
+    if com_fingerprint:
+        colunas = f"{colunas}, {fingerprint_sql(legacy_engine, tabela_origem)}"
+
+    codigos_alterados = list(codigos_alterados or [])
+    if codigos_alterados:
+        select_codigos_sql = text(f"""
+SELECT {colunas} FROM {tabela_origem}
+WHERE Codigo IN :codigos
+ORDER BY Codigo
+""").bindparams(bindparam("codigos", expanding=True))
+
+        for i in range(0, len(codigos_alterados), min(batch_size, 1000)):
+            with legacy_engine.connect() as conn:
+                rows = conn.execute(select_codigos_sql, {
+                    "codigos": codigos_alterados[i:i + min(batch_size, 1000)]
+                }).fetchall()
+            if rows:
+                yield rows
+
+    if (particoes or LEGACY_READ_PARTITIONS) > 1:
+        yield from iterar_paginas_paralelas(
+            legacy_engine, tabela_origem, colunas, batch_size, ultimo_codigo, particoes=particoes
+        )
+        return
+
+    select_pagina_sql = text(f"""
+SELECT TOP (:limite) {colunas} FROM {tabela_origem}
+WHERE Codigo > :ultimo_codigo
+ORDER BY Codigo
+""")
+
+    while True:
+        with legacy_engine.connect() as conn:
+            rows = conn.execute(select_pagina_sql, {
+                "limite": batch_size,
+                "ultimo_codigo": ultimo_codigo
+            }).fetchall()
+
+        if not rows:
+            break
+
+        yield rows
+        ultimo_codigo = int(rows[-1]._mapping["Codigo"])
+
+
+def salvar_fingerprints(conn, tenant_id: str, tabela_origem: str, fingerprints: dict, chunk_size: int = 1000):
+    """
+    Grava (substitui) os fingerprints na transação do lote.
+
+    Args:
+        conn: Conexão dentro da transação do lote
+        tenant_id: ID da tenant
+        tabela_origem: Tabela do legado
+        fingerprints: {Codigo: bFingerprint} dos registros gravados no lote
+    """
+    if not fingerprints:
+        return
+
+    codigos = [int(c) for c in fingerprints]
+    for i in range(0, len(codigos), 1000):
+        conn.execute(DELETE_FINGERPRINTS_SQL, {
+            "tenant": tenant_id,
+            "origem": tabela_origem,
+            "codigos": codigos[i:i + 1000]
+        })
+
+    agora = datetime.now()
+    bulk_insert(conn, FINGERPRINT_TABLE, FINGERPRINT_COLUMNS, [
+        {
+            "sCdTenant": tenant_id,
+            "sTabelaOrigem": tabela_origem,
+            "nCodigoOrigem": int(codigo),
+            "bFingerprint": bytes(fingerprint),
+            "dtAtualizacao": agora,
+        }
+        for codigo, fingerprint in fingerprints.items()
+    ], chunk_size=chunk_size)
+
+
+def limpar_fingerprints(engine, tenant_id: str, tabela_origem: str = None):
+    """Remove os fingerprints da tenant (todos ou de uma tabela de origem)."""
+    ensure_fingerprint_table(engine)
+    with engine.begin() as conn:
+        if tabela_origem is None:
+            conn.execute(text(f"DELETE FROM dbo.{FINGERPRINT_TABLE} WHERE sCdTenant = :tenant"),
+                         {"tenant": tenant_id})
+        else:
+            conn.execute(text(f"""
+DELETE FROM dbo.{FINGERPRINT_TABLE}
+WHERE sCdTenant = :tenant AND sTabelaOrigem = :origem
+"""), {"tenant": tenant_id, "origem": tabela_origem})
@@ -0,0 +1,141 @@
+"""
+Cache local persistente (SQLite) para decisões caras que se repetem entre execuções.
+
+Cada namespace (ex: 'fuzzy_match', 'viacep') tem uma versão: ao mudar a versão
+no código, as entradas antigas deixam de ser usadas. Entradas podem ter TTL.
+"""
+import os
+import json
+import time
+import sqlite3
+import threading
+from pathlib import Path
+
+
+CACHE_DIR = Path(os.getenv("LOCAL_CACHE_DIR", Path(__file__).parent.parent.parent / ".cache"))
+CACHE_ENABLED = os.getenv("LOCAL_CACHE_ENABLED", "1").lower() not in ("0", "false", "nao", "não")
+CACHE_FILE = "migracao_cache.sqlite"
+
+# Limite de variáveis por comando do SQLite
+_SQLITE_MAX_VARS = 900
+
+_conexoes = {}
+_conexoes_lock = threading.Lock()
+
+
+def _conectar(path: Path):
+    """Abre (uma vez por arquivo) a conexão compartilhada com o banco SQLite."""
+    chave = str(path)
+    with _conexoes_lock:
+        if chave not in _conexoes:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(chave, check_same_thread=False, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS cache (
+                    namespace TEXT NOT NULL,
+                    chave TEXT NOT NULL,
+                    versao INTEGER NOT NULL,
+                    valor TEXT NOT NULL,
+                    expira_em REAL,
+                    PRIMARY KEY (namespace, chave)
+                )
+            """)
+            conn.commit()
+            _conexoes[chave] = (conn, threading.Lock())
+        return _conexoes[chave]
+
+
+class LocalCache:
+    """
+    Armazenamento chave/valor (valores JSON) de um namespace no cache local.
+
+    Com LOCAL_CACHE_ENABLED=0 todas as leituras são miss e as gravações são ignoradas.
+    """
+
+    def __init__(self, namespace: str, version: int = 1, ttl: float = None, path=None):
+        """
+        Args:
+            namespace: Nome do grupo de entradas (ex: 'fuzzy_match')
+            version: Versão do formato/regra; entradas de outra versão são ignoradas
+            ttl: Validade padrão das entradas em segundos (None = sem expiração)
+            path: Arquivo SQLite (padrão: LOCAL_CACHE_DIR/migracao_cache.sqlite)
+        """
+        self.namespace = namespace
+        self.version = version
+        self.ttl = ttl
+        self.path = Path(path) if path else CACHE_DIR / CACHE_FILE
+        self.enabled = CACHE_ENABLED
+
+    def _db(self):
+        return _conectar(self.path)
+
+    def get(self, chave: str, default=None):
+        """Retorna o valor da chave (ou default se ausente, expirado ou de outra versão)."""
+        return self.get_many([chave]).get(chave, default)
+
+    def get_many(self, chaves) -> dict:
+        """Retorna {chave: valor} apenas para as chaves encontradas e válidas."""
+        chaves = list(dict.fromkeys(chaves))
+        if not self.enabled or not chaves:
+            return {}
+
+        conn, lock = self._db()
+        agora = time.time()
+        encontrados = {}
+
+        with lock:
+            for i in range(0, len(chaves), _SQLITE_MAX_VARS):
+                lote = chaves[i:i + _SQLITE_MAX_VARS]
+                placeholders = ",".join("?" * len(lote))
+                cursor = conn.execute(f"""
+                    SELECT chave, valor FROM cache
+                    WHERE namespace = ? AND versao = ?
+                      AND (expira_em IS NULL OR expira_em > ?)
+                      AND chave IN ({placeholders})
+                """, [self.namespace, self.version, agora, *lote])
+                for chave, valor in cursor:
+                    encontrados[chave] = json.loads(valor)
+
+        return encontrados
+
+    def set(self, chave: str, valor, ttl: float = None):
+        """Grava (ou substitui) uma entrada."""
+        self.set_many({chave: valor}, ttl=ttl)
+
+    def set_many(self, itens: dict, ttl: float = None):
+        """
+        Grava várias entradas em uma transação.
+
+        Args:
+            itens: {chave: valor serializável em JSON}
+            ttl: Validade em segundos (padrão: ttl do cache; None = sem expiração,
+                 <= 0 = não grava)
+        """
+        ttl = self.ttl if ttl is None else ttl
+        if not self.enabled or not itens or (ttl is not None and ttl <= 0):
+            return
+
+        expira_em = None if ttl is None else time.time() + ttl
+        linhas = [
+            (self.namespace, chave, self.version, json.dumps(valor, default=str), expira_em)
+            for chave, valor in itens.items()
+        ]
+
+        conn, lock = self._db()
+        with lock:
+            conn.executemany("""
+                INSERT OR REPLACE INTO cache (namespace, chave, versao, valor, expira_em)
+                VALUES (?, ?, ?, ?, ?)
+            """, linhas)
+            conn.commit()
+
+    def clear(self):
+        """Remove todas as entradas do namespace."""
+        if not self.enabled:
+            return
+
+        conn, lock = self._db()
+        with lock:
+            conn.execute("DELETE FROM cache WHERE namespace = ?", [self.namespace])
+            conn.commit()
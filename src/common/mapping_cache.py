@@ -0,0 +1,137 @@
+"""
+Cache em memória dos mapeamentos da tabela CONTROLE_MIGRACAO_LEGADO.
+
+Cada par (tenant, tabela origem, tabela destino) é carregado do banco uma única
+vez por processo. As gravações feitas depois pelo próprio processo atualizam o
+cache incrementalmente, então migrações encadeadas (ex: pelo menu do main.py)
+não repetem a leitura completa da tabela de controle.
+"""
+import threading
+from sqlalchemy import text
+
+
+SELECT_MAPEAMENTOS_SQL = text("""
+    SELECT sValorChaveOrigem, sValorChaveDestino
+    FROM CONTROLE_MIGRACAO_LEGADO
+    WHERE sCdTenant = :tenant
+      AND sTabelaOrigem = :origem
+      AND sTabelaDestino = :destino
+""")
+
+
+def _chave_origem(valor):
+    """Chaves de origem do legado são inteiros (gravadas como texto na tabela de controle)."""
+    try:
+        return int(valor)
+    except (TypeError, ValueError):
+        return valor
+
+
+class MappingCache:
+    """
+    Mapeamentos {chave origem (int): chave destino (str)} por (tenant, origem, destino).
+
+    Thread-safe: a carga de um par acontece uma única vez mesmo com chamadas concorrentes.
+    """
+
+    def __init__(self):
+        self._mapas = {}
+        self._lock = threading.RLock()
+
+    def _mapa(self, engine, tenant_id: str, origem: str, destino: str) -> dict:
+        chave = (str(tenant_id).lower(), origem, destino)
+        mapa = self._mapas.get(chave)
+        if mapa is not None:
+            return mapa
+
+        with self._lock:
+            if chave not in self._mapas:
+                mapa = {}
+                with engine.connect() as conn:
+                    result = conn.execute(SELECT_MAPEAMENTOS_SQL, {
+                        "tenant": tenant_id,
+                        "origem": origem,
+                        "destino": destino,
+                    })
+                    for row in result:
+                        mapa[_chave_origem(row[0])] = str(row[1])
+                self._mapas[chave] = mapa
+            return self._mapas[chave]
+
+    def load(self, engine, tenant_id: str, origem: str, destino: str) -> dict:
+        """
+        Retorna uma cópia do mapeamento completo do par origem/destino.
+
+        Args:
+            engine: Engine do banco destino (usado apenas na primeira carga)
+            tenant_id: ID da tenant
+            origem: Tabela de origem (ex: 'PET_ANIMAL')
+            destino: Tabela de destino (ex: 'PET')
+
+        Returns:
+            dict: {chave origem: chave destino}
+        """
+        mapa = self._mapa(engine, tenant_id, origem, destino)
+        with self._lock:
+            return dict(mapa)
+
+    def get(self, engine, tenant_id: str, origem: str, destino: str, chave, default=None):
+        """Retorna a chave destino de um único registro de origem."""
+        return self._mapa(engine, tenant_id, origem, destino).get(_chave_origem(chave), default)
+
+    def get_many(self, engine, tenant_id: str, origem: str, destino: str, chaves) -> dict:
+        """
+        Retorna {chave origem: chave destino} apenas para as chaves já migradas.
+
+        Args:
+            chaves: Iterável de chaves de origem (int ou str)
+        """
+        mapa = self._mapa(engine, tenant_id, origem, destino)
+        encontrados = {}
+        for chave in chaves:
+            chave = _chave_origem(chave)
+            valor = mapa.get(chave)
+            if valor is not None:
+                encontrados[chave] = valor
+        return encontrados
+
+    def register(self, tenant_id: str, origem: str, destino: str, mapeamentos: dict):
+        """
+        Atualiza incrementalmente um par já carregado após gravar na tabela de controle.
+
+        Pares ainda não carregados são ignorados: a primeira carga lerá o banco.
+        """
+        chave = (str(tenant_id).lower(), origem, destino)
+        with self._lock:
+            mapa = self._mapas.get(chave)
+            if mapa is None:
+                return
+            for origem_valor, destino_valor in mapeamentos.items():
+                mapa[_chave_origem(origem_valor)] = str(destino_valor)
+
+    def register_controle(self, registros: list):
+        """Atualiza o cache a partir de registros no formato da CONTROLE_MIGRACAO_LEGADO (dicts)."""
+        agrupados = {}
+        for r in registros:
+            par = (r['sCdTenant'], r['sTabelaOrigem'], r['sTabelaDestino'])
+            agrupados.setdefault(par, {})[r['sValorChaveOrigem']] = r['sValorChaveDestino']
+
+        for (tenant_id, origem, destino), mapeamentos in agrupados.items():
+            self.register(tenant_id, origem, destino, mapeamentos)
+
+    def invalidate(self, tenant_id: str = None, origem: str = None, destino: str = None):
+        """Descarta os pares carregados (todos ou apenas os que batem com os filtros)."""
+        with self._lock:
+            for chave in list(self._mapas):
+                tenant_chave, origem_chave, destino_chave = chave
+                if tenant_id is not None and tenant_chave != str(tenant_id).lower():
+                    continue
+                if origem is not None and origem_chave != origem:
+                    continue
+                if destino is not None and destino_chave != destino:
+                    continue
+                del self._mapas[chave]
+
+
+# Instância compartilhada pelo processo
+mapping_cache = MappingCache()
@@ -0,0 +1,192 @@
+"""
+Execução de etapas de migração como um grafo de dependências (DAG).
+
+Cada etapa começa assim que todas as suas dependências terminam com sucesso,
+então ramos independentes rodam em paralelo (ex: vacinas junto com clientes).
+Se uma etapa falhar, as que dependem dela são puladas e as demais continuam.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+
+STATUS_SUCESSO = "sucesso"
+STATUS_ERRO = "erro"
+STATUS_PULADA = "pulada"
+
+
+class Etapa:
+    """
+    Etapa do grafo.
+
+    Args:
+        nome: Identificador único da etapa
+        funcao: Função sem argumentos executada pela etapa
+        depende_de: Nomes das etapas que precisam terminar antes
+    """
+
+    def __init__(self, nome: str, funcao, depende_de: list = None):
+        self.nome = nome
+        self.funcao = funcao
+        self.depende_de = list(depende_de or [])
+
+
+def validar_dag(etapas: list):
+    """Valida nomes únicos, dependências existentes e ausência de ciclos (ValueError)."""
+    por_nome = {}
+    for etapa in etapas:
+        if etapa.nome in por_nome:
+            raise ValueError(f"Etapa duplicada: {etapa.nome}")
+        por_nome[etapa.nome] = etapa
+
+    for etapa in etapas:
+        for dep in etapa.depende_de:
+            if dep not in por_nome:
+                raise ValueError(f"Etapa '{etapa.nome}' depende de '{dep}', que não existe")
+
+    # Ordenação topológica (Kahn): sobra etapa = existe ciclo
+    pendentes = {e.nome: len(e.depende_de) for e in etapas}
+    prontas = [nome for nome, n in pendentes.items() if n == 0]
+    visitadas = 0
+    while prontas:
+        nome = prontas.pop()
+        visitadas += 1
+        for etapa in etapas:
+            if nome in etapa.depende_de:
+                pendentes[etapa.nome] -= 1
+                if pendentes[etapa.nome] == 0:
+                    prontas.append(etapa.nome)
+
+    if visitadas != len(etapas):
+        raise ValueError("As dependências entre etapas formam um ciclo")
+
+
+def _executar_etapa(etapa: Etapa):
+    inicio = time.monotonic()
+    try:
+        resultado = etapa.funcao()
+        return STATUS_SUCESSO, resultado, None, inicio, time.monotonic()
+    except Exception as e:
+        return STATUS_ERRO, None, e, inicio, time.monotonic()
+
+
+def executar_dag(etapas: list, max_workers: int = None) -> dict:
+    """
+    Executa as etapas respeitando as dependências, em paralelo quando possível.
+
+    Args:
+        etapas: Lista de Etapa
+        max_workers: Etapas simultâneas (padrão: número de etapas)
+
+    Returns:
+        dict: {nome: {'status', 'resultado', 'erro', 'inicio', 'fim', 'duracao'}}
+              com inicio/fim em segundos relativos ao começo da execução
+    """
+    validar_dag(etapas)
+    por_nome = {e.nome: e for e in etapas}
+    resultados = {}
+    t0 = time.monotonic()
+
+    def prontas():
+        return [
+            e for e in etapas
+            if e.nome not in resultados and e.nome not in em_execucao.values()
+            and all(resultados.get(d, {}).get("status") == STATUS_SUCESSO for d in e.depende_de)
+        ]
+
+    def pular_dependentes():
+        # Etapas com alguma dependência que falhou (ou foi pulada) não rodam
+        alterou = True
+        while alterou:
+            alterou = False
+            for e in etapas:
+                if e.nome in resultados:
+                    continue
+                falhas = [d for d in e.depende_de
+                          if resultados.get(d, {}).get("status") in (STATUS_ERRO, STATUS_PULADA)]
+                if falhas:
+                    resultados[e.nome] = {
+                        "status": STATUS_PULADA, "resultado": None,
+                        "erro": f"dependência não concluída: {', '.join(falhas)}",
+                        "inicio": None, "fim": None, "duracao": 0.0,
+                    }
+                    print(f"⏭  Etapa '{e.nome}' pulada ({resultados[e.nome]['erro']})")
+                    alterou = True
+
+    em_execucao = {}
+    with ThreadPoolExecutor(max_workers=max_workers or len(etapas) or 1) as executor:
+        while len(resultados) < len(etapas):
+            for etapa in prontas():
+                print(f"▶  Iniciando etapa '{etapa.nome}'")
+                em_execucao[executor.submit(_executar_etapa, etapa)] = etapa.nome
+
+            if not em_execucao:
+                break
+
+            concluidos, _ = wait(list(em_execucao), return_when=FIRST_COMPLETED)
+            for futuro in concluidos:
+                nome = em_execucao.pop(futuro)
+                status, resultado, erro, inicio, fim = futuro.result()
+                resultados[nome] = {
+                    "status": status, "resultado": resultado, "erro": erro,
+                    "inicio": inicio - t0, "fim": fim - t0, "duracao": fim - inicio,
+                }
+                if status == STATUS_SUCESSO:
+                    print(f"✓  Etapa '{nome}' concluída em {fim - inicio:.1f}s")
+                else:
+                    print(f"✗  Etapa '{nome}' falhou após {fim - inicio:.1f}s: {erro}")
+
+            pular_dependentes()
+
+    # Garante uma entrada para toda etapa (ex: etapas que nunca ficaram prontas)
+    for nome in por_nome:
+        resultados.setdefault(nome, {
+            "status": STATUS_PULADA, "resultado": None, "erro": "não executada",
+            "inicio": None, "fim": None, "duracao": 0.0,
+        })
+
+    return resultados
+
+
+def caminho_critico(etapas: list, resultados: dict) -> tuple:
+    """
+    Maior cadeia de dependências somando as durações medidas.
+
+    Returns:
+        tuple: (lista de nomes da cadeia, duração total em segundos)
+    """
+    por_nome = {e.nome: e for e in etapas}
+    memo = {}
+
+    def mais_longo(nome):
+        if nome not in memo:
+            melhor = ([], 0.0)
+            for dep in por_nome[nome].depende_de:
+                candidato = mais_longo(dep)
+                if candidato[1] > melhor[1]:
+                    melhor = candidato
+            memo[nome] = (melhor[0] + [nome], melhor[1] + resultados[nome]["duracao"])
+        return memo[nome]
+
+    return max((mais_longo(e.nome) for e in etapas), key=lambda c: c[1], default=([], 0.0))
+
+
+def imprimir_relatorio(etapas: list, resultados: dict, tempo_total: float):
+    """Imprime o tempo de cada etapa, a soma sequencial e o caminho crítico."""
+    print("\n" + "=" * 60)
+    print("RESUMO DA EXECUÇÃO")
+    print("=" * 60)
+    print(f"{'Etapa':<22}{'Status':<10}{'Início':>9}{'Fim':>9}{'Duração':>10}")
+    for etapa in sorted(etapas, key=lambda e: (resultados[e.nome]["inicio"] is None,
+                                               resultados[e.nome]["inicio"] or 0)):
+        r = resultados[etapa.nome]
+        inicio = f"{r['inicio']:.1f}s" if r["inicio"] is not None else "-"
+        fim = f"{r['fim']:.1f}s" if r["fim"] is not None else "-"
+        print(f"{etapa.nome:<22}{r['status']:<10}{inicio:>9}{fim:>9}{r['duracao']:>9.1f}s")
+
+    soma = sum(r["duracao"] for r in resultados.values())
+    cadeia, duracao_cadeia = caminho_critico(etapas, resultados)
+    print("-" * 60)
+    print(f"Tempo total (parede): {tempo_total:.1f}s")
+    print(f"Soma das etapas (sequencial): {soma:.1f}s")
+    print(f"Caminho crítico: {' -> '.join(cadeia)} ({duracao_cadeia:.1f}s)")
+    print("=" * 60)
@@ -0,0 +1,176 @@
+"""
+Leitura paralela do legado particionada por faixas de Codigo.
+
+A tabela é dividida em faixas de Codigo (por MIN/MAX ou por NTILE, quando a
+distribuição dos códigos é irregular) e cada faixa é lida em páginas (keyset)
+por uma thread com a própria conexão do pool. As páginas de cada faixa vão
+para uma fila limitada e são entregues ao consumidor em ordem de Codigo:
+enquanto a migração mapeia e grava uma página, as próximas já estão sendo
+buscadas na rede, e a memória fica limitada a particoes x max_fila páginas.
+
+A ordem de entrega é a mesma da leitura sequencial, então checkpoints por
+high-water mark continuam válidos.
+"""
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import text
+
+
+LEGACY_READ_PARTITIONS = int(os.getenv("LEGACY_READ_PARTITIONS", "1"))
+LEGACY_READ_QUEUE_PAGES = int(os.getenv("LEGACY_READ_QUEUE_PAGES", "2"))
+
+_FIM = object()
+
+
+class _ErroLeitura:
+    def __init__(self, erro):
+        self.erro = erro
+
+
+def calcular_faixas(legacy_engine, tabela_origem: str, particoes: int,
+                    ultimo_codigo: int = -1, equilibrar: bool = False) -> list:
+    """
+    Divide os Codigos acima de ultimo_codigo em faixas contíguas.
+
+    Args:
+        legacy_engine: Engine do banco legado
+        tabela_origem: Tabela do legado
+        particoes: Quantidade de faixas
+        ultimo_codigo: Início (exclusivo) da leitura
+        equilibrar: Usa NTILE (faixas com a mesma quantidade de registros)
+                    em vez de dividir o intervalo MIN/MAX em partes iguais
+
+    Returns:
+        list: [(inicio, fim)] inclusivas e ordenadas; vazia se não houver registros
+    """
+    particoes = max(1, int(particoes))
+
+    with legacy_engine.connect() as conn:
+        if equilibrar:
+            result = conn.execute(text(f"""
+SELECT MIN(Codigo), MAX(Codigo) FROM (
+    SELECT Codigo, NTILE(:particoes) OVER (ORDER BY Codigo) AS nFaixa
+    FROM {tabela_origem}
+    WHERE Codigo > :ultimo_codigo
+) faixas
+GROUP BY nFaixa
+ORDER BY nFaixa
+"""), {"particoes": particoes, "ultimo_codigo": ultimo_codigo})
+            return [(int(row[0]), int(row[1])) for row in result]
+
+        minimo, maximo = conn.execute(text(f"""
+SELECT MIN(Codigo), MAX(Codigo) FROM {tabela_origem}
+WHERE Codigo > :ultimo_codigo
+"""), {"ultimo_codigo": ultimo_codigo}).fetchone()
+
+    if minimo is None:
+        return []
+
+    minimo, maximo = int(minimo), int(maximo)
+    tamanho = max(1, -(-(maximo - minimo + 1) // particoes))
+    return [
+        (inicio, min(inicio + tamanho - 1, maximo))
+        for inicio in range(minimo, maximo + 1, tamanho)
+    ]
+
+
+def _colocar(fila, item, parar):
+    # put com timeout para a thread perceber o cancelamento do consumidor
+    while not parar.is_set():
+        try:
+            fila.put(item, timeout=0.5)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _ler_faixa(legacy_engine, select_sql, batch_size, inicio, fim, fila, parar):
+    try:
+        ultimo_codigo = inicio - 1
+        while not parar.is_set():
+            params = {"limite": batch_size, "ultimo_codigo": ultimo_codigo}
+            if fim is not None:
+                params["fim"] = fim
+            with legacy_engine.connect() as conn:
+                rows = conn.execute(select_sql, params).fetchall()
+
+            if not rows:
+                break
+            if not _colocar(fila, rows, parar):
+                return
+            ultimo_codigo = int(rows[-1]._mapping["Codigo"])
+    except Exception as e:
+        _colocar(fila, _ErroLeitura(e), parar)
+        return
+
+    _colocar(fila, _FIM, parar)
+
+
+def iterar_paginas_paralelas(legacy_engine, tabela_origem: str, colunas: str, batch_size: int,
+                             ultimo_codigo: int = -1, particoes: int = None,
+                             max_fila: int = None, equilibrar: bool = False):
+    """
+    Lê as páginas com Codigo > ultimo_codigo em paralelo, entregando-as em ordem.
+
+    A última faixa não tem limite superior, então registros inseridos durante
+    a leitura também são lidos (como na leitura sequencial).
+
+    Args:
+        legacy_engine: Engine do banco legado
+        tabela_origem: Tabela do legado
+        colunas: Lista de colunas do SELECT (deve incluir Codigo)
+        batch_size: Registros por página
+        ultimo_codigo: Início do keyset (exclusivo)
+        particoes: Faixas lidas ao mesmo tempo (padrão: LEGACY_READ_PARTITIONS)
+        max_fila: Páginas buscadas à frente por faixa (padrão: LEGACY_READ_QUEUE_PAGES)
+        equilibrar: Faixas por NTILE em vez de MIN/MAX (ver calcular_faixas)
+
+    Yields:
+        list: Linhas da página, em ordem crescente de Codigo
+    """
+    particoes = particoes or LEGACY_READ_PARTITIONS
+    max_fila = max_fila or LEGACY_READ_QUEUE_PAGES
+
+    # Faixas encadeadas (sem buracos entre elas) e a última aberta
+    fins = [fim for _, fim in calcular_faixas(legacy_engine, tabela_origem, particoes,
+                                              ultimo_codigo, equilibrar)][:-1] + [None]
+    inicios = [ultimo_codigo + 1] + [fim + 1 for fim in fins[:-1]]
+    faixas = list(zip(inicios, fins))
+
+    select_faixa_sql = text(f"""
+SELECT TOP (:limite) {colunas} FROM {tabela_origem}
+WHERE Codigo > :ultimo_codigo AND Codigo <= :fim
+ORDER BY Codigo
+""")
+    select_ultima_sql = text(f"""
+SELECT TOP (:limite) {colunas} FROM {tabela_origem}
+WHERE Codigo > :ultimo_codigo
+ORDER BY Codigo
+""")
+
+    parar = threading.Event()
+    filas = [queue.Queue(maxsize=max(1, max_fila)) for _ in faixas]
+    executor = ThreadPoolExecutor(max_workers=len(faixas))
+    try:
+        for (inicio, fim), fila in zip(faixas, filas):
+            executor.submit(
+                _ler_faixa, legacy_engine,
+                select_ultima_sql if fim is None else select_faixa_sql,
+                batch_size, inicio, fim, fila, parar
+            )
+
+        # Consome as faixas em ordem; as seguintes continuam sendo pré-carregadas
+        for fila in filas:
+            while True:
+                item = fila.get()
+                if item is _FIM:
+                    break
+                if isinstance(item, _ErroLeitura):
+                    raise item.erro
+                yield item
+    finally:
+        parar.set()
+        executor.shutdown(wait=True)
@@ -0,0 +1,270 @@
+"""
+Identidade por entry dos prontuários migrados.
+
+O controle de PET_ANIMAL_PRONTUARIO guarda um registro por Codigo de origem
+(sValorChaveDestino = 'MULTIPLE'), sem dizer quais entries do Tag já foram
+gravadas. A tabela CONTROLE_MIGRACAO_PRONTUARIO_ENTRY guarda, por Codigo, o
+SHA-1 (20 bytes) de cada entry migrada: (Codigo, data, responsável, conteúdo).
+Quando o Tag de um prontuário já migrado ganha entries novas, só as que não
+têm identidade gravada são inseridas.
+
+Prontuários migrados antes desta tabela não têm identidades: na primeira
+releitura cada entry é procurada nas linhas já gravadas no destino (PRONTUARIO
+e RECEITA_MEDICA do pet, por data de registro e conteúdo, inclusive como o
+parser anterior o gravava, cortado no primeiro '['); as encontradas são
+registradas como já migradas (backfill) e só as demais são inseridas.
+
+A tabela CONTROLE_MIGRACAO_PRONTUARIO_TAG guarda o SHA-256 do Tag processado
+por Codigo (inclusive de Tags sem nenhuma entry), para o modo incremental reler
+só os prontuários cujo Tag mudou.
+"""
+import hashlib
+from collections import Counter
+from datetime import datetime
+from sqlalchemy import text, bindparam
+
+from common.db_utils import bulk_insert
+
+
+ENTRY_TABLE = "CONTROLE_MIGRACAO_PRONTUARIO_ENTRY"
+ENTRY_COLUMNS = ["sCdTenant", "nCodigoOrigem", "bHashEntry", "dtMigracao"]
+
+TAG_TABLE = "CONTROLE_MIGRACAO_PRONTUARIO_TAG"
+TAG_COLUMNS = ["sCdTenant", "nCodigoOrigem", "bHashTag", "dtAtualizacao"]
+
+# Hash do Tag calculado na origem (o texto não trafega para a comparação)
+HASH_TAG_SQL = "HASHBYTES('SHA2_256', CAST(Tag AS nvarchar(max))) AS bHashTag"
+
+_entry_verificado = set()
+
+SELECT_ENTRIES_SQL = text(f"""
+SELECT nCodigoOrigem, bHashEntry FROM dbo.{ENTRY_TABLE}
+WHERE sCdTenant = :tenant
+  AND nCodigoOrigem IN :codigos
+""").bindparams(bindparam("codigos", expanding=True))
+
+DELETE_TAGS_SQL = text(f"""
+DELETE FROM dbo.{TAG_TABLE}
+WHERE sCdTenant = :tenant
+  AND nCodigoOrigem IN :codigos
+""").bindparams(bindparam("codigos", expanding=True))
+
+SELECT_DESTINO_SQL = text("""
+SELECT sCdPet, tDtRegistro, sDsProntuario AS sConteudo FROM PRONTUARIO
+WHERE sCdTenant = :tenant AND sCdPet IN :pets
+UNION ALL
+SELECT sCdPet, tDtRegistro, sDsReceitaMedica AS sConteudo FROM RECEITA_MEDICA
+WHERE sCdTenant = :tenant AND sCdPet IN :pets
+""").bindparams(bindparam("pets", expanding=True))
+
+
+def ensure_entry_table(engine):
+    """Cria as tabelas de identidades e de hashes do Tag no banco destino se não existirem (uma verificação por engine)."""
+    chave = str(engine.url)
+    if chave in _entry_verificado:
+        return
+
+    create_sql = f"""
+IF OBJECT_ID(N'dbo.{ENTRY_TABLE}', N'U') IS NULL
+BEGIN
+    CREATE TABLE dbo.{ENTRY_TABLE} (
+        sCdTenant UNIQUEIDENTIFIER NOT NULL,
+        nCodigoOrigem BIGINT NOT NULL,
+        bHashEntry BINARY(20) NOT NULL,
+        dtMigracao DATETIME NOT NULL DEFAULT(GETDATE()),
+        CONSTRAINT PK_{ENTRY_TABLE} PRIMARY KEY (sCdTenant, nCodigoOrigem, bHashEntry)
+    );
+END
+
+IF OBJECT_ID(N'dbo.{TAG_TABLE}', N'U') IS NULL
+BEGIN
+    CREATE TABLE dbo.{TAG_TABLE} (
+        sCdTenant UNIQUEIDENTIFIER NOT NULL,
+        nCodigoOrigem BIGINT NOT NULL,
+        bHashTag BINARY(32) NOT NULL,
+        dtAtualizacao DATETIME NOT NULL DEFAULT(GETDATE()),
+        CONSTRAINT PK_{TAG_TABLE} PRIMARY KEY (sCdTenant, nCodigoOrigem)
+    );
+END
+"""
+    with engine.begin() as conn:
+        conn.execute(text(create_sql))
+
+    _entry_verificado.add(chave)
+
+
+def hashes_entries(codigo_origem: int, entries: list) -> list:
+    """
+    Identidade de cada entry do prontuário, na mesma ordem.
+
+    Entries idênticas no mesmo Tag (mesma data, responsável e conteúdo) recebem
+    o número da ocorrência no hash, para não colidirem.
+
+    Args:
+        codigo_origem: Codigo do prontuário no legado
+        entries: Entries de parse_prontuario_entries
+
+    Returns:
+        list: SHA-1 (bytes) por entry
+    """
+    hashes = []
+    ocorrencias = {}
+    for entry in entries:
+        base = "\x1f".join([
+            str(int(codigo_origem)),
+            entry['data'].strftime('%Y-%m-%d %H:%M:%S'),
+            entry['responsavel'],
+            entry['conteudo'],
+        ])
+        n = ocorrencias.get(base, 0)
+        ocorrencias[base] = n + 1
+        if n:
+            base = f"{base}\x1f{n}"
+        hashes.append(hashlib.sha1(base.encode("utf-8")).digest())
+    return hashes
+
+
+def carregar_hashes_entries(engine, tenant_id: str, codigos: list) -> dict:
+    """
+    Retorna {Codigo: set(hash)} das entries já migradas dos Codigos informados.
+
+    Codigos sem nenhuma identidade gravada não aparecem no resultado.
+    """
+    ensure_entry_table(engine)
+    resultado = {}
+    codigos = [int(c) for c in codigos]
+    with engine.connect() as conn:
+        for i in range(0, len(codigos), 1000):
+            result = conn.execute(SELECT_ENTRIES_SQL, {"tenant": tenant_id, "codigos": codigos[i:i + 1000]})
+            for codigo, hash_entry in result:
+                resultado.setdefault(int(codigo), set()).add(bytes(hash_entry))
+    return resultado
+
+
+def salvar_hashes_entries(conn, tenant_id: str, hashes_por_codigo: dict, chunk_size: int = 1000):
+    """
+    Grava as identidades novas na transação do lote.
+
+    Args:
+        conn: Conexão dentro da transação do lote
+        tenant_id: ID da tenant
+        hashes_por_codigo: {Codigo: [hash]} das entries gravadas (ou registradas no backfill)
+    """
+    agora = datetime.now()
+    linhas = [
+        {
+            "sCdTenant": tenant_id,
+            "nCodigoOrigem": int(codigo),
+            "bHashEntry": hash_entry,
+            "dtMigracao": agora,
+        }
+        for codigo, hashes in hashes_por_codigo.items()
+        for hash_entry in hashes
+    ]
+    if linhas:
+        bulk_insert(conn, ENTRY_TABLE, ENTRY_COLUMNS, linhas, chunk_size=chunk_size)
+
+
+def carregar_entries_destino(engine, tenant_id: str, pets) -> dict:
+    """
+    Linhas já gravadas no destino para os pets informados (base do backfill).
+
+    Args:
+        engine: Engine do banco destino
+        tenant_id: ID da tenant
+        pets: sCdPet dos prontuários migrados sem identidades
+
+    Returns:
+        dict: {sCdPet (minúsculo): Counter((tDtRegistro, conteúdo))} de PRONTUARIO e RECEITA_MEDICA
+    """
+    resultado = {}
+    pets = sorted({str(p) for p in pets})
+    with engine.connect() as conn:
+        for i in range(0, len(pets), 1000):
+            result = conn.execute(SELECT_DESTINO_SQL, {"tenant": tenant_id, "pets": pets[i:i + 1000]})
+            for sCdPet, registro, conteudo in result:
+                resultado.setdefault(str(sCdPet).lower(), Counter())[(registro, conteudo or "")] += 1
+    return resultado
+
+
+def _conteudo_parser_anterior(conteudo: str) -> str:
+    """Conteúdo como o parser anterior gravava: até o primeiro '[' (regex [^\[]*)."""
+    return conteudo.split("[", 1)[0].strip()
+
+
+def entries_ja_gravadas(entries: list, hashes: list, linhas_destino: Counter) -> set:
+    """
+    Backfill: identidades das entries que já têm linha no destino.
+
+    Cada linha do destino corresponde a uma única entry (as encontradas são
+    consumidas do Counter), então entries repetidas só contam como gravadas
+    até o número de linhas iguais existentes. Entries com '[' no conteúdo foram
+    gravadas cortadas pelo parser anterior: sem a linha com o conteúdo completo,
+    vale a linha com o conteúdo cortado.
+
+    Args:
+        entries: Entries de parse_prontuario_entries
+        hashes: Identidades das entries (hashes_entries)
+        linhas_destino: Counter((data, conteúdo)) do pet (carregar_entries_destino)
+
+    Returns:
+        set: Hashes das entries já gravadas
+    """
+    gravadas = set()
+    for entry, hash_entry in zip(entries, hashes):
+        chaves = [(entry['data'], entry['conteudo'])]
+        if "[" in entry['conteudo']:
+            chaves.append((entry['data'], _conteudo_parser_anterior(entry['conteudo'])))
+        for chave in chaves:
+            if linhas_destino[chave] > 0:
+                linhas_destino[chave] -= 1
+                gravadas.add(hash_entry)
+                break
+    return gravadas
+
+
+def carregar_hashes_tag(engine, tenant_id: str) -> dict:
+    """Retorna {Codigo: SHA-256 do Tag} dos prontuários processados."""
+    ensure_entry_table(engine)
+    with engine.connect() as conn:
+        result = conn.execute(text(f"""
+SELECT nCodigoOrigem, bHashTag FROM dbo.{TAG_TABLE}
+WHERE sCdTenant = :tenant
+"""), {"tenant": tenant_id})
+        return {int(codigo): bytes(hash_tag) for codigo, hash_tag in result}
+
+
+def salvar_hashes_tag(conn, tenant_id: str, hashes_tag: dict, chunk_size: int = 1000):
+    """
+    Grava (substitui) os hashes do Tag na transação do lote.
+
+    Args:
+        conn: Conexão dentro da transação do lote
+        tenant_id: ID da tenant
+        hashes_tag: {Codigo: SHA-256 do Tag} dos prontuários processados no lote
+    """
+    if not hashes_tag:
+        return
+
+    codigos = [int(c) for c in hashes_tag]
+    for i in range(0, len(codigos), 1000):
+        conn.execute(DELETE_TAGS_SQL, {"tenant": tenant_id, "codigos": codigos[i:i + 1000]})
+
+    agora = datetime.now()
+    bulk_insert(conn, TAG_TABLE, TAG_COLUMNS, [
+        {
+            "sCdTenant": tenant_id,
+            "nCodigoOrigem": int(codigo),
+            "bHashTag": bytes(hash_tag),
+            "dtAtualizacao": agora,
+        }
+        for codigo, hash_tag in hashes_tag.items()
+    ], chunk_size=chunk_size)
+
+
+def limpar_hashes_entries(engine, tenant_id: str):
+    """Remove as identidades de entries e os hashes do Tag da tenant."""
+    ensure_entry_table(engine)
+    with engine.begin() as conn:
+        conn.execute(text(f"DELETE FROM dbo.{ENTRY_TABLE} WHERE sCdTenant = :tenant"), {"tenant": tenant_id})
+        conn.execute(text(f"DELETE FROM dbo.{TAG_TABLE} WHERE sCdTenant = :tenant"), {"tenant": tenant_id})
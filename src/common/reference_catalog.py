@@ -0,0 +1,113 @@
+"""
+Catálogo de referência (raças e cores) carregado uma única vez.
+
+Substitui as consultas por registro a PET_RACA/PET_COR (legado) e RACA/COR
+(destino): tudo fica em dicionários com lookup O(1), o hash de cada conjunto
+de opções do fuzzy matching é calculado na carga e a resolução código do
+legado -> código do destino é feita uma vez por processo.
+"""
+import threading
+from sqlalchemy import text
+
+from common.fuzzy_utils import fuzzy_match_many, hash_choices
+
+
+class ReferenceCatalog:
+    """
+    Raças e cores do legado e do destino em memória.
+
+    Args:
+        legacy_engine: Engine do banco legado (PET_RACA, PET_COR); None = não carregar
+        dest_engine: Engine do banco destino (RACA, COR); None = não carregar
+    """
+
+    _compartilhados = {}
+    _compartilhados_lock = threading.Lock()
+
+    def __init__(self, legacy_engine=None, dest_engine=None):
+        self.racas_legado = {}          # {Codigo: {'descricao', 'especie'}}
+        self.cores_legado = {}          # {Codigo: Descricao}
+        self.racas_destino = {}         # {SNMRACA: nCdRaca} (todas as espécies)
+        self.cores_destino_upper = {}   # {SNMCOR: nCdCor}
+
+        self._hashes = {}
+        self._resolvidas = None
+        self._lock = threading.Lock()
+
+        if legacy_engine is not None:
+            self._carregar_legado(legacy_engine)
+        if dest_engine is not None:
+            self._carregar_destino(dest_engine)
+
+    @classmethod
+    def shared(cls, legacy_engine=None, dest_engine=None):
+        """Retorna o catálogo do processo para esse par de bancos (carregado na primeira chamada)."""
+        chave = (
+            str(legacy_engine.url) if legacy_engine is not None else None,
+            str(dest_engine.url) if dest_engine is not None else None,
+        )
+        with cls._compartilhados_lock:
+            if chave not in cls._compartilhados:
+                cls._compartilhados[chave] = cls(legacy_engine, dest_engine)
+            return cls._compartilhados[chave]
+
+    def _carregar_legado(self, legacy_engine):
+        with legacy_engine.connect() as conn:
+            for row in conn.execute(text("SELECT Codigo, Descricao, Especie FROM PET_RACA")):
+                self.racas_legado[row[0]] = {'descricao': row[1], 'especie': row[2]}
+
+            for row in conn.execute(text("SELECT Codigo, Descricao FROM PET_COR")):
+                self.cores_legado[row[0]] = row[1]
+
+    def _carregar_destino(self, dest_engine):
+        with dest_engine.connect() as conn:
+            for row in conn.execute(text("SELECT nCdRaca, sNmRaca FROM RACA WHERE bFlAtivo = 1")):
+                self.racas_destino[row[1].upper()] = row[0]
+
+            for row in conn.execute(text("SELECT nCdCor, sNmCor FROM COR WHERE bFlAtivo = 1")):
+                self.cores_destino_upper[row[1].upper()] = row[0]
+
+        # Hash de cada conjunto de opções do fuzzy matching calculado uma vez
+        self._hashes["RACA"] = hash_choices(self.racas_destino)
+        self._hashes["COR"] = hash_choices(self.cores_destino_upper)
+
+    def resolver_racas_cores(self):
+        """
+        Resolve uma única vez a raça/cor do destino para cada código do legado.
+
+        Os nomes distintos do legado são comparados de uma vez com o catálogo do
+        destino (fuzzy_match_many), então o mapeamento de cada pet vira um lookup.
+        O resultado fica no catálogo: migrações seguintes no mesmo processo não
+        refazem o matching.
+
+        Returns:
+            tuple: ({codigo_raca_legado: nCdRaca}, {codigo_cor_legado: nCdCor})
+        """
+        with self._lock:
+            if self._resolvidas is None:
+                self._resolvidas = self._resolver()
+            return self._resolvidas
+
+    def _resolver(self):
+        nomes_racas = {codigo: info.get('descricao') for codigo, info in self.racas_legado.items()}
+        matches_racas = fuzzy_match_many(
+            nomes_racas.values(), self.racas_destino, min_score=75,
+            dominio="RACA", choices_hash=self._hashes.get("RACA")
+        )
+        racas_resolvidas = {
+            codigo: matches_racas[nome][0]
+            for codigo, nome in nomes_racas.items()
+            if nome and matches_racas[nome][0] is not None
+        }
+
+        matches_cores = fuzzy_match_many(
+            self.cores_legado.values(), self.cores_destino_upper, min_score=70,
+            dominio="COR", choices_hash=self._hashes.get("COR")
+        )
+        cores_resolvidas = {
+            codigo: matches_cores[nome][0]
+            for codigo, nome in self.cores_legado.items()
+            if nome and matches_cores[nome][0] is not None
+        }
+
+        return racas_resolvidas, cores_resolvidas
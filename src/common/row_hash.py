@@ -0,0 +1,147 @@
+"""
+Hash do conteúdo das linhas gravadas no destino, para pular UPDATEs sem mudança.
+
+Para cada registro migrado guardamos, na tabela CONTROLE_MIGRACAO_HASH_DESTINO,
+o SHA-1 das colunas mapeadas (sem timestamps voláteis). Na reexecução, os
+registros a atualizar são comparados em memória e só os que mudaram vão para o
+UPDATE: uma nova execução sobre dados inalterados não atualiza nada.
+"""
+import json
+import hashlib
+from datetime import datetime
+from sqlalchemy import text, bindparam
+
+from common.db_utils import bulk_insert
+
+
+HASH_TABLE = "CONTROLE_MIGRACAO_HASH_DESTINO"
+HASH_COLUMNS = ["sCdTenant", "sTabelaDestino", "sValorChaveDestino", "sHash", "dtAtualizacao"]
+
+_hash_verificado = set()
+
+DELETE_HASHES_SQL = text(f"""
+DELETE FROM dbo.{HASH_TABLE}
+WHERE sCdTenant = :tenant
+  AND sTabelaDestino = :destino
+  AND sValorChaveDestino IN :chaves
+""").bindparams(bindparam("chaves", expanding=True))
+
+
+def ensure_hash_table(engine):
+    """Cria a tabela de hashes no banco destino se não existir (uma verificação por engine)."""
+    chave = str(engine.url)
+    if chave in _hash_verificado:
+        return
+
+    create_sql = f"""
+IF OBJECT_ID(N'dbo.{HASH_TABLE}', N'U') IS NULL
+BEGIN
+    CREATE TABLE dbo.{HASH_TABLE} (
+        sCdTenant UNIQUEIDENTIFIER NOT NULL,
+        sTabelaDestino NVARCHAR(200) NOT NULL,
+        sValorChaveDestino NVARCHAR(200) NOT NULL,
+        sHash CHAR(40) NOT NULL,
+        dtAtualizacao DATETIME NOT NULL DEFAULT(GETDATE()),
+        CONSTRAINT PK_{HASH_TABLE} PRIMARY KEY (sCdTenant, sTabelaDestino, sValorChaveDestino)
+    );
+END
+"""
+    with engine.begin() as conn:
+        conn.execute(text(create_sql))
+
+    _hash_verificado.add(chave)
+
+
+def hash_linha(row: dict, colunas: list) -> str:
+    """SHA-1 estável dos valores das colunas informadas."""
+    valores = [row.get(c) for c in colunas]
+    conteudo = json.dumps(valores, default=str, ensure_ascii=False)
+    return hashlib.sha1(conteudo.encode("utf-8")).hexdigest()
+
+
+def carregar_hashes(engine, tenant_id: str, tabela_destino: str) -> dict:
+    """Retorna {chave destino: hash} gravados para a tabela destino."""
+    ensure_hash_table(engine)
+    with engine.connect() as conn:
+        result = conn.execute(text(f"""
+SELECT sValorChaveDestino, sHash FROM dbo.{HASH_TABLE}
+WHERE sCdTenant = :tenant AND sTabelaDestino = :destino
+"""), {"tenant": tenant_id, "destino": tabela_destino})
+        return {str(row[0]).lower(): row[1] for row in result}
+
+
+def calcular_hashes(rows: list, chave: str, colunas: list) -> dict:
+    """Retorna {chave destino: hash} das linhas."""
+    return {str(row[chave]).lower(): hash_linha(row, colunas) for row in rows}
+
+
+def filtrar_alterados(rows: list, chave: str, colunas: list, hashes_gravados: dict):
+    """
+    Separa as linhas cujo conteúdo mudou desde a última gravação.
+
+    Args:
+        rows: Linhas a atualizar (dicts)
+        chave: Coluna da chave destino (ex: 'sCdPet')
+        colunas: Colunas que compõem o hash
+        hashes_gravados: {chave destino: hash} (carregar_hashes)
+
+    Returns:
+        tuple: (linhas alteradas, {chave: hash novo} das alteradas)
+    """
+    alterados = []
+    hashes_novos = {}
+    for row in rows:
+        chave_destino = str(row[chave]).lower()
+        novo = hash_linha(row, colunas)
+        if hashes_gravados.get(chave_destino) != novo:
+            alterados.append(row)
+            hashes_novos[chave_destino] = novo
+    return alterados, hashes_novos
+
+
+def salvar_hashes(conn, tenant_id: str, tabela_destino: str, hashes: dict, chunk_size: int = 1000):
+    """
+    Grava (substitui) os hashes na transação do lote.
+
+    Args:
+        conn: Conexão dentro da transação do lote
+        tenant_id: ID da tenant
+        tabela_destino: Tabela destino (ex: 'PET')
+        hashes: {chave destino: hash} das linhas gravadas no lote
+    """
+    if not hashes:
+        return
+
+    chaves = list(hashes)
+    for i in range(0, len(chaves), 1000):
+        conn.execute(DELETE_HASHES_SQL, {
+            "tenant": tenant_id,
+            "destino": tabela_destino,
+            "chaves": chaves[i:i + 1000]
+        })
+
+    agora = datetime.now()
+    bulk_insert(conn, HASH_TABLE, HASH_COLUMNS, [
+        {
+            "sCdTenant": tenant_id,
+            "sTabelaDestino": tabela_destino,
+            "sValorChaveDestino": chave_destino,
+            "sHash": valor,
+            "dtAtualizacao": agora,
+        }
+        for chave_destino, valor in hashes.items()
+    ], chunk_size=chunk_size)
+
+
+def limpar_hashes(engine, tenant_id: str, tabela_destino: str = None):
+    """Remove os hashes da tenant (todos ou de uma tabela destino)."""
+    ensure_hash_table(engine)
+    with engine.begin() as conn:
+        if tabela_destino is None:
+            conn.execute(text(f"DELETE FROM dbo.{HASH_TABLE} WHERE sCdTenant = :tenant"),
+                         {"tenant": tenant_id})
+        else:
+            conn.execute(text(f"""
+DELETE FROM dbo.{HASH_TABLE}
+WHERE sCdTenant = :tenant AND sTabelaDestino = :destino
+"""), {"tenant": tenant_id, "destino": tabela_destino})
@@ -0,0 +1,99 @@
+"""
+Utilitários para atualização em massa via tabela de staging (SQL Server).
+
+Em vez de executar um UPDATE por registro, os registros alterados são
+carregados em uma tabela temporária (#STG_<TABELA>) e aplicados com um único
+UPDATE ... FROM ... JOIN por lote.
+"""
+from sqlalchemy import text
+from common.db_utils import bulk_insert
+
+
+def _nome_staging(table: str) -> str:
+    return f"#STG_{table}"
+
+
+def criar_tabela_staging(conn, table: str, colunas: list):
+    """
+    Cria (ou recria) a tabela temporária de staging com as colunas informadas.
+
+    A estrutura é copiada da tabela destino via SELECT TOP 0 ... INTO. O LEFT JOIN
+    com uma tabela derivada garante que todas as colunas da staging aceitem NULL.
+
+    Args:
+        conn: Conexão aberta (a tabela temporária vive apenas nesta sessão)
+        table: Tabela destino usada como modelo
+        colunas: Colunas a copiar para a staging
+
+    Returns:
+        str: Nome da tabela de staging
+    """
+    staging = _nome_staging(table)
+    colunas_sql = ", ".join(f"t.{c}" for c in colunas)
+
+    conn.execute(text(f"IF OBJECT_ID('tempdb..{staging}') IS NOT NULL DROP TABLE {staging}"))
+    conn.execute(text(f"""
+SELECT TOP 0 {colunas_sql}
+INTO {staging}
+FROM (SELECT 1 AS x) AS d
+LEFT JOIN {table} t ON 1 = 0
+"""))
+
+    return staging
+
+
+def bulk_update_via_staging(conn, table: str, key_columns: list, update_columns: list,
+                            rows: list, chunk_size: int = 1000, coalesce_columns: list = None):
+    """
+    Atualiza registros em massa: carrega cada lote na staging e aplica um UPDATE ... FROM.
+
+    Args:
+        conn: Conexão aberta (dentro de uma transação)
+        table: Tabela destino (ex: 'PET')
+        key_columns: Colunas usadas no JOIN (ex: ['sCdPet'])
+        update_columns: Colunas a atualizar
+        rows: Lista de dicts contendo ao menos key_columns + update_columns
+        chunk_size: Registros por lote
+        coalesce_columns: Colunas de update_columns que só são gravadas quando o
+            valor da staging não é NULL (NULL mantém o valor atual)
+
+    Returns:
+        int: Total de linhas atualizadas na tabela destino
+    """
+    if not rows:
+        return 0
+
+    # Mesma chave repetida: vale o último registro (igual a UPDATEs sequenciais)
+    por_chave = {}
+    for row in rows:
+        por_chave[tuple(row[c] for c in key_columns)] = row
+    rows = list(por_chave.values())
+
+    colunas = list(key_columns) + list(update_columns)
+    staging = criar_tabela_staging(conn, table, colunas)
+
+    coalesce_columns = set(coalesce_columns or [])
+    set_sql = ",\n    ".join(
+        f"t.{c} = COALESCE(s.{c}, t.{c})" if c in coalesce_columns else f"t.{c} = s.{c}"
+        for c in update_columns
+    )
+    join_sql = " AND ".join(f"t.{c} = s.{c}" for c in key_columns)
+    update_sql = text(f"""
+UPDATE t SET
+    {set_sql}
+FROM {table} t
+INNER JOIN {staging} s ON {join_sql}
+""")
+
+    total_atualizado = 0
+    for i in range(0, len(rows), chunk_size):
+        chunk = rows[i:i + chunk_size]
+        bulk_insert(conn, staging, colunas, chunk, chunk_size=chunk_size)
+        result = conn.execute(update_sql)
+        total_atualizado += result.rowcount
+        conn.execute(text(f"TRUNCATE TABLE {staging}"))
+
+    # Em caso de erro o rollback da transação já descarta a staging
+    conn.execute(text(f"DROP TABLE {staging}"))
+
+    return total_atualizado
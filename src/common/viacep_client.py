@@ -0,0 +1,226 @@
+"""
+Cliente concorrente da API ViaCEP.
+
+- Pool de threads com concorrência limitada (VIACEP_MAX_WORKERS)
+- Token bucket limitando requisições por segundo (VIACEP_RATE_PER_SECOND)
+- Sessões HTTP keep-alive reaproveitadas por thread
+- Retentativas com backoff exponencial em timeout, erro de conexão, 429 e 5xx
+- Cache em disco opcional (common.local_cache) com TTL, incluindo CEPs
+  inexistentes (cache negativo); falhas de rede nunca são gravadas
+
+A URL base é configurável (VIACEP_BASE_URL) para permitir testes contra um
+servidor HTTP local.
+"""
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+VIACEP_BASE_URL = os.getenv("VIACEP_BASE_URL", "https://viacep.com.br/ws")
+VIACEP_MAX_WORKERS = int(os.getenv("VIACEP_MAX_WORKERS", "8"))
+VIACEP_RATE_PER_SECOND = float(os.getenv("VIACEP_RATE_PER_SECOND", "10"))
+VIACEP_MAX_RETRIES = int(os.getenv("VIACEP_MAX_RETRIES", "3"))
+VIACEP_BACKOFF_SECONDS = float(os.getenv("VIACEP_BACKOFF_SECONDS", "1"))
+VIACEP_TIMEOUT_SECONDS = float(os.getenv("VIACEP_TIMEOUT_SECONDS", "10"))
+VIACEP_CACHE_TTL_DAYS = float(os.getenv("VIACEP_CACHE_TTL_DAYS", "90"))
+VIACEP_CACHE_NEGATIVE_TTL_DAYS = float(os.getenv("VIACEP_CACHE_NEGATIVE_TTL_DAYS", "7"))
+VIACEP_CACHE_VERSION = 1
+
+# Resultado de uma consulta
+STATUS_OK = "ok"                          # CEP encontrado
+STATUS_NAO_ENCONTRADO = "nao_encontrado"  # CEP inválido ou {"erro": true} na API
+STATUS_FALHA = "falha"                    # Rede/HTTP falhou após as retentativas
+
+
+def clean_cep(cep) -> str:
+    """Remove caracteres não numéricos do CEP."""
+    if not cep:
+        return ""
+    return "".join(filter(str.isdigit, str(cep)))
+
+
+class TokenBucket:
+    """
+    Limitador de taxa thread-safe: até `rate` retiradas por segundo, com rajada de `capacity`.
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self._tokens = self.capacity
+        self._ultimo = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Bloqueia até haver um token disponível."""
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                agora = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (agora - self._ultimo) * self.rate)
+                self._ultimo = agora
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                espera = (1 - self._tokens) / self.rate
+            time.sleep(espera)
+
+
+class ViaCepResolver:
+    """
+    Consulta CEPs na ViaCEP em paralelo respeitando o limite de taxa da API.
+
+    Args:
+        base_url: URL base (padrão VIACEP_BASE_URL); a consulta é {base_url}/{cep}/json/
+        max_workers: Requisições simultâneas
+        rate_per_second: Requisições por segundo (todas as threads somadas)
+        max_retries: Tentativas por CEP em falhas transitórias
+        backoff_seconds: Espera inicial entre tentativas (dobra a cada falha)
+        timeout: Timeout de cada requisição em segundos
+        cache: LocalCache para guardar os resultados entre execuções (None = sem cache)
+        ttl_negativo: Validade em segundos do cache de CEPs inexistentes (<= 0 = não guardar)
+    """
+
+    def __init__(self, base_url: str = None, max_workers: int = None, rate_per_second: float = None,
+                 max_retries: int = None, backoff_seconds: float = None, timeout: float = None,
+                 cache=None, ttl_negativo: float = None):
+        self.base_url = (base_url or VIACEP_BASE_URL).rstrip("/")
+        self.max_workers = max_workers or VIACEP_MAX_WORKERS
+        self.max_retries = max_retries or VIACEP_MAX_RETRIES
+        self.backoff_seconds = VIACEP_BACKOFF_SECONDS if backoff_seconds is None else backoff_seconds
+        self.timeout = timeout or VIACEP_TIMEOUT_SECONDS
+        self.limiter = TokenBucket(VIACEP_RATE_PER_SECOND if rate_per_second is None else rate_per_second)
+        self._local = threading.local()
+        self.cache = cache
+        self.ttl_negativo = VIACEP_CACHE_NEGATIVE_TTL_DAYS * 86400 if ttl_negativo is None else ttl_negativo
+
+    def _session(self):
+        """Sessão keep-alive da thread atual (requests.Session não é compartilhada entre threads)."""
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=1)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            self._local.session = session
+        return session
+
+    def consultar_status(self, cep):
+        """
+        Consulta um CEP.
+
+        Returns:
+            tuple: (status, dados) com status STATUS_OK / STATUS_NAO_ENCONTRADO / STATUS_FALHA
+                   e dados = dict da ViaCEP (apenas com STATUS_OK)
+        """
+        cep_limpo = clean_cep(cep)
+        if len(cep_limpo) != 8:
+            return (STATUS_NAO_ENCONTRADO, None)
+
+        url = f"{self.base_url}/{cep_limpo}/json/"
+        ultimo_erro = None
+
+        for tentativa in range(1, self.max_retries + 1):
+            self.limiter.acquire()
+            espera = self.backoff_seconds * (2 ** (tentativa - 1))
+
+            try:
+                response = self._session().get(url, timeout=self.timeout)
+            except requests.RequestException as e:
+                ultimo_erro = e
+            else:
+                if response.status_code == 200:
+                    try:
+                        data = response.json()
+                    except ValueError as e:
+                        ultimo_erro = e
+                    else:
+                        if "erro" in data:
+                            return (STATUS_NAO_ENCONTRADO, None)
+                        return (STATUS_OK, data)
+                elif response.status_code == 400:
+                    # Formato de CEP rejeitado pela API: não adianta repetir
+                    return (STATUS_NAO_ENCONTRADO, None)
+                elif response.status_code == 429 or response.status_code >= 500:
+                    ultimo_erro = f"HTTP {response.status_code}"
+                    retry_after = response.headers.get("Retry-After", "")
+                    if retry_after.isdigit():
+                        espera = max(espera, float(retry_after))
+                else:
+                    ultimo_erro = f"HTTP {response.status_code}"
+                    break
+
+            if tentativa < self.max_retries:
+                time.sleep(espera)
+
+        print(f"Erro ao consultar CEP {cep_limpo}: {ultimo_erro}")
+        return (STATUS_FALHA, None)
+
+    def consultar(self, cep):
+        """Consulta um CEP e retorna o dict da ViaCEP ou None."""
+        status, dados = self.consultar_status(cep)
+        return dados if status == STATUS_OK else None
+
+    def resolver_muitos(self, ceps, progresso_a_cada: int = 100) -> dict:
+        """
+        Consulta vários CEPs em paralelo (cada CEP limpo distinto uma única vez).
+
+        Args:
+            ceps: Iterável de CEPs (com ou sem máscara)
+            progresso_a_cada: Imprime o progresso a cada N CEPs concluídos (0 = nunca)
+
+        Returns:
+            dict: {cep_limpo: (status, dados)}
+        """
+        distintos = list(dict.fromkeys(clean_cep(c) for c in ceps))
+        resultados = {}
+        if not distintos:
+            return resultados
+
+        # CEPs já resolvidos em execuções anteriores
+        pendentes = distintos
+        if self.cache is not None:
+            for cep, valor in self.cache.get_many(distintos).items():
+                resultados[cep] = (valor["status"], valor["dados"])
+            pendentes = [cep for cep in distintos if cep not in resultados]
+            if resultados:
+                print(f"  💾 ViaCEP: {len(resultados)} CEPs encontrados no cache local")
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futuros = {executor.submit(self.consultar_status, cep): cep for cep in pendentes}
+            for concluidos, futuro in enumerate(as_completed(futuros), start=1):
+                resultados[futuros[futuro]] = futuro.result()
+                if progresso_a_cada and concluidos % progresso_a_cada == 0:
+                    print(f"  🌐 ViaCEP: {concluidos}/{len(pendentes)} CEPs consultados...")
+
+        if self.cache is not None:
+            self._gravar_cache({cep: resultados[cep] for cep in pendentes})
+
+        return resultados
+
+    def _gravar_cache(self, consultas: dict):
+        """Grava encontrados (TTL padrão) e inexistentes (TTL negativo); falhas não são gravadas."""
+        encontrados = {}
+        inexistentes = {}
+        for cep, (status, dados) in consultas.items():
+            if len(cep) != 8:
+                continue
+            if status == STATUS_OK:
+                encontrados[cep] = {"status": status, "dados": dados}
+            elif status == STATUS_NAO_ENCONTRADO:
+                inexistentes[cep] = {"status": status, "dados": None}
+
+        self.cache.set_many(encontrados)
+        if self.ttl_negativo > 0:
+            self.cache.set_many(inexistentes, ttl=self.ttl_negativo)
+
+
+def criar_cache_viacep():
+    """Cache local padrão das consultas ViaCEP (compartilhado entre tenants e execuções)."""
+    from common.local_cache import LocalCache
+    return LocalCache("viacep", version=VIACEP_CACHE_VERSION, ttl=VIACEP_CACHE_TTL_DAYS * 86400)
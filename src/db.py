@@ -1,35 +1,23 @@
 import os
 from pathlib import Path
 from urllib.parse import unquote
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
 from dotenv import load_dotenv
+from common.db_utils import get_engine_from_env as _get_pooled_engine
 
 # Carrega variáveis do arquivo .env
 env_path = Path(__file__).parent.parent / ".env"
 load_dotenv(dotenv_path=env_path)
 
 def get_engine_from_env(env_var_name: str):
-    """Cria um SQLAlchemy engine a partir de uma variável do arquivo .env contendo a URL de conexão.
+    """Retorna o SQLAlchemy engine a partir de uma variável do arquivo .env contendo a URL de conexão.
 
-    A string pode ser driver-agnóstica (ex: mssql+pyodbc://... ou postgresql+psycopg2://...)
+    A string pode ser driver-agnóstica (ex: mssql+pyodbc://... ou postgresql+psycopg2://...).
+    Usa o registro de engines de common.db_utils, então o pool de conexões é
+    compartilhado com as migrações do mesmo processo. Para pymssql vale o
+    timeout de consulta do registro (300 s, antes 30 s neste módulo).
     """
-    url = os.getenv(env_var_name)
-    if not url:
-        raise RuntimeError(f"Variável {env_var_name} não definida no arquivo .env")
-    
-    # Para pymssql, precisamos passar parâmetros adicionais para Azure SQL
-    if "pymssql" in url:
-        # Criar engine com parâmetros específicos para Azure SQL
-        return create_engine(
-            url,
-            connect_args={
-                "timeout": 30,
-                "login_timeout": 30,
-                "tds_version": "7.4"
-            }
-        )
-    
-    return create_engine(url)
+    return _get_pooled_engine(env_var_name)
 
 def ensure_controle_table(engine, tenant_id: str):
     """Cria a tabela CONTROLE_MIGRACAO_LEGADO no banco destino se não existir.
@@ -3,20 +3,26 @@
 Sistema de Migração PetSys - Legado para Web
 
 Menu interativo para executar migrações de diferentes entidades.
+
+Execução completa não interativa (etapas independentes em paralelo):
+    python src/main.py run-all [--dry-run] [--max-workers N] [--incremental]
 """
 import sys
+import time
+import argparse
 from pathlib import Path
 
 # Adicionar src ao path para imports funcionarem
 sys.path.insert(0, str(Path(__file__).parent))
 
-from migrations.clientes.migrate_clientes import migrate_clientes
+from migrations.clientes.migrate_clientes_bulk import migrate_clientes_bulk
 from migrations.pets.migrate_pets import migrate_pets
 from migrations.vacinas.migrate_vacinas import migrate_vacinas
 from migrations.aplicacoes_vacinas.migrate_aplicacoes_vacinas_bulk import migrate_aplicacoes_vacinas_bulk
 from migrations.pesos.migrate_pesos_bulk import migrate_pesos_bulk
 from migrations.prontuarios.migrate_prontuarios import migrate_prontuarios_bulk
 from clear_migrated_data import clear_all_data
+from common.orchestrator import Etapa, executar_dag, imprimir_relatorio, STATUS_SUCESSO
 
 # Importar função de atualização de cidades
 import sys
@@ -88,9 +94,9 @@ def run_migration_clientes():
         return
     
     # Executar migração
-    total = migrate_clientes(batch_size=500)
+    stats = migrate_clientes_bulk(batch_size=1000)
     
-    print(f"\n✓ Migração concluída! {total} registros processados.\n")
+    print(f"\n✓ Migração concluída! {stats['total']} registros processados.\n")
 
 
 def run_migration_pets():
@@ -350,6 +356,65 @@ def run_clear_all_data():
         print(f"\n✗ Erro durante exclusão.\n")
 
 
+def etapa_migracao(nome: str, funcao, depende_de: list = None) -> Etapa:
+    """
+    Etapa do run-all que falha quando a migração retorna None.
+    
+    Algumas migrações reportam erro fatal (ex: veterinário fallback ausente nos
+    prontuários) imprimindo a mensagem e retornando None em vez de lançar exceção;
+    sem esta verificação a etapa contaria como sucesso e as dependentes rodariam.
+    """
+    def executar():
+        resultado = funcao()
+        if resultado is None:
+            raise RuntimeError(f"migração '{nome}' terminou com erro (sem resultado)")
+        return resultado
+    return Etapa(nome, executar, depende_de)
+
+
+def build_etapas_migracao(dry_run: bool = False, incremental: bool = False) -> list:
+    """
+    Monta o grafo da migração completa.
+    
+    clientes -> pets -> {pesos, prontuarios, aplicacoes_vacinas}
+    vacinas  -----------------------------> aplicacoes_vacinas
+    """
+    opcoes = {"dry_run": dry_run, "incremental": incremental}
+    return [
+        etapa_migracao("clientes", lambda: migrate_clientes_bulk(batch_size=1000, **opcoes)),
+        etapa_migracao("vacinas", lambda: migrate_vacinas(batch_size=500, **opcoes)),
+        etapa_migracao("pets", lambda: migrate_pets(batch_size=500, **opcoes), ["clientes"]),
+        etapa_migracao("pesos", lambda: migrate_pesos_bulk(batch_size=1000, **opcoes), ["pets"]),
+        etapa_migracao("aplicacoes_vacinas",
+                       lambda: migrate_aplicacoes_vacinas_bulk(batch_size=1000, **opcoes),
+                       ["pets", "vacinas"]),
+        etapa_migracao("prontuarios", lambda: migrate_prontuarios_bulk(batch_size=500, **opcoes), ["pets"]),
+    ]
+
+
+def run_all(dry_run: bool = False, max_workers: int = None, incremental: bool = False) -> bool:
+    """
+    Executa toda a cadeia de migrações sem interação, respeitando as dependências.
+    
+    Args:
+        dry_run: Simula todas as etapas
+        max_workers: Etapas simultâneas (padrão: todas as que estiverem prontas)
+        incremental: Cada etapa migra apenas registros novos ou alterados
+    
+    Returns:
+        bool: True se todas as etapas terminaram com sucesso
+    """
+    print_header()
+    print(f"Execução completa {'(DRY-RUN) ' if dry_run else ''}com etapas paralelas\n")
+    
+    etapas = build_etapas_migracao(dry_run=dry_run, incremental=incremental)
+    inicio = time.monotonic()
+    resultados = executar_dag(etapas, max_workers=max_workers)
+    imprimir_relatorio(etapas, resultados, time.monotonic() - inicio)
+    
+    return all(r["status"] == STATUS_SUCESSO for r in resultados.values())
+
+
 def main():
     """Função principal do menu."""
     print_header()
@@ -403,4 +468,17 @@ def main():
 
 
 if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        parser = argparse.ArgumentParser(description="Sistema de Migração PetSys")
+        subparsers = parser.add_subparsers(dest="comando", required=True)
+        
+        parser_run_all = subparsers.add_parser("run-all", help="Executa toda a migração (etapas independentes em paralelo)")
+        parser_run_all.add_argument("--dry-run", action="store_true", help="Simula todas as etapas")
+        parser_run_all.add_argument("--max-workers", type=int, default=None, help="Etapas simultâneas")
+        parser_run_all.add_argument("--incremental", action="store_true", help="Migra apenas registros novos ou alterados")
+        
+        args = parser.parse_args()
+        sucesso = run_all(dry_run=args.dry_run, max_workers=args.max_workers, incremental=args.incremental)
+        sys.exit(0 if sucesso else 1)
+    
     main()
@@ -13,8 +13,41 @@ sys.path.insert(0, str(Path(__file__).parent.parent.parent))
 
 import uuid
 from datetime import datetime, date
-from sqlalchemy import text
-from common.db_utils import get_engine_from_env, ensure_controle_table, get_tenant_id
+from sqlalchemy import text, bindparam
+from common.db_utils import get_engine_from_env, ensure_controle_table, get_tenant_id, bulk_insert, insert_controle_bulk
+from common.mapping_cache import mapping_cache
+from common.staging_utils import bulk_update_via_staging
+from common.checkpoint import carregar_checkpoint, salvar_checkpoint, limpar_checkpoint
+from common.incremental import preparar_incremental, iterar_paginas, salvar_fingerprints
+from common.row_hash import carregar_hashes, calcular_hashes, filtrar_alterados, salvar_hashes
+
+
+# Nome da migração na tabela de checkpoints
+CHECKPOINT_MIGRACAO = "aplicacoes_vacinas"
+
+
+# Colunas de PET_VACINA gravadas na inserção de aplicações novas
+PET_VACINA_INSERT_COLUMNS = [
+    "sCdPetVacina", "sCdTenant", "sCdPet", "sCdVacina", "sCdUsuario",
+    "sDsPartida", "tDtPrevista", "tDtAplicacao", "sDsLaboratorio",
+    "sDsLocalAplicacao", "bFlPreAutorizado", "tDtCriacao", "tDtAlteracao",
+]
+
+# Colunas de PET_VACINA atualizadas quando a aplicação já foi migrada
+PET_VACINA_UPDATE_COLUMNS = [
+    "sCdPet", "sCdVacina", "sCdUsuario", "sDsPartida", "tDtPrevista", "tDtAplicacao",
+    "sDsLaboratorio", "sDsLocalAplicacao", "bFlPreAutorizado", "tDtAlteracao",
+]
+
+# Colunas do hash de conteúdo (sem o timestamp de alteração)
+PET_VACINA_HASH_COLUMNS = [c for c in PET_VACINA_UPDATE_COLUMNS if c != "tDtAlteracao"]
+
+DELETE_CONTROLE_APLICACOES_SQL = text("""
+    DELETE FROM CONTROLE_MIGRACAO_LEGADO
+    WHERE sCdTenant = :tenant
+      AND sTabelaOrigem = 'PET_ANIMAL_VACINA'
+      AND sValorChaveOrigem IN :codigos
+""").bindparams(bindparam("codigos", expanding=True))
 
 
 def map_origem_to_destino(row, tenant_id: str, sCdPet: str, sCdVacina: str):
@@ -89,8 +122,78 @@ def map_origem_to_destino(row, tenant_id: str, sCdPet: str, sCdVacina: str):
     }
 
 
-def migrate_aplicacoes_vacinas_bulk(batch_size=1000, dry_run=False):
-    """Executa a migração de aplicações de vacinas usando BULK INSERT."""
+def gravar_lote_aplicacoes(dest_engine, tenant_id: str, aplicacoes_para_inserir: list,
+                           aplicacoes_para_atualizar: list, controle_para_inserir: list,
+                           ultimo_codigo: int, chunk_size: int = 1000, fingerprints: dict = None,
+                           hashes: dict = None):
+    """
+    Grava um lote de aplicações (inserts, updates, controle e checkpoint) em uma única transação.
+    
+    Args:
+        dest_engine: Engine do banco destino
+        tenant_id: ID da tenant
+        aplicacoes_para_inserir: Aplicações novas (já com sCdPetVacina)
+        aplicacoes_para_atualizar: Aplicações já migradas
+        controle_para_inserir: Registros de controle das aplicações novas
+        ultimo_codigo: Maior Codigo do legado do lote (high-water mark)
+        chunk_size: Registros por comando
+        fingerprints: {Codigo: SHA-256 da linha} dos registros gravados (modo incremental)
+        hashes: {sCdPetVacina: hash} do conteúdo gravado (common.row_hash)
+    """
+    with dest_engine.begin() as conn:
+        # BULK INSERT de aplicações novas
+        if aplicacoes_para_inserir:
+            bulk_insert(conn, "PET_VACINA", PET_VACINA_INSERT_COLUMNS, aplicacoes_para_inserir, chunk_size=chunk_size)
+        
+        # BULK UPDATE de aplicações existentes (via tabela de staging)
+        if aplicacoes_para_atualizar:
+            bulk_update_via_staging(
+                conn, "PET_VACINA",
+                key_columns=["sCdPetVacina"],
+                update_columns=PET_VACINA_UPDATE_COLUMNS,
+                rows=aplicacoes_para_atualizar,
+                chunk_size=chunk_size
+            )
+        
+        # BULK INSERT na tabela de controle
+        if controle_para_inserir:
+            # Deletar registros antigos antes de inserir (evitar duplicatas)
+            codigos_origem = [c['sValorChaveOrigem'] for c in controle_para_inserir]
+            for i in range(0, len(codigos_origem), 1000):
+                conn.execute(DELETE_CONTROLE_APLICACOES_SQL, {
+                    "tenant": tenant_id,
+                    "codigos": codigos_origem[i:i + 1000]
+                })
+            
+            insert_controle_bulk(conn, controle_para_inserir, chunk_size=chunk_size)
+        
+        # Checkpoint, fingerprints e hashes confirmados junto com os dados do lote
+        salvar_checkpoint(conn, tenant_id, CHECKPOINT_MIGRACAO, ultimo_codigo)
+        salvar_fingerprints(conn, tenant_id, "PET_ANIMAL_VACINA", fingerprints, chunk_size=chunk_size)
+        salvar_hashes(conn, tenant_id, "PET_VACINA", hashes, chunk_size=chunk_size)
+    
+    mapping_cache.register_controle(controle_para_inserir)
+
+
+def migrate_aplicacoes_vacinas_bulk(batch_size=1000, dry_run=False, reiniciar=False, incremental=False):
+    """
+    Executa a migração de aplicações de vacinas usando BULK INSERT.
+    
+    PET_ANIMAL_VACINA é lido em páginas de batch_size registros (keyset por Codigo)
+    e cada página é gravada e confirmada com o checkpoint. Se a execução for
+    interrompida, a próxima retoma após o último lote confirmado. Em modo
+    incremental só são lidas as aplicações novas (acima do watermark) e as alteradas.
+    Aplicações já migradas só são atualizadas se o hash do conteúdo mapeado mudou.
+    
+    Args:
+        batch_size: Registros por página de leitura/gravação
+        dry_run: Se True, apenas simula (não grava dados)
+        reiniciar: Ignora o checkpoint e processa desde o início
+        incremental: Lê apenas o delta desde a última execução (common.incremental)
+    
+    Returns:
+        int: Total de aplicações processadas
+    """
     print("\n" + "="*80)
     print("MIGRAÇÃO: PET_ANIMAL_VACINA -> PET_VACINA (BULK INSERT)")
     print("="*80 + "\n")
@@ -99,97 +202,77 @@ def migrate_aplicacoes_vacinas_bulk(batch_size=1000, dry_run=False):
     dest_engine = get_engine_from_env("DEST_DB_URL")
     tenant_id = get_tenant_id()
     
-    # Garantir que a tabela de controle exista
+    # Garantir que a tabela de controle exista e ler o checkpoint
+    ultimo_codigo = -1
     if not dry_run:
         ensure_controle_table(dest_engine, tenant_id)
+        
+        if reiniciar:
+            limpar_checkpoint(dest_engine, tenant_id, CHECKPOINT_MIGRACAO)
+        checkpoint = carregar_checkpoint(dest_engine, tenant_id, CHECKPOINT_MIGRACAO)
+        if checkpoint is not None:
+            ultimo_codigo = checkpoint
+            print(f"⏯  Retomando após o checkpoint: Codigo > {checkpoint}\n")
+    
+    codigos_alterados = []
+    if incremental and not dry_run:
+        watermark, codigos_alterados = preparar_incremental(legacy_engine, dest_engine, tenant_id, "PET_ANIMAL_VACINA")
+        ultimo_codigo = max(ultimo_codigo, watermark)
     
     print("📊 Carregando dados de referência...")
     
     # 1. Carregar TODOS os mapeamentos de pets (1 query)
     print("  - Mapeamento de pets...", end=" ", flush=True)
-    pets_map = {}
-    with dest_engine.connect() as conn:
-        result = conn.execute(text(f"""
-            SELECT sValorChaveOrigem, sValorChaveDestino 
-            FROM CONTROLE_MIGRACAO_LEGADO
-            WHERE sCdTenant = '{tenant_id}'
-              AND sTabelaOrigem = 'PET_ANIMAL'
-              AND sTabelaDestino = 'PET'
-        """))
-        for row in result:
-            pets_map[int(row[0])] = row[1]
+    pets_map = mapping_cache.load(dest_engine, tenant_id, "PET_ANIMAL", "PET")
     print(f"✓ {len(pets_map)} pets mapeados")
     
     # 2. Carregar TODOS os mapeamentos de vacinas (1 query)
     print("  - Mapeamento de vacinas...", end=" ", flush=True)
-    vacinas_map = {}
-    with dest_engine.connect() as conn:
-        result = conn.execute(text(f"""
-            SELECT sValorChaveOrigem, sValorChaveDestino 
-            FROM CONTROLE_MIGRACAO_LEGADO
-            WHERE sCdTenant = '{tenant_id}'
-              AND sTabelaOrigem = 'PET_VACINA'
-              AND sTabelaDestino = 'VACINA'
-        """))
-        for row in result:
-            vacinas_map[int(row[0])] = str(row[1])  # UUID da vacina no destino
+    vacinas_map = mapping_cache.load(dest_engine, tenant_id, "PET_VACINA", "VACINA")
     print(f"✓ {len(vacinas_map)} vacinas mapeadas")
     
     # 3. Carregar aplicações já migradas (1 query)
     print("  - Aplicações já migradas...", end=" ", flush=True)
-    aplicacoes_migradas = {}
-    with dest_engine.connect() as conn:
-        result = conn.execute(text(f"""
-            SELECT sValorChaveOrigem, sValorChaveDestino 
-            FROM CONTROLE_MIGRACAO_LEGADO
-            WHERE sCdTenant = '{tenant_id}'
-              AND sTabelaOrigem = 'PET_ANIMAL_VACINA'
-              AND sTabelaDestino = 'PET_VACINA'
-        """))
-        for row in result:
-            aplicacoes_migradas[int(row[0])] = row[1]
+    aplicacoes_migradas = mapping_cache.load(dest_engine, tenant_id, "PET_ANIMAL_VACINA", "PET_VACINA")
     print(f"✓ {len(aplicacoes_migradas)} aplicações")
     
-    print("\n🔄 Carregando registros da origem...")
-    
-    # Consulta principal - pegar todas as aplicações
-    select_sql = text("""
-        SELECT 
-            Codigo,
-            Animal,
-            Vacina,
-            DataAplicacao,
-            DataPrevista,
-            Partida,
-            Laboratorio
-        FROM PET_ANIMAL_VACINA
-        ORDER BY Codigo
-    """)
+    # 4. Hashes do conteúdo já gravado (pula UPDATEs sem mudança)
+    hashes_gravados = {}
+    if not dry_run:
+        print("  - Hashes das aplicações gravadas...", end=" ", flush=True)
+        hashes_gravados = carregar_hashes(dest_engine, tenant_id, "PET_VACINA")
+        print(f"✓ {len(hashes_gravados)} hashes")
+    
+    print("\n🔄 Processando aplicações...")
     
     # Estatísticas
     total = 0
     sem_pet = 0
     sem_vacina = 0
+    inseridos = 0
+    atualizados = 0
+    inalterados = 0
     
-    aplicacoes_para_inserir = []
-    aplicacoes_para_atualizar = []
-    controle_para_inserir = []
+    # Leitura paginada por Codigo (keyset): cada página é um lote confirmado
+    paginas = iterar_paginas(
+        legacy_engine, "PET_ANIMAL_VACINA",
+        "Codigo, Animal, Vacina, DataAplicacao, DataPrevista, Partida, Laboratorio",
+        batch_size, ultimo_codigo, codigos_alterados, com_fingerprint=incremental
+    )
     
-    with legacy_engine.connect() as conn:
-        result = conn.execute(select_sql)
-        all_rows = result.fetchall()
-        
-        print(f"  Total de aplicações no legado: {len(all_rows)}\n")
+    for rows in paginas:
+        aplicacoes_para_inserir = []
+        aplicacoes_para_atualizar = []
+        controle_para_inserir = []
+        fingerprints = {}
         
-        for row in all_rows:
+        for row in rows:
             total += 1
             
-            if total % 1000 == 0:
-                print(f"  [{total}] Processando...", flush=True)
-            
             codigo_aplicacao = int(row.Codigo)
             codigo_animal = int(row.Animal) if row.Animal else None
             codigo_vacina = int(row.Vacina) if row.Vacina else None
+            ultimo_codigo = max(ultimo_codigo, codigo_aplicacao)
             
             # Validar dependências (usando dados em memória)
             if not codigo_animal or codigo_animal not in pets_map:
@@ -206,6 +289,8 @@ def migrate_aplicacoes_vacinas_bulk(batch_size=1000, dry_run=False):
             
             # Mapear registro
             aplicacao = map_origem_to_destino(row, tenant_id, sCdPet, sCdVacina)
+            if incremental:
+                fingerprints[codigo_aplicacao] = row.bFingerprint
             
             if dry_run:
                 aplicacoes_para_inserir.append(aplicacao)
@@ -233,95 +318,49 @@ def migrate_aplicacoes_vacinas_bulk(batch_size=1000, dry_run=False):
                     'sValorChaveDestino': sCdPetVacina,
                     'dtMigracao': datetime.now()
                 })
+        
+        hashes = {}
+        if not dry_run:
+            # Só vão para o UPDATE as aplicações cujo conteúdo mudou desde a última gravação
+            total_atualizar = len(aplicacoes_para_atualizar)
+            aplicacoes_para_atualizar, hashes = filtrar_alterados(
+                aplicacoes_para_atualizar, "sCdPetVacina", PET_VACINA_HASH_COLUMNS, hashes_gravados
+            )
+            inalterados += total_atualizar - len(aplicacoes_para_atualizar)
+            hashes.update(calcular_hashes(aplicacoes_para_inserir, "sCdPetVacina", PET_VACINA_HASH_COLUMNS))
+        
+        inseridos += len(aplicacoes_para_inserir)
+        atualizados += len(aplicacoes_para_atualizar)
+        
+        if not dry_run:
+            gravar_lote_aplicacoes(
+                dest_engine, tenant_id,
+                aplicacoes_para_inserir, aplicacoes_para_atualizar, controle_para_inserir,
+                ultimo_codigo, chunk_size=batch_size, fingerprints=fingerprints, hashes=hashes
+            )
+            hashes_gravados.update(hashes)
+        
+        print(f"  [{total:,}] Processados (inseridos: {inseridos:,}, atualizados: {atualizados:,}, "
+              f"inalterados: {inalterados:,}, último Codigo: {ultimo_codigo})", flush=True)
     
     if dry_run:
         print(f"\n[DRY-RUN] Simulação concluída!")
         print(f"  Total processado: {total}")
-        print(f"  Seriam inseridos: {len(aplicacoes_para_inserir)}")
-        print(f"  Seriam atualizados: {len(aplicacoes_para_atualizar)}")
+        print(f"  Seriam inseridos: {inseridos}")
+        print(f"  Seriam atualizados: {atualizados}")
         print(f"  Sem pet migrado: {sem_pet}")
         print(f"  Sem vacina migrada: {sem_vacina}")
         return total
     
-    print(f"\n💾 Salvando no banco de dados...")
-    
-    # BULK INSERT de aplicações novas
-    if aplicacoes_para_inserir:
-        print(f"  - Inserindo {len(aplicacoes_para_inserir)} aplicações novas...", end=" ", flush=True)
-        with dest_engine.begin() as conn:
-            conn.execute(text("""
-                INSERT INTO PET_VACINA (
-                    sCdPetVacina, sCdTenant, sCdPet, sCdVacina, sCdUsuario,
-                    sDsPartida, tDtPrevista, tDtAplicacao, sDsLaboratorio,
-                    sDsLocalAplicacao, bFlPreAutorizado, tDtCriacao, tDtAlteracao
-                )
-                VALUES (
-                    :sCdPetVacina, :sCdTenant, :sCdPet, :sCdVacina, :sCdUsuario,
-                    :sDsPartida, :tDtPrevista, :tDtAplicacao, :sDsLaboratorio,
-                    :sDsLocalAplicacao, :bFlPreAutorizado, :tDtCriacao, :tDtAlteracao
-                )
-            """), aplicacoes_para_inserir)
-        print("✓")
-    
-    # BULK UPDATE de aplicações existentes
-    if aplicacoes_para_atualizar:
-        print(f"  - Atualizando {len(aplicacoes_para_atualizar)} aplicações existentes...", end=" ", flush=True)
-        with dest_engine.begin() as conn:
-            for aplicacao in aplicacoes_para_atualizar:
-                conn.execute(text("""
-                    UPDATE PET_VACINA SET
-                        sCdPet = :sCdPet,
-                        sCdVacina = :sCdVacina,
-                        sCdUsuario = :sCdUsuario,
-                        sDsPartida = :sDsPartida,
-                        tDtPrevista = :tDtPrevista,
-                        tDtAplicacao = :tDtAplicacao,
-                        sDsLaboratorio = :sDsLaboratorio,
-                        sDsLocalAplicacao = :sDsLocalAplicacao,
-                        bFlPreAutorizado = :bFlPreAutorizado,
-                        tDtAlteracao = :tDtAlteracao
-                    WHERE sCdPetVacina = :sCdPetVacina
-                """), aplicacao)
-        print("✓")
-    
-    # BULK INSERT na tabela de controle
-    if controle_para_inserir:
-        print(f"  - Registrando {len(controle_para_inserir)} mapeamentos...", end=" ", flush=True)
-        with dest_engine.begin() as conn:
-            # Deletar registros antigos antes de inserir (evitar duplicatas)
-            # Fazer em chunks de 1000 para evitar limite de SQL
-            codigos_origem = [c['sValorChaveOrigem'] for c in controle_para_inserir]
-            if codigos_origem:
-                for i in range(0, len(codigos_origem), 1000):
-                    chunk = codigos_origem[i:i+1000]
-                    placeholders = ','.join([f"'{c}'" for c in chunk])
-                    conn.execute(text(f"""
-                        DELETE FROM CONTROLE_MIGRACAO_LEGADO
-                        WHERE sCdTenant = '{tenant_id}'
-                        AND sTabelaOrigem = 'PET_ANIMAL_VACINA'
-                        AND sValorChaveOrigem IN ({placeholders})
-                    """))
-            
-            # Inserir novos registros (também em chunks de 1000)
-            for i in range(0, len(controle_para_inserir), 1000):
-                chunk = controle_para_inserir[i:i+1000]
-                conn.execute(text("""
-                    INSERT INTO CONTROLE_MIGRACAO_LEGADO (
-                        sCdTenant, sTabelaOrigem, sCampoChaveOrigem, sValorChaveOrigem,
-                        sTabelaDestino, sCampoChaveDestino, sValorChaveDestino, dtMigracao
-                    )
-                    VALUES (
-                        :sCdTenant, :sTabelaOrigem, :sCampoChaveOrigem, :sValorChaveOrigem,
-                        :sTabelaDestino, :sCampoChaveDestino, :sValorChaveDestino, :dtMigracao
-                    )
-                """), chunk)
-        print("✓")
+    # Migração completa: a próxima execução volta a percorrer toda a origem
+    limpar_checkpoint(dest_engine, tenant_id, CHECKPOINT_MIGRACAO)
     
     print("\n" + "="*80)
     print("✓ Migração finalizada!")
     print(f"  Total processado: {total}")
-    print(f"  Inseridos: {len(aplicacoes_para_inserir)}")
-    print(f"  Atualizados: {len(aplicacoes_para_atualizar)}")
+    print(f"  Inseridos: {inseridos}")
+    print(f"  Atualizados: {atualizados}")
+    print(f"  Inalterados (UPDATE pulado): {inalterados}")
     print(f"  Sem pet migrado: {sem_pet}")
     print(f"  Sem vacina migrada: {sem_vacina}")
     print("="*80 + "\n")
@@ -335,7 +374,10 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Migração de Aplicações de Vacinas (BULK)")
     parser.add_argument("--batch-size", type=int, default=1000, help="Tamanho do batch")
     parser.add_argument("--dry-run", action="store_true", help="Simula migração sem inserir dados")
+    parser.add_argument("--reiniciar", action="store_true", help="Ignora o checkpoint e recomeça do início")
+    parser.add_argument("--incremental", action="store_true", help="Migra apenas registros novos ou alterados")
     
     args = parser.parse_args()
     
-    migrate_aplicacoes_vacinas_bulk(batch_size=args.batch_size, dry_run=args.dry_run)
+    migrate_aplicacoes_vacinas_bulk(batch_size=args.batch_size, dry_run=args.dry_run, reiniciar=args.reiniciar,
+                                    incremental=args.incremental)
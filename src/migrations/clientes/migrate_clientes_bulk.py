@@ -0,0 +1,310 @@
+"""
+Migração de Clientes - Bulk Insert Otimizado
+PET_CLIENTE (origem) -> PESSOA + PESSOA_TIPO (destino)
+
+Pré-carrega os documentos (sNrDoc -> sCdPessoa) já existentes na tenant,
+separa inserts e updates em memória e grava PESSOA, PESSOA_TIPO e
+CONTROLE_MIGRACAO_LEGADO em lotes (executemany), em vez de abrir uma
+transação por cliente.
+
+Mantém a regra da versão linha a linha: se o documento já existir na tenant,
+a pessoa é ATUALIZADA (e recebe o tipo CLIENTE se ainda não tiver);
+caso contrário, é INSERIDA.
+"""
+import sys
+from pathlib import Path
+from datetime import datetime
+
+# Adicionar src ao path para imports funcionarem
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from sqlalchemy import text, bindparam
+from common.db_utils import get_engine_from_env, ensure_controle_table, insert_controle_bulk, get_tenant_id
+from common.mapping_cache import mapping_cache
+from common.staging_utils import bulk_update_via_staging
+from common.incremental import preparar_incremental, iterar_paginas, salvar_fingerprints
+from migrations.clientes.migrate_clientes import map_cliente_to_pessoa
+
+
+INSERT_PESSOA_SQL = text("""
+INSERT INTO PESSOA (
+    sCdTenant, sCdPessoa, sNmPessoa, sNmFantasia, sNrDoc, sIdFisicaJuridica,
+    sDsEmail, sNrTelefone1, sNrTelefone2, sDsEndereco, nNrEndereco, sDsComplemento,
+    sNmBairro, nNrCep, sCdCidade, sDsObservacoes, bFlAtivo, tDtCadastro
+)
+VALUES (
+    :sCdTenant, :sCdPessoa, :sNmPessoa, :sNmFantasia, :sNrDoc, :sIdFisicaJuridica,
+    :sDsEmail, :sNrTelefone1, :sNrTelefone2, :sDsEndereco, :nNrEndereco, :sDsComplemento,
+    :sNmBairro, :nNrCep, :sCdCidade, :sDsObservacoes, :bFlAtivo, :tDtCadastro
+)
+""")
+
+# Colunas de PESSOA atualizadas quando o documento já existe na tenant
+PESSOA_UPDATE_COLUMNS = [
+    "sNmPessoa", "sNmFantasia", "sIdFisicaJuridica", "sDsEmail", "sNrTelefone1",
+    "sNrTelefone2", "sDsEndereco", "nNrEndereco", "sDsComplemento", "sNmBairro",
+    "nNrCep", "sCdCidade", "sDsObservacoes", "bFlAtivo", "tDtCadastro",
+]
+
+INSERT_TIPO_SQL = text("""
+INSERT INTO PESSOA_TIPO (sCdPessoaTipo, sCdPessoa, nCdTipo, tDtAssociacao, bFlAtivo)
+VALUES (NEWID(), :sCdPessoa, 2, GETDATE(), 1)
+""")
+
+DELETE_CONTROLE_SQL = text("""
+DELETE FROM CONTROLE_MIGRACAO_LEGADO
+WHERE sCdTenant = :tenant
+  AND sTabelaOrigem = 'PET_CLIENTE'
+  AND sTabelaDestino = 'PESSOA'
+  AND sValorChaveOrigem IN :codigos
+""").bindparams(bindparam("codigos", expanding=True))
+
+
+def carregar_documentos_existentes(dest_engine, tenant_id: str):
+    """Retorna dict {sNrDoc: sCdPessoa} com as pessoas já cadastradas na tenant."""
+    documentos = {}
+    with dest_engine.connect() as conn:
+        result = conn.execute(text("""
+            SELECT sNrDoc, sCdPessoa
+            FROM PESSOA
+            WHERE sCdTenant = :tenant
+        """), {"tenant": tenant_id})
+
+        for row in result:
+            # Mesmo comportamento do SELECT ... fetchone(): fica o primeiro encontrado
+            documentos.setdefault(row[0], str(row[1]))
+
+    return documentos
+
+
+def carregar_pessoas_cliente(dest_engine, tenant_id: str):
+    """Retorna set com os sCdPessoa da tenant que já possuem o tipo CLIENTE (nCdTipo=2)."""
+    pessoas = set()
+    with dest_engine.connect() as conn:
+        result = conn.execute(text("""
+            SELECT pt.sCdPessoa
+            FROM PESSOA_TIPO pt
+            INNER JOIN PESSOA p ON p.sCdPessoa = pt.sCdPessoa
+            WHERE p.sCdTenant = :tenant AND pt.nCdTipo = 2
+        """), {"tenant": tenant_id})
+
+        for row in result:
+            pessoas.add(str(row[0]))
+
+    return pessoas
+
+
+def carregar_controle_clientes(dest_engine, tenant_id: str):
+    """Retorna dict {Codigo: sCdPessoa} dos clientes já registrados na tabela de controle."""
+    return mapping_cache.load(dest_engine, tenant_id, "PET_CLIENTE", "PESSOA")
+
+
+def migrate_clientes_bulk(batch_size: int = 1000, dry_run: bool = False, incremental: bool = False):
+    """
+    Migração BULK de clientes.
+
+    Estratégia de otimização:
+    1. Carregar documentos, tipos CLIENTE e controle da tenant (3 queries)
+    2. Ler PET_CLIENTE em lotes e separar inserts/updates em memória
+    3. Gravar PESSOA, PESSOA_TIPO e controle em lotes (updates via tabela de staging)
+
+    Em modo incremental só são lidos os clientes novos (acima do watermark) e os alterados.
+
+    Args:
+        batch_size: Tamanho do lote de leitura e de escrita (padrão: 1000)
+        dry_run: Se True, apenas simula (não grava dados)
+        incremental: Lê apenas o delta desde a última execução (common.incremental)
+
+    Returns:
+        dict: Estatísticas da migração
+    """
+    print("\n" + "="*80)
+    print("MIGRAÇÃO: PET_CLIENTE -> PESSOA (BULK)")
+    print("="*80 + "\n")
+
+    if dry_run:
+        print("🔍 MODO DRY-RUN (simulação)")
+        print("   Nenhum dado será inserido no banco de dados\n")
+
+    legacy_engine = get_engine_from_env("LEGACY_DB_URL")
+    dest_engine = get_engine_from_env("DEST_DB_URL")
+    tenant_id = get_tenant_id()
+
+    # Garantir que a tabela de controle exista
+    if not dry_run:
+        ensure_controle_table(dest_engine, tenant_id)
+
+    # ==================================================================
+    # FASE 1: PRE-CARREGAR DADOS DO DESTINO
+    # ==================================================================
+    print("📊 Carregando dados de referência...")
+
+    print("  - Documentos existentes...", end=" ", flush=True)
+    documentos = carregar_documentos_existentes(dest_engine, tenant_id)
+    print(f"✓ {len(documentos):,} documentos")
+
+    print("  - Pessoas com tipo CLIENTE...", end=" ", flush=True)
+    pessoas_cliente = carregar_pessoas_cliente(dest_engine, tenant_id)
+    print(f"✓ {len(pessoas_cliente):,} pessoas")
+
+    print("  - Clientes já migrados...", end=" ", flush=True)
+    controle_existente = carregar_controle_clientes(dest_engine, tenant_id) if not dry_run else {}
+    print(f"✓ {len(controle_existente):,} mapeamentos")
+
+    # ==================================================================
+    # FASE 2: LER E CLASSIFICAR REGISTROS DA ORIGEM
+    # ==================================================================
+    print("\n🔄 Processando clientes da origem...")
+
+    pessoas_para_inserir = []
+    pessoas_para_atualizar = []
+    tipos_para_inserir = []
+    controle_para_inserir = []
+    controle_para_substituir = []
+    fingerprints = {}
+
+    stats = {
+        'total': 0,
+        'inseridos': 0,
+        'atualizados': 0,
+    }
+
+    ultimo_codigo = -1
+    codigos_alterados = []
+    if incremental and not dry_run:
+        ultimo_codigo, codigos_alterados = preparar_incremental(legacy_engine, dest_engine, tenant_id, "PET_CLIENTE")
+
+    paginas = iterar_paginas(
+        legacy_engine, "PET_CLIENTE", "*", batch_size,
+        ultimo_codigo, codigos_alterados, com_fingerprint=incremental
+    )
+
+    for rows in paginas:
+        for r in rows:
+            row = dict(r._mapping)
+            codigo = int(row.get("Codigo"))
+            fingerprint = row.pop("bFingerprint", None)
+            if incremental:
+                fingerprints[codigo] = fingerprint
+            pessoa = map_cliente_to_pessoa(row, tenant_id)
+            documento = pessoa["sNrDoc"]
+
+            stats['total'] += 1
+
+            if documento in documentos:
+                # Documento já existe na tenant: atualizar a pessoa existente
+                pessoa["sCdPessoa"] = documentos[documento]
+                pessoas_para_atualizar.append(pessoa)
+                stats['atualizados'] += 1
+            else:
+                # Documento novo: inserir (próximas linhas com o mesmo documento viram update)
+                documentos[documento] = pessoa["sCdPessoa"]
+                pessoas_para_inserir.append(pessoa)
+                stats['inseridos'] += 1
+
+            sCdPessoa = pessoa["sCdPessoa"]
+
+            # Garantir tipo CLIENTE (nCdTipo=2) uma única vez por pessoa
+            if sCdPessoa not in pessoas_cliente:
+                pessoas_cliente.add(sCdPessoa)
+                tipos_para_inserir.append({"sCdPessoa": sCdPessoa})
+
+            # Registrar mapeamento apenas se for novo ou se o destino mudou
+            destino_atual = controle_existente.get(codigo)
+            if destino_atual != sCdPessoa:
+                if destino_atual is not None:
+                    controle_para_substituir.append(str(codigo))
+                controle_existente[codigo] = sCdPessoa
+                controle_para_inserir.append({
+                    'sCdTenant': tenant_id,
+                    'sTabelaOrigem': 'PET_CLIENTE',
+                    'sCampoChaveOrigem': 'Codigo',
+                    'sValorChaveOrigem': str(codigo),
+                    'sTabelaDestino': 'PESSOA',
+                    'sCampoChaveDestino': 'sCdPessoa',
+                    'sValorChaveDestino': sCdPessoa,
+                    'dtMigracao': datetime.now()
+                })
+
+        print(f"  Processando: {stats['total']:,} registros...")
+
+    print(f"  ✓ Processamento concluído!")
+    print(f"    - Para inserir: {len(pessoas_para_inserir):,}")
+    print(f"    - Para atualizar: {len(pessoas_para_atualizar):,}")
+    print(f"    - Tipos CLIENTE a adicionar: {len(tipos_para_inserir):,}")
+    print(f"    - Mapeamentos a registrar: {len(controle_para_inserir):,}\n")
+
+    if dry_run:
+        print("[DRY-RUN] Simulação concluída. Nenhum dado foi inserido.\n")
+        return stats
+
+    # ==================================================================
+    # FASE 3: GRAVAR EM LOTES
+    # ==================================================================
+    print("💾 Salvando no banco de dados...")
+
+    with dest_engine.begin() as conn:
+        if pessoas_para_inserir:
+            print(f"  - Inserindo {len(pessoas_para_inserir):,} pessoas novas...", end=" ", flush=True)
+            for i in range(0, len(pessoas_para_inserir), batch_size):
+                conn.execute(INSERT_PESSOA_SQL, pessoas_para_inserir[i:i + batch_size])
+            print("✓")
+
+        if pessoas_para_atualizar:
+            print(f"  - Atualizando {len(pessoas_para_atualizar):,} pessoas existentes...", end=" ", flush=True)
+            bulk_update_via_staging(
+                conn, "PESSOA",
+                key_columns=["sCdPessoa"],
+                update_columns=PESSOA_UPDATE_COLUMNS,
+                rows=pessoas_para_atualizar,
+                chunk_size=batch_size
+            )
+            print("✓")
+
+        if tipos_para_inserir:
+            print(f"  - Adicionando {len(tipos_para_inserir):,} tipos CLIENTE...", end=" ", flush=True)
+            for i in range(0, len(tipos_para_inserir), batch_size):
+                conn.execute(INSERT_TIPO_SQL, tipos_para_inserir[i:i + batch_size])
+            print("✓")
+
+        if controle_para_inserir:
+            print(f"  - Registrando {len(controle_para_inserir):,} mapeamentos...", end=" ", flush=True)
+            for i in range(0, len(controle_para_substituir), 1000):
+                conn.execute(DELETE_CONTROLE_SQL, {
+                    "tenant": tenant_id,
+                    "codigos": controle_para_substituir[i:i + 1000]
+                })
+            insert_controle_bulk(conn, controle_para_inserir, chunk_size=batch_size)
+            print("✓")
+
+        # Fingerprints confirmados junto com os dados (modo incremental)
+        salvar_fingerprints(conn, tenant_id, "PET_CLIENTE", fingerprints, chunk_size=batch_size)
+
+    # Transação confirmada: refletir os novos mapeamentos no cache do processo
+    mapping_cache.register_controle(controle_para_inserir)
+
+    # ==================================================================
+    # ESTATÍSTICAS FINAIS
+    # ==================================================================
+    print("\n" + "="*80)
+    print("✓ Migração finalizada!")
+    print("="*80)
+    print(f"  Total processado: {stats['total']:,}")
+    print(f"  Inseridos: {stats['inseridos']:,}")
+    print(f"  Atualizados: {stats['atualizados']:,}")
+    print("="*80 + "\n")
+
+    return stats
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Migração de Clientes (Bulk)")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Tamanho do lote")
+    parser.add_argument("--dry-run", action="store_true", help="Simula migração sem inserir dados")
+    parser.add_argument("--incremental", action="store_true", help="Migra apenas registros novos ou alterados")
+
+    args = parser.parse_args()
+
+    migrate_clientes_bulk(batch_size=args.batch_size, dry_run=args.dry_run, incremental=args.incremental)
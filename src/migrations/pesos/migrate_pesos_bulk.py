@@ -17,10 +17,39 @@ import uuid
 # Adicionar src ao path para imports funcionarem
 sys.path.insert(0, str(Path(__file__).parent.parent.parent))
 
-from sqlalchemy import text
-from common.db_utils import get_engine_from_env, get_tenant_id
+from sqlalchemy import text, bindparam
+from common.db_utils import get_engine_from_env, ensure_controle_table, get_tenant_id, bulk_insert, insert_controle_bulk
+from common.mapping_cache import mapping_cache
+from common.staging_utils import bulk_update_via_staging
+from common.checkpoint import carregar_checkpoint, salvar_checkpoint, limpar_checkpoint
+from common.incremental import preparar_incremental, iterar_paginas, salvar_fingerprints
+from common.row_hash import carregar_hashes, calcular_hashes, filtrar_alterados, salvar_hashes
 
 
+# Colunas de PET_PESO gravadas na inserção de pesos novos
+PET_PESO_INSERT_COLUMNS = [
+    "sCdPetPeso", "sCdTenant", "sCdPet", "sCdUsuario",
+    "nVlPeso", "nVlMedida", "tDtPesagem", "sDsObservacoes",
+    "tDtCriacao", "tDtAlteracao",
+]
+
+# Colunas de PET_PESO atualizadas quando o peso já foi migrado
+PET_PESO_UPDATE_COLUMNS = ["sCdPet", "sCdUsuario", "nVlPeso", "tDtPesagem", "tDtAlteracao"]
+
+# Colunas do hash de conteúdo (sem o timestamp de alteração)
+PET_PESO_HASH_COLUMNS = [c for c in PET_PESO_UPDATE_COLUMNS if c != "tDtAlteracao"]
+
+# Nome da migração na tabela de checkpoints
+CHECKPOINT_MIGRACAO = "pesos"
+
+DELETE_CONTROLE_PESOS_SQL = text("""
+    DELETE FROM CONTROLE_MIGRACAO_LEGADO
+    WHERE sCdTenant = :tenant
+      AND sTabelaOrigem = 'PET_ANIMAL_PESO'
+      AND sTabelaDestino = 'PET_PESO'
+      AND sValorChaveOrigem IN :codigos
+""").bindparams(bindparam("codigos", expanding=True))
+
 def get_default_vet_user_id():
     """Retorna o ID do usuário veterinário padrão do .env."""
     import os
@@ -80,21 +109,84 @@ def map_origem_to_destino(row, tenant_id: str, sCdPet: str, sCdUsuario: str):
     }
 
 
-def migrate_pesos_bulk(batch_size: int = 1000, dry_run: bool = False):
+def gravar_lote_pesos(dest_engine, tenant_id: str, pesos_para_inserir: list,
+                      pesos_para_atualizar: list, controle_para_inserir: list,
+                      ultimo_codigo: int, chunk_size: int = 1000, fingerprints: dict = None,
+                      hashes: dict = None):
+    """
+    Grava um lote de pesos (inserts, updates, controle e checkpoint) em uma única transação.
+    
+    Args:
+        dest_engine: Engine do banco destino
+        tenant_id: ID da tenant
+        pesos_para_inserir: Pesos novos (já com sCdPetPeso)
+        pesos_para_atualizar: Pesos já migrados
+        controle_para_inserir: Registros de controle dos pesos novos
+        ultimo_codigo: Maior Codigo do legado do lote (high-water mark)
+        chunk_size: Registros por comando
+        fingerprints: {Codigo: SHA-256 da linha} dos registros gravados (modo incremental)
+        hashes: {sCdPetPeso: hash} do conteúdo gravado (common.row_hash)
+    """
+    with dest_engine.begin() as conn:
+        # Inserir novos pesos
+        if pesos_para_inserir:
+            bulk_insert(conn, "PET_PESO", PET_PESO_INSERT_COLUMNS, pesos_para_inserir, chunk_size=chunk_size)
+        
+        # Atualizar pesos existentes (via tabela de staging)
+        if pesos_para_atualizar:
+            agora = datetime.now()
+            for peso in pesos_para_atualizar:
+                peso['tDtAlteracao'] = agora
+            
+            bulk_update_via_staging(
+                conn, "PET_PESO",
+                key_columns=["sCdPetPeso", "sCdTenant"],
+                update_columns=PET_PESO_UPDATE_COLUMNS,
+                rows=pesos_para_atualizar,
+                chunk_size=chunk_size
+            )
+        
+        # Registrar controle (deletar registros antigos primeiro, em chunks)
+        if controle_para_inserir:
+            codigos_origem = [c['sValorChaveOrigem'] for c in controle_para_inserir]
+            for i in range(0, len(codigos_origem), 1000):
+                conn.execute(DELETE_CONTROLE_PESOS_SQL, {
+                    "tenant": tenant_id,
+                    "codigos": codigos_origem[i:i + 1000]
+                })
+            
+            insert_controle_bulk(conn, controle_para_inserir, chunk_size=chunk_size)
+        
+        # Checkpoint, fingerprints e hashes confirmados junto com os dados do lote
+        salvar_checkpoint(conn, tenant_id, CHECKPOINT_MIGRACAO, ultimo_codigo)
+        salvar_fingerprints(conn, tenant_id, "PET_ANIMAL_PESO", fingerprints, chunk_size=chunk_size)
+        salvar_hashes(conn, tenant_id, "PET_PESO", hashes, chunk_size=chunk_size)
+    
+    # Transação confirmada: refletir os novos mapeamentos no cache do processo
+    mapping_cache.register_controle(controle_para_inserir)
+
+
+def migrate_pesos_bulk(batch_size: int = 1000, dry_run: bool = False, reiniciar: bool = False,
+                       incremental: bool = False):
     """
     Migração BULK de pesos dos pets.
     
     Estratégia de otimização:
     1. Carregar TODOS os mapeamentos de pets (1 query)
     2. Carregar TODOS os pesos já migrados (1 query)
-    3. Processar TODOS os registros em memória
-    4. Bulk INSERT de todos os novos registros (1 query)
-    5. UPDATE de registros existentes (se houver)
-    6. Registrar controle em lotes
+    3. Ler a origem em páginas de batch_size registros (keyset por Codigo)
+    4. Bulk INSERT dos novos registros de cada página
+    5. UPDATE em massa dos registros existentes cujo hash de conteúdo mudou (tabela de staging)
+    6. Registrar controle e checkpoint na mesma transação da página
+    
+    Se a execução for interrompida, a próxima retoma após a última página confirmada.
+    Em modo incremental só são lidos os pesos novos (acima do watermark) e os alterados.
     
     Args:
-        batch_size: Tamanho do lote para controle (padrão: 1000)
+        batch_size: Registros por página de leitura/gravação (padrão: 1000)
         dry_run: Se True, apenas simula (não insere dados)
+        reiniciar: Ignora o checkpoint e processa desde o início
+        incremental: Lê apenas o delta desde a última execução (common.incremental)
     
     Returns:
         int: Total de registros processados
@@ -113,8 +205,21 @@ def migrate_pesos_bulk(batch_size: int = 1000, dry_run: bool = False):
     tenant_id = get_tenant_id()
     vet_user_id = get_default_vet_user_id()
     
+    # Garantir tabela de controle e índices de busca; ler o checkpoint
+    ultimo_codigo = -1
+    if not dry_run:
+        ensure_controle_table(dest_engine, tenant_id)
+        
+        if reiniciar:
+            limpar_checkpoint(dest_engine, tenant_id, CHECKPOINT_MIGRACAO)
+        checkpoint = carregar_checkpoint(dest_engine, tenant_id, CHECKPOINT_MIGRACAO)
+        if checkpoint is not None:
+            ultimo_codigo = checkpoint
+    
     print(f"🔑 Tenant ID: {tenant_id}")
     print(f"👨‍⚕️  Veterinário ID: {vet_user_id}\n")
+    if ultimo_codigo >= 0:
+        print(f"⏯  Retomando após o checkpoint: Codigo > {ultimo_codigo}\n")
     
     # ==================================================================
     # FASE 1: PRE-CARREGAR MAPEAMENTOS (otimização)
@@ -123,210 +228,123 @@ def migrate_pesos_bulk(batch_size: int = 1000, dry_run: bool = False):
     
     # Mapeamento de pets (Animal -> sCdPet)
     print("  - Mapeamento de pets...", end=" ", flush=True)
-    pets_map = {}
-    with dest_engine.connect() as conn:
-        result = conn.execute(text(f"""
-            SELECT sValorChaveOrigem, sValorChaveDestino
-            FROM CONTROLE_MIGRACAO_LEGADO
-            WHERE sCdTenant = '{tenant_id}'
-              AND sTabelaOrigem = 'PET_ANIMAL'
-              AND sTabelaDestino = 'PET'
-        """))
-        
-        for row in result:
-            pets_map[int(row.sValorChaveOrigem)] = row.sValorChaveDestino
+    pets_map = mapping_cache.load(dest_engine, tenant_id, "PET_ANIMAL", "PET")
     
     print(f"✓ {len(pets_map):,} pets mapeados")
     
     # Pesos já migrados (para update)
     print("  - Pesos já migrados...", end=" ", flush=True)
-    pesos_migrados = {}
-    with dest_engine.connect() as conn:
-        result = conn.execute(text(f"""
-            SELECT sValorChaveOrigem, sValorChaveDestino
-            FROM CONTROLE_MIGRACAO_LEGADO
-            WHERE sCdTenant = '{tenant_id}'
-              AND sTabelaOrigem = 'PET_ANIMAL_PESO'
-              AND sTabelaDestino = 'PET_PESO'
-        """))
-        
-        for row in result:
-            pesos_migrados[int(row.sValorChaveOrigem)] = row.sValorChaveDestino
+    pesos_migrados = mapping_cache.load(dest_engine, tenant_id, "PET_ANIMAL_PESO", "PET_PESO")
     
     print(f"✓ {len(pesos_migrados):,} pesos")
     
-    # ==================================================================
-    # FASE 2: CARREGAR TODOS OS REGISTROS DA ORIGEM
-    # ==================================================================
-    print("\n🔄 Carregando registros da origem...")
-    
-    with origem_engine.connect() as conn:
-        result = conn.execute(text("""
-            SELECT Codigo, Animal, Data, Peso
-            FROM PET_ANIMAL_PESO
-            ORDER BY Codigo
-        """))
-        
-        all_rows = result.fetchall()
+    # Hashes do conteúdo já gravado (pula UPDATEs sem mudança)
+    hashes_gravados = {}
+    if not dry_run:
+        print("  - Hashes dos pesos gravados...", end=" ", flush=True)
+        hashes_gravados = carregar_hashes(dest_engine, tenant_id, "PET_PESO")
+        print(f"✓ {len(hashes_gravados):,} hashes")
     
-    total = len(all_rows)
-    print(f"  Total de pesos no legado: {total:,}\n")
+    codigos_alterados = []
+    if incremental and not dry_run:
+        watermark, codigos_alterados = preparar_incremental(origem_engine, dest_engine, tenant_id, "PET_ANIMAL_PESO")
+        ultimo_codigo = max(ultimo_codigo, watermark)
     
     if dry_run:
-        print(f"[DRY-RUN] Seriam processados {total:,} registros")
+        with origem_engine.connect() as conn:
+            total = conn.execute(text("SELECT COUNT(*) FROM PET_ANIMAL_PESO")).scalar()
+        print(f"\n[DRY-RUN] Seriam processados {total:,} registros")
         print(f"[DRY-RUN] Pets disponíveis: {len(pets_map):,}")
         print(f"[DRY-RUN] Pesos já migrados: {len(pesos_migrados):,}")
         return total
     
     # ==================================================================
-    # FASE 3: PROCESSAR TODOS OS REGISTROS EM MEMÓRIA
+    # FASE 2: PROCESSAR E GRAVAR A ORIGEM PÁGINA A PÁGINA
     # ==================================================================
-    print("⚙️  Processando registros em memória...")
-    
-    pesos_para_inserir = []
-    pesos_para_atualizar = []
-    controle_para_inserir = []
+    print("\n🔄 Processando pesos...")
     
     stats = {
         'total': 0,
         'inseridos': 0,
         'atualizados': 0,
+        'inalterados': 0,
         'sem_pet': 0
     }
     
-    for i, row in enumerate(all_rows, 1):
-        stats['total'] += 1
-        
-        # Progresso
-        if i % 1000 == 0:
-            print(f"  Processando: {i:,}/{total:,} registros...")
-        
-        codigo_origem = int(row.Codigo)
-        animal_id = int(row.Animal)
-        
-        # Verificar se pet foi migrado
-        if animal_id not in pets_map:
-            stats['sem_pet'] += 1
-            continue
-        
-        sCdPet = pets_map[animal_id]
-        
-        # Mapear para destino
-        peso = map_origem_to_destino(row, tenant_id, sCdPet, vet_user_id)
-        
-        # Verificar se já foi migrado
-        if codigo_origem in pesos_migrados:
-            # Atualizar
-            peso['sCdPetPeso'] = pesos_migrados[codigo_origem]
-            pesos_para_atualizar.append(peso)
-            stats['atualizados'] += 1
-        else:
-            # Inserir
-            pesos_para_inserir.append(peso)
-            stats['inseridos'] += 1
-            
-            # Registro de controle
-            controle_para_inserir.append({
-                'sCdTenant': tenant_id,
-                'sTabelaOrigem': 'PET_ANIMAL_PESO',
-                'sCampoChaveOrigem': 'Codigo',
-                'sValorChaveOrigem': str(codigo_origem),
-                'sTabelaDestino': 'PET_PESO',
-                'sCampoChaveDestino': 'sCdPetPeso',
-                'sValorChaveDestino': peso['sCdPetPeso'],
-                'dtMigracao': datetime.now()
-            })
-    
-    print(f"  ✓ Processamento concluído!")
-    print(f"    - Para inserir: {len(pesos_para_inserir):,}")
-    print(f"    - Para atualizar: {len(pesos_para_atualizar):,}")
-    print(f"    - Sem pet migrado: {stats['sem_pet']:,}\n")
+    paginas = iterar_paginas(
+        origem_engine, "PET_ANIMAL_PESO", "Codigo, Animal, Data, Peso", batch_size,
+        ultimo_codigo, codigos_alterados, com_fingerprint=incremental
+    )
     
-    # ==================================================================
-    # FASE 4: BULK INSERT/UPDATE
-    # ==================================================================
-    print("💾 Salvando no banco de dados...")
-    
-    with dest_engine.begin() as conn:
-        # Inserir novos pesos
-        if pesos_para_inserir:
-            print(f"  - Inserindo {len(pesos_para_inserir):,} pesos novos...", end=" ", flush=True)
-            
-            insert_sql = text("""
-                INSERT INTO PET_PESO (
-                    sCdPetPeso, sCdTenant, sCdPet, sCdUsuario,
-                    nVlPeso, nVlMedida, tDtPesagem, sDsObservacoes,
-                    tDtCriacao, tDtAlteracao
-                )
-                VALUES (
-                    :sCdPetPeso, :sCdTenant, :sCdPet, :sCdUsuario,
-                    :nVlPeso, :nVlMedida, :tDtPesagem, :sDsObservacoes,
-                    :tDtCriacao, :tDtAlteracao
-                )
-            """)
-            
-            conn.execute(insert_sql, pesos_para_inserir)
-            print("✓")
+    for rows in paginas:
+        pesos_para_inserir = []
+        pesos_para_atualizar = []
+        controle_para_inserir = []
+        fingerprints = {}
         
-        # Atualizar pesos existentes
-        if pesos_para_atualizar:
-            print(f"  - Atualizando {len(pesos_para_atualizar):,} pesos existentes...", end=" ", flush=True)
+        for row in rows:
+            stats['total'] += 1
             
-            update_sql = text("""
-                UPDATE PET_PESO
-                SET sCdPet = :sCdPet,
-                    sCdUsuario = :sCdUsuario,
-                    nVlPeso = :nVlPeso,
-                    tDtPesagem = :tDtPesagem,
-                    tDtAlteracao = :tDtAlteracao
-                WHERE sCdPetPeso = :sCdPetPeso
-                  AND sCdTenant = :sCdTenant
-            """)
+            codigo_origem = int(row.Codigo)
+            animal_id = int(row.Animal)
+            ultimo_codigo = max(ultimo_codigo, codigo_origem)
             
-            for peso in pesos_para_atualizar:
-                peso['tDtAlteracao'] = datetime.now()
-                conn.execute(update_sql, peso)
+            # Verificar se pet foi migrado
+            if animal_id not in pets_map:
+                stats['sem_pet'] += 1
+                continue
             
-            print("✓")
-        
-        # Registrar controle em lotes (evitar limite de placeholders)
-        if controle_para_inserir:
-            print(f"  - Registrando {len(controle_para_inserir):,} mapeamentos...", end=" ", flush=True)
+            sCdPet = pets_map[animal_id]
             
-            # Deletar registros antigos primeiro (em chunks)
-            codigos_origem = [c['sValorChaveOrigem'] for c in controle_para_inserir]
+            # Mapear para destino
+            peso = map_origem_to_destino(row, tenant_id, sCdPet, vet_user_id)
+            if incremental:
+                fingerprints[codigo_origem] = row.bFingerprint
             
-            for i in range(0, len(codigos_origem), 1000):
-                chunk = codigos_origem[i:i+1000]
-                placeholders = ','.join([f"'{c}'" for c in chunk])
+            # Verificar se já foi migrado
+            if codigo_origem in pesos_migrados:
+                # Atualizar
+                peso['sCdPetPeso'] = pesos_migrados[codigo_origem]
+                pesos_para_atualizar.append(peso)
+            else:
+                # Inserir
+                pesos_para_inserir.append(peso)
+                stats['inseridos'] += 1
                 
-                delete_sql = text(f"""
-                    DELETE FROM CONTROLE_MIGRACAO_LEGADO
-                    WHERE sCdTenant = '{tenant_id}'
-                      AND sTabelaOrigem = 'PET_ANIMAL_PESO'
-                      AND sTabelaDestino = 'PET_PESO'
-                      AND sValorChaveOrigem IN ({placeholders})
-                """)
-                
-                conn.execute(delete_sql)
-            
-            # Inserir novos registros (em chunks)
-            insert_controle_sql = text("""
-                INSERT INTO CONTROLE_MIGRACAO_LEGADO (
-                    sCdTenant, sTabelaOrigem, sCampoChaveOrigem, sValorChaveOrigem,
-                    sTabelaDestino, sCampoChaveDestino, sValorChaveDestino, dtMigracao
-                )
-                VALUES (
-                    :sCdTenant, :sTabelaOrigem, :sCampoChaveOrigem, :sValorChaveOrigem,
-                    :sTabelaDestino, :sCampoChaveDestino, :sValorChaveDestino, :dtMigracao
-                )
-            """)
-            
-            for i in range(0, len(controle_para_inserir), 1000):
-                chunk = controle_para_inserir[i:i+1000]
-                conn.execute(insert_controle_sql, chunk)
-            
-            print("✓")
+                # Registro de controle
+                controle_para_inserir.append({
+                    'sCdTenant': tenant_id,
+                    'sTabelaOrigem': 'PET_ANIMAL_PESO',
+                    'sCampoChaveOrigem': 'Codigo',
+                    'sValorChaveOrigem': str(codigo_origem),
+                    'sTabelaDestino': 'PET_PESO',
+                    'sCampoChaveDestino': 'sCdPetPeso',
+                    'sValorChaveDestino': peso['sCdPetPeso'],
+                    'dtMigracao': datetime.now()
+                })
+        
+        # Só vão para o UPDATE os pesos cujo conteúdo mudou desde a última gravação
+        total_atualizar = len(pesos_para_atualizar)
+        pesos_para_atualizar, hashes = filtrar_alterados(
+            pesos_para_atualizar, "sCdPetPeso", PET_PESO_HASH_COLUMNS, hashes_gravados
+        )
+        stats['atualizados'] += len(pesos_para_atualizar)
+        stats['inalterados'] += total_atualizar - len(pesos_para_atualizar)
+        hashes.update(calcular_hashes(pesos_para_inserir, "sCdPetPeso", PET_PESO_HASH_COLUMNS))
+        
+        gravar_lote_pesos(
+            dest_engine, tenant_id,
+            pesos_para_inserir, pesos_para_atualizar, controle_para_inserir,
+            ultimo_codigo, chunk_size=batch_size, fingerprints=fingerprints, hashes=hashes
+        )
+        hashes_gravados.update(hashes)
+        
+        print(f"  [{stats['total']:,}] Processados (inseridos: {stats['inseridos']:,}, "
+              f"atualizados: {stats['atualizados']:,}, inalterados: {stats['inalterados']:,}, "
+              f"sem pet: {stats['sem_pet']:,})", flush=True)
+    
+    # Migração completa: a próxima execução volta a percorrer toda a origem
+    limpar_checkpoint(dest_engine, tenant_id, CHECKPOINT_MIGRACAO)
     
     # ==================================================================
     # ESTATÍSTICAS FINAIS
@@ -337,6 +355,7 @@ def migrate_pesos_bulk(batch_size: int = 1000, dry_run: bool = False):
     print(f"  Total processado: {stats['total']:,}")
     print(f"  Inseridos: {stats['inseridos']:,}")
     print(f"  Atualizados: {stats['atualizados']:,}")
+    print(f"  Inalterados (UPDATE pulado): {stats['inalterados']:,}")
     print(f"  Sem pet migrado: {stats['sem_pet']:,}")
     print("="*80 + "\n")
     
@@ -347,9 +366,12 @@ if __name__ == "__main__":
     import argparse
     
     parser = argparse.ArgumentParser(description="Migração de Pesos dos Pets (Bulk)")
-    parser.add_argument("--batch-size", type=int, default=1000, help="Tamanho do lote para controle")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Registros por lote confirmado")
     parser.add_argument("--dry-run", action="store_true", help="Simula migração sem inserir dados")
+    parser.add_argument("--reiniciar", action="store_true", help="Ignora o checkpoint e recomeça do início")
+    parser.add_argument("--incremental", action="store_true", help="Migra apenas registros novos ou alterados")
     
     args = parser.parse_args()
     
-    migrate_pesos_bulk(batch_size=args.batch_size, dry_run=args.dry_run)
+    migrate_pesos_bulk(batch_size=args.batch_size, dry_run=args.dry_run, reiniciar=args.reiniciar,
+                       incremental=args.incremental)
@@ -4,98 +4,53 @@ Migração de Pets (PET_ANIMAL -> PET)
 import uuid
 import os
 from datetime import datetime, date
-from sqlalchemy import text
-from common.db_utils import get_engine_from_env, ensure_controle_table, insert_controle, get_tenant_id
-from common.fuzzy_utils import (
-    buscar_raca_por_nome, 
-    buscar_cor_por_nome, 
-    mapear_sexo, 
-    mapear_porte,
-    mapear_especie_por_raca
+from sqlalchemy import text, bindparam
+from common.db_utils import (
+    get_engine_from_env, ensure_controle_table, insert_controle, get_tenant_id,
+    bulk_insert, insert_controle_bulk
 )
+from common.fuzzy_utils import mapear_sexo, mapear_porte
+from common.mapping_cache import mapping_cache
+from common.reference_catalog import ReferenceCatalog
+from common.staging_utils import bulk_update_via_staging
+from common.incremental import preparar_incremental, iterar_paginas, salvar_fingerprints
+from common.row_hash import carregar_hashes, calcular_hashes, filtrar_alterados, salvar_hashes
 
 
-def get_raca_info_from_legacy(legacy_engine, codigo_raca: int):
-    """Busca informações da raça no banco legado."""
-    select_sql = text("""
-SELECT Descricao, Especie FROM PET_RACA WHERE Codigo = :codigo
-""")
-    
-    with legacy_engine.connect() as conn:
-        result = conn.execute(select_sql, {"codigo": codigo_raca})
-        row = result.fetchone()
-        if row:
-            return {"descricao": row[0], "especie": int(row[1])}
-    return None
+# Colunas de PET gravadas na inserção de pets novos
+PET_INSERT_COLUMNS = [
+    "sCdTenant", "sCdPet", "sCdPessoa", "sNmPet", "nCdEspecie", "nCdRaca",
+    "nCdSexo", "nCdPorte", "nCdCor", "tDtNascimento", "nVlPeso",
+    "sDsObservacoes", "bFlAtivo", "tDtCadastro",
+]
 
+# Colunas de PET atualizadas quando o pet já foi migrado
+PET_UPDATE_COLUMNS = [
+    "sCdPessoa", "sNmPet", "nCdEspecie", "nCdRaca", "nCdSexo", "nCdPorte",
+    "nCdCor", "tDtNascimento", "nVlPeso", "sDsObservacoes", "bFlAtivo", "tDtCadastro",
+]
 
-def get_cor_info_from_legacy(legacy_engine, codigo_cor: int):
-    """Busca descrição da cor no banco legado."""
-    select_sql = text("""
-SELECT Descricao FROM PET_COR WHERE Codigo = :codigo
-""")
-    
-    with legacy_engine.connect() as conn:
-        result = conn.execute(select_sql, {"codigo": codigo_cor})
-        row = result.fetchone()
-        if row:
-            return row[0]
-    return None
-
+# Colunas do hash de conteúdo: tDtCadastro entra pelo valor do legado (None quando
+# ausente ou inválido), não pelo horário atual usado como fallback na gravação
+PET_HASH_COLUMNS = [
+    "tDtCadastroLegado" if c == "tDtCadastro" else c for c in PET_UPDATE_COLUMNS
+]
 
-def get_pessoa_id_by_cliente_codigo(dest_engine, codigo_cliente: int, tenant_id: str):
-    """
-    Busca o sCdPessoa no destino pelo código do cliente no legado.
-    Usa a tabela CONTROLE_MIGRACAO_LEGADO para encontrar o mapeamento.
-    Valida se a pessoa realmente existe na tabela PESSOA.
-    """
-    # Buscar na tabela de controle
-    select_controle_sql = text("""
-SELECT sValorChaveDestino 
-FROM CONTROLE_MIGRACAO_LEGADO
-WHERE sCdTenant = :tenant
-  AND sTabelaOrigem = 'PET_CLIENTE'
-  AND sCampoChaveOrigem = 'Codigo'
-  AND sValorChaveOrigem = :codigo
-  AND sTabelaDestino = 'PESSOA'
-""")
-    
-    # Validar se pessoa existe
-    validate_pessoa_sql = text("""
-SELECT sCdPessoa FROM PESSOA
-WHERE sCdPessoa = :pessoa_id AND sCdTenant = :tenant
-""")
-    
-    with dest_engine.connect() as conn:
-        # Buscar ID na tabela de controle
-        result = conn.execute(select_controle_sql, {
-            "tenant": tenant_id,
-            "codigo": str(codigo_cliente)
-        })
-        row = result.fetchone()
-        
-        if row:
-            pessoa_id = str(row[0])
-            
-            # Validar se pessoa realmente existe
-            result_validate = conn.execute(validate_pessoa_sql, {
-                "pessoa_id": pessoa_id,
-                "tenant": tenant_id
-            })
-            
-            if result_validate.fetchone():
-                return pessoa_id
-    
-    return None
+DELETE_CONTROLE_PETS_SQL = text("""
+    DELETE FROM CONTROLE_MIGRACAO_LEGADO
+    WHERE sCdTenant = :tenant
+      AND sTabelaOrigem = 'PET_ANIMAL'
+      AND sValorChaveOrigem IN :codigos
+""").bindparams(bindparam("codigos", expanding=True))
 
 
 def map_animal_to_pet_optimized(row, tenant_id: str, 
-                                  racas_legado: dict, racas_destino: dict,
-                                  cores_legado: dict, cores_destino: dict,
-                                  sCdPessoa: str):
+                                  racas_legado: dict, racas_resolvidas: dict,
+                                  cores_resolvidas: dict, sCdPessoa: str):
     """
     Versão otimizada que usa dados já carregados em memória.
-    Não faz queries no banco - usa apenas dicionários.
+    Não faz queries no banco nem fuzzy matching - usa apenas dicionários
+    (raças e cores já resolvidas por ReferenceCatalog.resolver_racas_cores).
     """
     def safe(val, default=""):
         return default if val is None else val
@@ -112,15 +67,16 @@ def map_animal_to_pet_optimized(row, tenant_id: str,
         except:
             tDtNascimento = None
     
-    # Data de cadastro
+    # Data de cadastro (o hash de conteúdo usa o valor do legado, sem o fallback)
     dt_cad = row.get("DataCadastro")
     if isinstance(dt_cad, datetime):
-        tDtCadastro = dt_cad
+        tDtCadastroLegado = dt_cad
     else:
         try:
-            tDtCadastro = datetime.fromisoformat(str(dt_cad))
+            tDtCadastroLegado = datetime.fromisoformat(str(dt_cad))
         except:
-            tDtCadastro = datetime.utcnow()
+            tDtCadastroLegado = None
+    tDtCadastro = tDtCadastroLegado or datetime.utcnow()
     
     # Ativo
     ativo = row.get("Ativo")
@@ -140,33 +96,13 @@ def map_animal_to_pet_optimized(row, tenant_id: str,
     if codigo_raca is not None:
         codigo_raca = int(codigo_raca)
     raca_info = racas_legado.get(codigo_raca, {})
-    nome_raca = raca_info.get('descricao', '')
     especie_legado = raca_info.get('especie')
     
     # Espécie (já temos do dicionário)
     nCdEspecie = int(especie_legado) if especie_legado else 1  # Default CANINA
     
-    # Fuzzy match da raça (versão otimizada - só dicionário)
-    nCdRaca = None
-    if nome_raca and racas_destino:
-        try:
-            from rapidfuzz import fuzz, process
-            result = process.extractOne(
-                nome_raca, 
-                racas_destino.keys(), 
-                scorer=fuzz.ratio,
-                score_cutoff=75
-            )
-            if result:
-                descricao_match = result[0]
-                nCdRaca = racas_destino[descricao_match]
-        except ImportError:
-            # Fallback: match exato
-            nome_upper = nome_raca.upper().strip()
-            for desc, cod in racas_destino.items():
-                if desc.upper().strip() == nome_upper:
-                    nCdRaca = cod
-                    break
+    # Raça (match já resolvido por código do legado)
+    nCdRaca = racas_resolvidas.get(codigo_raca)
     
     # Sexo
     codigo_sexo = row.get("Sexo")
@@ -184,29 +120,7 @@ def map_animal_to_pet_optimized(row, tenant_id: str,
     codigo_cor = row.get("Cor")
     if codigo_cor is not None:
         codigo_cor = int(codigo_cor)
-    nome_cor = cores_legado.get(codigo_cor, '')
-    
-    # Fuzzy match da cor (versão otimizada - só dicionário)
-    nCdCor = None
-    if nome_cor and cores_destino:
-        try:
-            from rapidfuzz import fuzz, process
-            result = process.extractOne(
-                nome_cor, 
-                cores_destino.keys(), 
-                scorer=fuzz.ratio,
-                score_cutoff=70
-            )
-            if result:
-                descricao_match = result[0]
-                nCdCor = cores_destino[descricao_match]
-        except ImportError:
-            # Fallback: match exato
-            nome_upper = nome_cor.upper().strip()
-            for desc, cod in cores_destino.items():
-                if desc.upper().strip() == nome_upper:
-                    nCdCor = cod
-                    break
+    nCdCor = cores_resolvidas.get(codigo_cor)
     
     return {
         "sCdTenant": tenant_id,
@@ -222,149 +136,7 @@ def map_animal_to_pet_optimized(row, tenant_id: str,
         "sDsObservacoes": sDsObservacoes,
         "bFlAtivo": bFlAtivo,
         "tDtCadastro": tDtCadastro,
-    }
-
-
-def map_animal_to_pet(row, tenant_id: str, legacy_engine, dest_engine):
-    """
-    Mapeia um registro de PET_ANIMAL para PET.
-    
-    Origem (PET_ANIMAL):
-    - Codigo: int (PK)
-    - Nome: varchar(100)
-    - DataNascimento: smalldatetime
-    - Raca: int (FK -> PET_RACA)
-    - Sexo: int (FK -> PET_SEXO)
-    - Porte: int
-    - Cor: int (FK -> PET_COR)
-    - Proprietario: int (FK -> PET_CLIENTE)
-    - DataCadastro: smalldatetime
-    - Ativo: int (0/1)
-    - Observacoes: text
-    
-    Destino (PET):
-    - sCdPet: uniqueidentifier (PK)
-    - sCdTenant: uniqueidentifier
-    - sCdPessoa: uniqueidentifier (FK -> PESSOA)
-    - sNmPet: nvarchar(100)
-    - nCdEspecie: int (1=CANINA, 2=FELINA)
-    - nCdRaca: int
-    - nCdSexo: int
-    - nCdPorte: int
-    - nCdCor: int
-    - tDtNascimento: date
-    - nVlPeso: decimal (NULL)
-    - sDsObservacoes: nvarchar(500)
-    - bFlAtivo: bit
-    - tDtCadastro: datetime2
-    """
-    def safe(val, default=""):
-        return default if val is None else val
-    
-    sCdPet = str(uuid.uuid4())
-    sNmPet = safe(row.get("Nome"), "SEM NOME")
-    
-    # Data de nascimento
-    dt_nasc = row.get("DataNascimento")
-    if isinstance(dt_nasc, (datetime, date)):
-        tDtNascimento = dt_nasc if isinstance(dt_nasc, date) else dt_nasc.date()
-    else:
-        try:
-            tDtNascimento = datetime.fromisoformat(str(dt_nasc)).date()
-        except:
-            tDtNascimento = None
-    
-    # Data de cadastro
-    dt_cad = row.get("DataCadastro")
-    if isinstance(dt_cad, datetime):
-        tDtCadastro = dt_cad
-    else:
-        try:
-            tDtCadastro = datetime.fromisoformat(str(dt_cad))
-        except:
-            tDtCadastro = datetime.utcnow()
-    
-    # Ativo
-    ativo = row.get("Ativo")
-    try:
-        bFlAtivo = bool(int(ativo))
-    except:
-        bFlAtivo = True
-    
-    # Observações
-    obs = safe(row.get("Observacoes"), None)
-    if obs and len(obs) > 500:
-        obs = obs[:497] + "..."
-    sDsObservacoes = obs
-    
-    # Proprietário -> sCdPessoa
-    codigo_proprietario = row.get("Proprietario")
-    sCdPessoa = None
-    if codigo_proprietario:
-        sCdPessoa = get_pessoa_id_by_cliente_codigo(dest_engine, codigo_proprietario, tenant_id)
-    
-    if not sCdPessoa:
-        # Sem proprietário válido, não pode migrar
-        return None
-    
-    # Raça -> buscar no legado e fazer fuzzy match no destino
-    codigo_raca_legado = row.get("Raca")
-    raca_info = get_raca_info_from_legacy(legacy_engine, codigo_raca_legado)
-    
-    nCdRaca = None
-    nCdEspecie = 1  # Default CANINA
-    
-    if raca_info:
-        nCdEspecie = raca_info["especie"]
-        nCdRaca, raca_matched, score = buscar_raca_por_nome(
-            dest_engine, 
-            raca_info["descricao"], 
-            nCdEspecie,
-            min_score=75  # Score mais permissivo para raças
-        )
-        
-        if not nCdRaca:
-            # Usar raça padrão: S.R.D. (código 7 para cães)
-            nCdRaca = 7 if nCdEspecie == 1 else 33  # 33 = S.R.D. para gatos
-    else:
-        nCdRaca = 7  # S.R.D. para cães
-    
-    # Cor -> buscar no legado e fazer fuzzy match no destino
-    codigo_cor_legado = row.get("Cor")
-    cor_descricao = get_cor_info_from_legacy(legacy_engine, codigo_cor_legado)
-    
-    nCdCor = None
-    if cor_descricao:
-        nCdCor, cor_matched, score = buscar_cor_por_nome(dest_engine, cor_descricao, min_score=70)
-        
-        if not nCdCor:
-            nCdCor = 5  # CARACTERISTICA (cor padrão quando não encontrar)
-    else:
-        nCdCor = 5  # CARACTERISTICA
-    
-    # Sexo -> mapeamento direto
-    codigo_sexo_legado = row.get("Sexo", 1)
-    nCdSexo = mapear_sexo(codigo_sexo_legado)
-    
-    # Porte -> mapeamento direto
-    codigo_porte_legado = row.get("Porte", 1)
-    nCdPorte = mapear_porte(codigo_porte_legado)
-    
-    return {
-        "sCdTenant": tenant_id,
-        "sCdPet": sCdPet,
-        "sCdPessoa": sCdPessoa,
-        "sNmPet": sNmPet,
-        "nCdEspecie": nCdEspecie,
-        "nCdRaca": nCdRaca,
-        "nCdSexo": nCdSexo,
-        "nCdPorte": nCdPorte,
-        "nCdCor": nCdCor,
-        "tDtNascimento": tDtNascimento,
-        "nVlPeso": None,  # Peso não existe no legado
-        "sDsObservacoes": sDsObservacoes,
-        "bFlAtivo": bFlAtivo,
-        "tDtCadastro": tDtCadastro,
+        "tDtCadastroLegado": tDtCadastroLegado,
     }
 
 
@@ -442,18 +214,87 @@ VALUES (
     return pet["sCdPet"]
 
 
-def migrate_pets(batch_size=500):
-    """Executa a migração de pets."""
+def gravar_lote_pets(dest_engine, tenant_id: str, pets_para_inserir: list,
+                     pets_para_atualizar: list, controle_para_inserir: list,
+                     chunk_size: int = 500, fingerprints: dict = None, hashes: dict = None):
+    """
+    Grava um lote de pets (inserts, updates e controle) em uma única transação.
+    
+    Args:
+        dest_engine: Engine do banco destino
+        tenant_id: ID da tenant
+        pets_para_inserir: Pets novos (já com sCdPet)
+        pets_para_atualizar: Pets já migrados
+        controle_para_inserir: Registros de controle dos pets novos
+        chunk_size: Registros por comando
+        fingerprints: {Codigo: SHA-256 da linha} dos pets gravados (modo incremental)
+        hashes: {sCdPet: hash} do conteúdo gravado (common.row_hash)
+    """
+    with dest_engine.begin() as conn:
+        # BULK INSERT de pets novos
+        if pets_para_inserir:
+            bulk_insert(conn, "PET", PET_INSERT_COLUMNS, pets_para_inserir, chunk_size=chunk_size)
+        
+        # BULK UPDATE de pets existentes (via tabela de staging)
+        if pets_para_atualizar:
+            bulk_update_via_staging(
+                conn, "PET",
+                key_columns=["sCdPet"],
+                update_columns=PET_UPDATE_COLUMNS,
+                rows=pets_para_atualizar,
+                chunk_size=chunk_size
+            )
+        
+        # BULK INSERT na tabela de controle
+        if controle_para_inserir:
+            # Deletar registros antigos antes de inserir (evitar duplicatas)
+            codigos_origem = [c['sValorChaveOrigem'] for c in controle_para_inserir]
+            for i in range(0, len(codigos_origem), 1000):
+                conn.execute(DELETE_CONTROLE_PETS_SQL, {
+                    "tenant": tenant_id,
+                    "codigos": codigos_origem[i:i + 1000]
+                })
+            
+            insert_controle_bulk(conn, controle_para_inserir, chunk_size=chunk_size)
+        
+        salvar_fingerprints(conn, tenant_id, "PET_ANIMAL", fingerprints, chunk_size=chunk_size)
+        salvar_hashes(conn, tenant_id, "PET", hashes, chunk_size=chunk_size)
+    
+    mapping_cache.register_controle(controle_para_inserir)
+
+
+def migrate_pets(batch_size=500, dry_run=False, incremental=False):
+    """
+    Executa a migração de pets.
+    
+    PET_ANIMAL é lido em páginas de batch_size registros (keyset por Codigo) e
+    cada página é mapeada e gravada antes da próxima, mantendo a memória constante.
+    Em modo incremental só são lidos os pets novos (acima do watermark) e os alterados.
+    Pets já migrados só são atualizados se o hash do conteúdo mapeado mudou.
+    
+    Args:
+        batch_size: Registros por página de leitura/gravação
+        dry_run: Se True, apenas simula (não grava dados)
+        incremental: Lê apenas o delta desde a última execução (common.incremental)
+    
+    Returns:
+        int: Total de pets processados
+    """
     print("\n" + "="*60)
     print("MIGRAÇÃO: PET_ANIMAL -> PET")
     print("="*60 + "\n")
     
+    if dry_run:
+        print("🔍 MODO DRY-RUN (simulação)")
+        print("   Nenhum dado será inserido no banco de dados\n")
+    
     legacy_engine = get_engine_from_env("LEGACY_DB_URL")
     dest_engine = get_engine_from_env("DEST_DB_URL")
     tenant_id = get_tenant_id()
     
     # Garantir que a tabela de controle exista
-    ensure_controle_table(dest_engine, tenant_id)
+    if not dry_run:
+        ensure_controle_table(dest_engine, tenant_id)
     
     # Preparar arquivo de log
     log_dir = "logs"
@@ -464,56 +305,18 @@ def migrate_pets(batch_size=500):
     
     print("📊 Carregando dados de referência...")
     
-    # 1. Carregar TODAS as raças do legado (1 query)
-    print("  - Raças do legado...", end=" ", flush=True)
-    racas_legado = {}
-    with legacy_engine.connect() as conn:
-        result = conn.execute(text("SELECT Codigo, Descricao, Especie FROM PET_RACA"))
-        for row in result:
-            racas_legado[row[0]] = {'descricao': row[1], 'especie': row[2]}
-    print(f"✓ {len(racas_legado)} raças")
-    
-    # 2. Carregar TODAS as raças do destino (1 query)
-    print("  - Raças do destino...", end=" ", flush=True)
-    racas_destino = {}
-    with dest_engine.connect() as conn:
-        result = conn.execute(text("SELECT nCdRaca, sNmRaca FROM RACA WHERE bFlAtivo = 1"))
-        for row in result:
-            racas_destino[row[1].upper()] = row[0]
-    print(f"✓ {len(racas_destino)} raças")
-    
-    # 3. Carregar TODAS as cores do destino (1 query)
-    print("  - Cores do legado...", end=" ", flush=True)
-    cores_legado = {}
-    with legacy_engine.connect() as conn:
-        result = conn.execute(text("SELECT Codigo, Descricao FROM PET_COR"))
-        for row in result:
-            cores_legado[row[0]] = row[1]
-    print(f"✓ {len(cores_legado)} cores")
-    
-    # 4. Carregar TODAS as cores do destino (1 query)
-    print("  - Cores do destino...", end=" ", flush=True)
-    cores_destino = {}
-    with dest_engine.connect() as conn:
-        result = conn.execute(text("SELECT nCdCor, sNmCor FROM COR WHERE bFlAtivo = 1"))
-        for row in result:
-            cores_destino[row[1].upper()] = row[0]
-    print(f"✓ {len(cores_destino)} cores")
+    # 1-4. Raças e cores do legado e do destino (catálogo carregado uma vez por processo)
+    print("  - Raças e cores (legado e destino)...", end=" ", flush=True)
+    catalog = ReferenceCatalog.shared(legacy_engine, dest_engine)
+    racas_legado = catalog.racas_legado
+    racas_destino = catalog.racas_destino
+    cores_legado = catalog.cores_legado
+    cores_destino = catalog.cores_destino_upper
+    print(f"✓ {len(racas_legado)}/{len(racas_destino)} raças, {len(cores_legado)}/{len(cores_destino)} cores")
     
     # 5. Carregar TODOS os mapeamentos de proprietários (1 query)
     print("  - Mapeamento de proprietários...", end=" ", flush=True)
-    proprietarios_map = {}
-    with dest_engine.connect() as conn:
-        result = conn.execute(text(f"""
-            SELECT sValorChaveOrigem, sValorChaveDestino 
-            FROM CONTROLE_MIGRACAO_LEGADO
-            WHERE sCdTenant = '{tenant_id}'
-              AND sTabelaOrigem = 'PET_CLIENTE'
-              AND sTabelaDestino = 'PESSOA'
-        """))
-        for row in result:
-            # sValorChaveOrigem vem como STRING do banco!
-            proprietarios_map[int(row[0])] = row[1]
+    proprietarios_map = mapping_cache.load(dest_engine, tenant_id, "PET_CLIENTE", "PESSOA")
     print(f"✓ {len(proprietarios_map)} mapeamentos")
     
     # 6. Validar quais pessoas realmente existem (1 query com IN)
@@ -537,41 +340,50 @@ def migrate_pets(batch_size=500):
     
     # 7. Carregar pets já migrados (1 query)
     print("  - Pets já migrados...", end=" ", flush=True)
-    pets_migrados = {}
-    with dest_engine.connect() as conn:
-        result = conn.execute(text(f"""
-            SELECT sValorChaveOrigem, sValorChaveDestino 
-            FROM CONTROLE_MIGRACAO_LEGADO
-            WHERE sCdTenant = '{tenant_id}'
-              AND sTabelaOrigem = 'PET_ANIMAL'
-              AND sTabelaDestino = 'PET'
-        """))
-        for row in result:
-            pets_migrados[int(row[0])] = row[1]
+    pets_migrados = mapping_cache.load(dest_engine, tenant_id, "PET_ANIMAL", "PET")
     print(f"✓ {len(pets_migrados)} pets")
     
-    print("\n🔄 Processando pets...")
+    # 8. Hashes do conteúdo já gravado (pula UPDATEs sem mudança)
+    hashes_gravados = {}
+    if not dry_run:
+        print("  - Hashes dos pets gravados...", end=" ", flush=True)
+        hashes_gravados = carregar_hashes(dest_engine, tenant_id, "PET")
+        print(f"✓ {len(hashes_gravados)} hashes")
     
-    # Ler TODOS os animais do legado (1 query)
-    select_sql = text("SELECT * FROM PET_ANIMAL ORDER BY Codigo")
+    # Resolver raças/cores uma vez por código do legado (em vez de por pet)
+    print("  - Resolvendo raças e cores...", end=" ", flush=True)
+    racas_resolvidas, cores_resolvidas = catalog.resolver_racas_cores()
+    print(f"✓ {len(racas_resolvidas)} raças, {len(cores_resolvidas)} cores")
+    
+    print("\n🔄 Processando pets...")
     
     total = 0
     sem_proprietario = 0
-    pets_para_inserir = []
-    pets_para_atualizar = []
-    controle_para_inserir = []
-    
-    with legacy_engine.connect() as src_conn:
-        result = src_conn.execute(select_sql)
-        all_rows = result.fetchall()
+    stats = {'inseridos': 0, 'atualizados': 0, 'inalterados': 0}
+    ultimo_codigo = -1
+    codigos_alterados = []
+    
+    if incremental and not dry_run:
+        ultimo_codigo, codigos_alterados = preparar_incremental(legacy_engine, dest_engine, tenant_id, "PET_ANIMAL")
+    
+    # Leitura paginada por Codigo (keyset): memória constante independente do tamanho da tabela
+    paginas = iterar_paginas(
+        legacy_engine, "PET_ANIMAL", "*", batch_size,
+        ultimo_codigo, codigos_alterados, com_fingerprint=incremental
+    )
+    
+    for rows in paginas:
+        pets_para_inserir = []
+        pets_para_atualizar = []
+        controle_para_inserir = []
+        fingerprints = {}
         
-        print(f"  Total de pets no legado: {len(all_rows)}\n")
-        
-        for r in all_rows:
+        for r in rows:
             row = dict(r._mapping)
             codigo_animal = int(row.get("Codigo"))
             nome_animal = row.get("Nome", "SEM NOME")
             codigo_proprietario = row.get("Proprietario")
+            fingerprint = row.pop("bFingerprint", None)
             
             # Converter Decimal para int
             if codigo_proprietario is not None:
@@ -579,9 +391,6 @@ def migrate_pets(batch_size=500):
             
             total += 1
             
-            if total % 100 == 0:
-                print(f"  [{total}] Processando...", flush=True)
-            
             # Verificar se proprietário existe (usando dados em memória)
             if codigo_proprietario is None or codigo_proprietario not in proprietarios_map:
                 sem_proprietario += 1
@@ -606,14 +415,16 @@ def migrate_pets(batch_size=500):
             # Mapear pet usando dados em memória
             pet = map_animal_to_pet_optimized(
                 row, tenant_id, 
-                racas_legado, racas_destino,
-                cores_legado, cores_destino,
-                sCdPessoa
+                racas_legado, racas_resolvidas,
+                cores_resolvidas, sCdPessoa
             )
             
             if pet is None:
                 continue
             
+            if incremental:
+                fingerprints[codigo_animal] = fingerprint
+            
             # Verificar se já foi migrado
             if codigo_animal in pets_migrados:
                 # Atualizar
@@ -636,77 +447,36 @@ def migrate_pets(batch_size=500):
                     'sValorChaveDestino': sCdPet,
                     'dtMigracao': datetime.now()
                 })
+        
+        hashes = {}
+        if not dry_run:
+            # Só vão para o UPDATE os pets cujo conteúdo mudou desde a última gravação
+            total_atualizar = len(pets_para_atualizar)
+            pets_para_atualizar, hashes = filtrar_alterados(
+                pets_para_atualizar, "sCdPet", PET_HASH_COLUMNS, hashes_gravados
+            )
+            stats['inalterados'] += total_atualizar - len(pets_para_atualizar)
+            hashes.update(calcular_hashes(pets_para_inserir, "sCdPet", PET_HASH_COLUMNS))
+        
+        stats['inseridos'] += len(pets_para_inserir)
+        stats['atualizados'] += len(pets_para_atualizar)
+        
+        if not dry_run:
+            gravar_lote_pets(
+                dest_engine, tenant_id,
+                pets_para_inserir, pets_para_atualizar, controle_para_inserir,
+                chunk_size=batch_size, fingerprints=fingerprints, hashes=hashes
+            )
+            hashes_gravados.update(hashes)
+        
+        print(f"  [{total:,}] Processados (inseridos: {stats['inseridos']:,}, "
+              f"atualizados: {stats['atualizados']:,}, inalterados: {stats['inalterados']:,}, "
+              f"sem proprietário: {sem_proprietario:,})", flush=True)
     
-    print(f"\n💾 Salvando no banco de dados...")
-    
-    # BULK INSERT de pets novos
-    if pets_para_inserir:
-        print(f"  - Inserindo {len(pets_para_inserir)} pets novos...", end=" ", flush=True)
-        with dest_engine.begin() as conn:
-            conn.execute(text("""
-                INSERT INTO PET (
-                    sCdTenant, sCdPet, sCdPessoa, sNmPet, nCdEspecie, nCdRaca,
-                    nCdSexo, nCdPorte, nCdCor, tDtNascimento, nVlPeso,
-                    sDsObservacoes, bFlAtivo, tDtCadastro
-                )
-                VALUES (
-                    :sCdTenant, :sCdPet, :sCdPessoa, :sNmPet, :nCdEspecie, :nCdRaca,
-                    :nCdSexo, :nCdPorte, :nCdCor, :tDtNascimento, :nVlPeso,
-                    :sDsObservacoes, :bFlAtivo, :tDtCadastro
-                )
-            """), pets_para_inserir)
-        print("✓")
-    
-    # BULK UPDATE de pets existentes
-    if pets_para_atualizar:
-        print(f"  - Atualizando {len(pets_para_atualizar)} pets existentes...", end=" ", flush=True)
-        with dest_engine.begin() as conn:
-            for pet in pets_para_atualizar:
-                conn.execute(text("""
-                    UPDATE PET SET
-                        sCdPessoa = :sCdPessoa,
-                        sNmPet = :sNmPet,
-                        nCdEspecie = :nCdEspecie,
-                        nCdRaca = :nCdRaca,
-                        nCdSexo = :nCdSexo,
-                        nCdPorte = :nCdPorte,
-                        nCdCor = :nCdCor,
-                        tDtNascimento = :tDtNascimento,
-                        nVlPeso = :nVlPeso,
-                        sDsObservacoes = :sDsObservacoes,
-                        bFlAtivo = :bFlAtivo,
-                        tDtCadastro = :tDtCadastro
-                    WHERE sCdPet = :sCdPet
-                """), pet)
-        print("✓")
-    
-    # BULK INSERT na tabela de controle
-    if controle_para_inserir:
-        print(f"  - Registrando {len(controle_para_inserir)} mapeamentos...", end=" ", flush=True)
-        with dest_engine.begin() as conn:
-            # Deletar registros antigos antes de inserir (evitar duplicatas)
-            codigos_origem = [c['sValorChaveOrigem'] for c in controle_para_inserir]
-            if codigos_origem:
-                placeholders = ','.join([f"'{c}'" for c in codigos_origem])
-                conn.execute(text(f"""
-                    DELETE FROM CONTROLE_MIGRACAO_LEGADO
-                    WHERE sCdTenant = '{tenant_id}'
-                    AND sTabelaOrigem = 'PET_ANIMAL'
-                    AND sValorChaveOrigem IN ({placeholders})
-                """))
-            
-            # Inserir novos registros
-            conn.execute(text("""
-                INSERT INTO CONTROLE_MIGRACAO_LEGADO (
-                    sCdTenant, sTabelaOrigem, sCampoChaveOrigem, sValorChaveOrigem,
-                    sTabelaDestino, sCampoChaveDestino, sValorChaveDestino, dtMigracao
-                )
-                VALUES (
-                    :sCdTenant, :sTabelaOrigem, :sCampoChaveOrigem, :sValorChaveOrigem,
-                    :sTabelaDestino, :sCampoChaveDestino, :sValorChaveDestino, :dtMigracao
-                )
-            """), controle_para_inserir)
-        print("✓")
+    if dry_run:
+        print(f"\n[DRY-RUN] Simulação concluída. Nenhum dado foi gravado.")
+        print(f"  Seriam inseridos: {stats['inseridos']}")
+        print(f"  Seriam atualizados: {stats['atualizados']}")
     
     # Gerar relatório de pets sem proprietário
     if pets_sem_proprietario:
@@ -737,6 +507,7 @@ def migrate_pets(batch_size=500):
     print("\n" + "="*60)
     print("✓ Migração finalizada!")
     print(f"  Total processado: {total}")
+    print(f"  Inalterados (UPDATE pulado): {stats['inalterados']}")
     print(f"  Sem proprietário: {sem_proprietario}")
     if pets_sem_proprietario:
         print(f"  Relatório: {log_file}")
@@ -751,7 +522,8 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Migração de Pets")
     parser.add_argument("--batch-size", type=int, default=500, help="Tamanho do batch")
     parser.add_argument("--dry-run", action="store_true", help="Simula migração sem inserir dados")
+    parser.add_argument("--incremental", action="store_true", help="Migra apenas registros novos ou alterados")
     
     args = parser.parse_args()
     
-    migrate_pets(batch_size=args.batch_size, dry_run=args.dry_run)
+    migrate_pets(batch_size=args.batch_size, dry_run=args.dry_run, incremental=args.incremental)
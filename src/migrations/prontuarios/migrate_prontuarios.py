@@ -12,6 +12,7 @@ Origem:  PET_ANIMAL_PRONTUARIO (Codigo, Animal, Tag)
 Destino: PRONTUARIO (sCdProntuario, sCdPet, tDtRegistro, sCdUsuarioRegistro, sDsProntuario)
          RECEITA_MEDICA (sCdReceitaMedica, sCdPet, tDtRegistro, sCdUsuarioRegistro, sDsReceitaMedica)
 """
+import os
 import sys
 import re
 import logging
@@ -19,12 +20,23 @@ from pathlib import Path
 from datetime import datetime, timedelta
 from decimal import Decimal
 import uuid
+import itertools
+import multiprocessing
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
 
 # Adicionar src ao path para imports funcionarem
 sys.path.insert(0, str(Path(__file__).parent.parent.parent))
 
-from sqlalchemy import text
-from common.db_utils import get_engine_from_env, get_tenant_id
+from sqlalchemy import text, bindparam
+from common.db_utils import get_engine_from_env, ensure_controle_table, get_tenant_id, bulk_insert, insert_controle_bulk
+from common.mapping_cache import mapping_cache
+from common.incremental import iterar_paginas
+from common.checkpoint import carregar_checkpoint, salvar_checkpoint, limpar_checkpoint
+from common.prontuario_entries import (
+    HASH_TAG_SQL, ensure_entry_table, hashes_entries, carregar_hashes_entries, salvar_hashes_entries,
+    carregar_entries_destino, entries_ja_gravadas, carregar_hashes_tag, salvar_hashes_tag
+)
 
 try:
     from rapidfuzz import fuzz, process
@@ -38,33 +50,70 @@ except ImportError:
         print("Execute: pipenv install rapidfuzz")
         FUZZY_LIB = None
 
-# Configurar logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('logs/migracao_prontuarios.log'),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger(__name__)
 
+# Processos que fazem o parse do campo Tag (1 = no próprio processo) e registros por tarefa
+PRONTUARIOS_PARSE_WORKERS = int(os.getenv("PRONTUARIOS_PARSE_WORKERS", str(os.cpu_count() or 1)))
+PRONTUARIOS_PARSE_CHUNK = int(os.getenv("PRONTUARIOS_PARSE_CHUNK", "200"))
+
+# Nome da migração na tabela de checkpoints
+CHECKPOINT_MIGRACAO = "prontuarios"
+
+# Colunas gravadas na inserção de prontuários e receitas
+PRONTUARIO_INSERT_COLUMNS = [
+    "sCdProntuario", "sCdTenant", "sCdPet", "tDtRegistro",
+    "sCdUsuarioRegistro", "sDsObservacao", "sDsProntuario",
+    "tDtAlteracao", "sCdUsuarioAlteracao",
+]
+RECEITA_MEDICA_INSERT_COLUMNS = [
+    "sCdReceitaMedica", "sCdTenant", "sCdPet", "tDtRegistro",
+    "sCdUsuarioRegistro", "tDtAlteracao", "sCdUsuarioAlteracao",
+    "sDsObservacao", "sDsReceitaMedica", "bFlReceitaControlada",
+]
+
+# Cabeçalho de cada entry do Tag: [DD/MM/YYYY HH:MM:SS - RESPONSÁVEL]:
+# Grupo 1: data/hora, Grupo 2: responsável
+CABECALHO_PRONTUARIO_RE = re.compile(r'\[(\d{2}/\d{2}/\d{4}\s+\d{2}:\d{2}:\d{2})\s*-\s*([^\]]+)\]:')
+
+# Responsáveis que indicam resultado de laboratório
+TIPOS_LABORATORIO = ('CITOVET', 'LABVET', 'LABORATORIO')
+
 
 def get_default_vet_fallback():
     """Retorna nome da veterinária padrão quando não conseguir identificar."""
-    import os
     from dotenv import load_dotenv
     
     load_dotenv()
     return os.getenv("DEFAULT_VET_FALLBACK_NAME", "DRA. JULIANA FARBER METZLER")
 
 
+def _parse_data_prontuario(texto: str, inicio: int, fim_data: int) -> datetime:
+    """
+    Converte 'DD/MM/YYYY HH:MM:SS' (posições fixas) sem strptime.
+    
+    O cabeçalho já foi validado pela regex (dígitos nas posições certas); entre
+    a data e a hora pode haver mais de um espaço, então a hora é lida do fim.
+    
+    Raises:
+        ValueError: Data inexistente (ex: 31/02)
+    """
+    hora = fim_data - 8
+    return datetime(
+        int(texto[inicio + 6:inicio + 10]), int(texto[inicio + 3:inicio + 5]), int(texto[inicio:inicio + 2]),
+        int(texto[hora:hora + 2]), int(texto[hora + 3:hora + 5]), int(texto[hora + 6:hora + 8])
+    )
+
+
 def parse_prontuario_entries(tag_text: str):
     """
     Faz o parse do campo Tag para extrair registros individuais.
     
     Padrão esperado: [DD/MM/YYYY HH:MM:SS - RESPONSÁVEL]:conteúdo
     
+    Os cabeçalhos são localizados em uma passada (regex compilada + finditer) e o
+    conteúdo de cada entry é o trecho até o próximo cabeçalho, então '[' dentro
+    do texto não corta o registro.
+    
     Args:
         tag_text: Texto completo do campo Tag
     
@@ -74,29 +123,25 @@ def parse_prontuario_entries(tag_text: str):
     if not tag_text or not tag_text.strip():
         return []
     
-    # Regex para encontrar padrão [data - responsável]:
-    # Grupo 1: data/hora, Grupo 2: responsável, Grupo 3: conteúdo até próximo [
-    pattern = r'\[(\d{2}/\d{2}/\d{4}\s+\d{2}:\d{2}:\d{2})\s*-\s*([^\]]+)\]:\s*([^\[]*)'
-    
-    matches = re.findall(pattern, tag_text, re.DOTALL)
+    cabecalhos = list(CABECALHO_PRONTUARIO_RE.finditer(tag_text))
     
     entries = []
-    for match in matches:
-        data_str, responsavel, conteudo = match
+    for i, cabecalho in enumerate(cabecalhos):
+        # Conteúdo: do fim deste cabeçalho até o início do próximo
+        fim_conteudo = cabecalhos[i + 1].start() if i + 1 < len(cabecalhos) else len(tag_text)
+        conteudo = tag_text[cabecalho.end():fim_conteudo].strip()
+        
+        if not conteudo:
+            continue
         
         # Parse da data
         try:
-            data = datetime.strptime(data_str.strip(), '%d/%m/%Y %H:%M:%S')
+            data = _parse_data_prontuario(tag_text, cabecalho.start(1), cabecalho.end(1))
         except ValueError:
-            logger.warning(f"Formato de data inválido: {data_str}")
+            logger.warning(f"Formato de data inválido: {cabecalho.group(1)}")
             continue
         
-        # Limpar responsável e conteúdo
-        responsavel = responsavel.strip()
-        conteudo = conteudo.strip()
-        
-        if not conteudo:
-            continue
+        responsavel = cabecalho.group(2).strip()
         
         # Determinar tipo
         tipo = 'PRONTUARIO'
@@ -104,7 +149,7 @@ def parse_prontuario_entries(tag_text: str):
         
         if 'RECEITA' in responsavel_upper:
             tipo = 'RECEITA_MEDICA'
-        elif any(lab in responsavel_upper for lab in ['CITOVET', 'LABVET', 'LABORATORIO']):
+        elif any(lab in responsavel_upper for lab in TIPOS_LABORATORIO):
             tipo = 'LABORATORIO'
         
         entries.append({
@@ -120,85 +165,171 @@ def parse_prontuario_entries(tag_text: str):
     return entries
 
 
-def find_veterinario_by_name(nome: str, veterinarios_map: dict, min_score: int = 70):
+def configurar_logging():
     """
-    Busca veterinário por nome usando fuzzy matching.
+    Log da migração em logs/migracao_prontuarios.log e no console.
     
-    Args:
-        nome: Nome para buscar
-        veterinarios_map: Dict com {nome: sCdUsuario}
-        min_score: Score mínimo para match (0-100)
+    Chamada ao iniciar a migração (não no import): main.py, os testes e os
+    processos de parse importam o módulo sem criar logs/ no diretório atual.
+    """
+    Path("logs").mkdir(exist_ok=True)
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler('logs/migracao_prontuarios.log'),
+            logging.StreamHandler()
+        ]
+    )
+
+
+def _parse_lote(registros: list):
+    """
+    Faz o parse de um lote de (Codigo, Animal, Tag) em um processo do pool.
     
     Returns:
-        str: sCdUsuario do veterinário ou None se não encontrar
+        list: (Codigo, Animal, entries, erro) na mesma ordem do lote; erro é a
+              mensagem da exceção (entries = None) quando o parse falha
     """
-    if not FUZZY_LIB or not nome or not veterinarios_map:
-        return None
-    
-    # Normalizar nome
-    nome_normalizado = nome.upper().strip()
-    
-    # Tentar match exato primeiro
-    for vet_nome, vet_id in veterinarios_map.items():
-        if vet_nome.upper() == nome_normalizado:
-            return vet_id
+    resultado = []
+    for codigo, animal, tag_text in registros:
+        try:
+            resultado.append((codigo, animal, parse_prontuario_entries(tag_text), None))
+        except Exception as e:
+            resultado.append((codigo, animal, None, str(e)))
+    return resultado
+
+
+def _em_lotes(registros, chunk_size: int):
+    """Agrupa um iterável de registros em listas de até chunk_size (sem materializar o todo)."""
+    lote = []
+    for registro in registros:
+        lote.append(registro)
+        if len(lote) >= chunk_size:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+
+def parsear_em_paralelo(registros, workers: int = None, chunk_size: int = None):
+    """
+    Faz o parse dos campos Tag em um pool de processos, devolvendo na ordem de entrada.
     
-    # Fuzzy matching
-    nomes_disponiveis = list(veterinarios_map.keys())
-    result = process.extractOne(nome, nomes_disponiveis, scorer=fuzz.ratio)
+    O parse (regex, strptime e classificação) é CPU-bound; em processos separados
+    escala com os núcleos em vez de ficar limitado pelo GIL. Os registros vão em
+    lotes de chunk_size e no máximo 2 x workers lotes ficam em andamento: os
+    registros são consumidos sob demanda (podem vir de um gerador paginado) e os
+    resultados prontos não se acumulam além dessa janela.
     
-    if result and result[1] >= min_score:
-        nome_encontrado = result[0]
-        logger.info(f"Fuzzy match: '{nome}' → '{nome_encontrado}' (score: {result[1]})")
-        return veterinarios_map[nome_encontrado]
+    Args:
+        registros: Iterável de (Codigo, Animal, Tag)
+        workers: Processos do pool (padrão: PRONTUARIOS_PARSE_WORKERS; 1 = sem pool)
+        chunk_size: Registros por tarefa (padrão: PRONTUARIOS_PARSE_CHUNK)
     
-    logger.warning(f"Veterinário não encontrado: '{nome}' (melhor score: {result[1] if result else 0})")
-    return None
+    Yields:
+        tuple: (Codigo, Animal, entries, erro) - ver _parse_lote
+    """
+    workers = workers or PRONTUARIOS_PARSE_WORKERS
+    chunk_size = max(1, chunk_size or PRONTUARIOS_PARSE_CHUNK)
+    lotes = _em_lotes(registros, chunk_size)
+    
+    # Um único lote (ou 1 worker) não compensa subir o pool
+    primeiro = next(lotes, None)
+    segundo = next(lotes, None) if workers > 1 else None
+    if segundo is None:
+        if primeiro is not None:
+            yield from _parse_lote(primeiro)
+        for lote in lotes:
+            yield from _parse_lote(lote)
+        return
+    
+    # spawn: o run-all chama a migração de dentro de uma thread (fork com threads ativas não é seguro)
+    contexto = multiprocessing.get_context("spawn")
+    janela = 2 * workers
+    with ProcessPoolExecutor(max_workers=workers, mp_context=contexto) as executor:
+        em_andamento = deque()
+        for lote in itertools.chain([primeiro, segundo], lotes):
+            em_andamento.append(executor.submit(_parse_lote, lote))
+            if len(em_andamento) >= janela:
+                yield from em_andamento.popleft().result()
+        
+        while em_andamento:
+            yield from em_andamento.popleft().result()
 
 
-def associate_receita_to_vet(
-    receita_entry: dict,
-    previous_entries: list,
-    veterinarios_map: dict,
-    default_vet_id: str,
-    max_days_diff: int = 1
-):
+def normalizar_responsavel(nome: str) -> str:
+    """Maiúsculas e espaços colapsados (chave do cache de veterinários)."""
+    return " ".join(nome.upper().split()) if nome else ""
+
+
+class VeterinarioResolver:
     """
-    Associa uma receita médica ao veterinário anterior mais próximo.
+    Resolve responsáveis dos prontuários para sCdUsuario com cache.
     
-    Args:
-        receita_entry: Entry da receita
-        previous_entries: Entries anteriores (já processados)
-        veterinarios_map: Mapa de veterinários
-        default_vet_id: ID do veterinário padrão (fallback)
-        max_days_diff: Diferença máxima em dias
+    Há poucas dezenas de responsáveis distintos em milhões de entries: cada nome
+    normalizado passa pelo match exato/fuzzy uma única vez e os não encontrados
+    são contados para um resumo no fim (em vez de um log por entry).
     
-    Returns:
-        str: sCdUsuario do veterinário responsável
+    Args:
+        veterinarios_map: Dict com {nome: sCdUsuario}
+        min_score: Score mínimo para o fuzzy match (0-100)
     """
-    receita_data = receita_entry['data']
     
-    # Buscar prontuário anterior mais próximo (não receita)
-    for entry in reversed(previous_entries):
-        if entry['tipo'] != 'RECEITA_MEDICA':
-            diff_days = (receita_data - entry['data']).days
-            
-            if diff_days <= max_days_diff:
-                # Tentar encontrar veterinário
-                vet_id = find_veterinario_by_name(entry['responsavel'], veterinarios_map)
-                if vet_id:
-                    logger.info(
-                        f"Receita de {receita_data} associada a {entry['responsavel']} "
-                        f"({diff_days} dias de diferença)"
-                    )
-                    return vet_id
-    
-    # Fallback: usar veterinário padrão
-    logger.warning(
-        f"Receita de {receita_data} sem veterinário anterior próximo. "
-        f"Usando fallback: {get_default_vet_fallback()}"
-    )
-    return default_vet_id
+    def __init__(self, veterinarios_map: dict, min_score: int = 70):
+        self.min_score = min_score
+        self._por_nome = {}
+        for nome, vet_id in veterinarios_map.items():
+            self._por_nome.setdefault(normalizar_responsavel(nome), vet_id)
+        self._nomes = list(self._por_nome)
+        self._resolvidos = {}      # {nome normalizado: sCdUsuario ou None}
+        self._fuzzy = {}           # {nome normalizado: (nome encontrado, score)}
+        self.nao_encontrados = {}  # {nome normalizado: [ocorrências, melhor score]}
+    
+    def _resolver(self, chave: str):
+        if chave in self._por_nome:
+            return self._por_nome[chave]
+        
+        if not FUZZY_LIB or not self._nomes:
+            self.nao_encontrados[chave] = [0, 0]
+            return None
+        
+        result = process.extractOne(chave, self._nomes, scorer=fuzz.ratio)
+        if result and result[1] >= self.min_score:
+            self._fuzzy[chave] = (result[0], result[1])
+            return self._por_nome[result[0]]
+        
+        self.nao_encontrados[chave] = [0, result[1] if result else 0]
+        return None
+    
+    def buscar(self, nome: str):
+        """
+        Retorna o sCdUsuario do responsável ou None se não encontrar.
+        
+        Args:
+            nome: Responsável como aparece no cabeçalho do entry
+        """
+        chave = normalizar_responsavel(nome)
+        if not chave:
+            return None
+        
+        if chave not in self._resolvidos:
+            self._resolvidos[chave] = self._resolver(chave)
+        
+        if chave in self.nao_encontrados:
+            self.nao_encontrados[chave][0] += 1
+        return self._resolvidos[chave]
+    
+    def registrar_resumo(self):
+        """Registra no log os fuzzy matches e os responsáveis não encontrados (uma linha por nome)."""
+        for chave, (nome_encontrado, score) in sorted(self._fuzzy.items()):
+            logger.info(f"Fuzzy match: '{chave}' → '{nome_encontrado}' (score: {score:.0f})")
+        
+        for chave, (ocorrencias, score) in sorted(self.nao_encontrados.items(), key=lambda x: -x[1][0]):
+            logger.warning(
+                f"Veterinário não encontrado: '{chave}' - {ocorrencias:,} entries "
+                f"(melhor score: {score:.0f}); usado o fallback"
+            )
 
 
 def associate_receita_to_previous_vet(
@@ -218,30 +349,99 @@ def associate_receita_to_previous_vet(
     # Buscar o último entry que não seja RECEITA_MEDICA
     for entry in reversed(previous_entries):
         if entry['tipo'] != 'RECEITA_MEDICA' and 'sCdUsuario' in entry:
-            logger.info(
+            logger.debug(
                 f"Receita associada a {entry.get('responsavel', 'N/A')} "
                 f"(entry anterior)"
             )
             return entry['sCdUsuario']
     
-    # Fallback: usar veterinário padrão
-    logger.warning(
-        f"Receita sem entry anterior válido. Usando fallback: {get_default_vet_fallback()}"
-    )
+    # Fallback: usar veterinário padrão (contabilizado no resumo da migração)
+    logger.debug("Receita sem entry anterior válido. Usando fallback")
     return default_vet_id
 
 
-def migrate_prontuarios_bulk(batch_size: int = 500, dry_run: bool = False):
+def gravar_lote_prontuarios(dest_engine, tenant_id: str, prontuarios_para_inserir: list,
+                            receitas_para_inserir: list, controle_para_inserir: list,
+                            ultimo_codigo: int, chunk_size: int = 500, hashes_por_codigo: dict = None,
+                            hashes_tag: dict = None):
+    """
+    Grava um lote de prontuários (prontuários, receitas, controle e checkpoint) em uma única transação.
+    
+    Os registros de controle, as identidades das entries, os hashes do Tag e o checkpoint entram na
+    mesma transação dos entries: se a execução cair, a próxima retoma após o último
+    lote confirmado e os prontuários do lote perdido são reprocessados por inteiro.
+    
+    Args:
+        dest_engine: Engine do banco destino
+        tenant_id: ID da tenant
+        prontuarios_para_inserir: Linhas de PRONTUARIO do lote
+        receitas_para_inserir: Linhas de RECEITA_MEDICA do lote
+        controle_para_inserir: Registros de controle dos prontuários de origem do lote
+        ultimo_codigo: Maior Codigo do legado consumido no lote (high-water mark);
+                       None não grava checkpoint (modo incremental)
+        chunk_size: Registros por comando
+        hashes_por_codigo: {Codigo: [hash]} das entries gravadas (common.prontuario_entries)
+        hashes_tag: {Codigo: SHA-256 do Tag} dos prontuários processados (detecção de Tags alterados)
+    """
+    with dest_engine.begin() as conn:
+        if prontuarios_para_inserir:
+            bulk_insert(conn, "PRONTUARIO", PRONTUARIO_INSERT_COLUMNS, prontuarios_para_inserir, chunk_size=chunk_size,
+                        fast_executemany=False)
+        
+        if receitas_para_inserir:
+            bulk_insert(conn, "RECEITA_MEDICA", RECEITA_MEDICA_INSERT_COLUMNS, receitas_para_inserir, chunk_size=chunk_size,
+                        fast_executemany=False)
+        
+        if controle_para_inserir:
+            insert_controle_bulk(conn, controle_para_inserir, chunk_size=chunk_size)
+        
+        # Checkpoint, identidades e hashes do Tag confirmados junto com os dados do lote
+        if ultimo_codigo is not None:
+            salvar_checkpoint(conn, tenant_id, CHECKPOINT_MIGRACAO, ultimo_codigo)
+        salvar_hashes_entries(conn, tenant_id, hashes_por_codigo or {}, chunk_size=chunk_size)
+        salvar_hashes_tag(conn, tenant_id, hashes_tag or {}, chunk_size=chunk_size)
+    
+    # Transação confirmada: refletir os novos mapeamentos no cache do processo
+    mapping_cache.register_controle(controle_para_inserir)
+
+
+def migrate_prontuarios_bulk(batch_size: int = 500, dry_run: bool = False, incremental: bool = False,
+                             parse_workers: int = None, reiniciar: bool = False):
     """
     Migração de prontuários com parsing de texto complexo.
     
+    Cada entry gravada tem uma identidade (hash) em CONTROLE_MIGRACAO_PRONTUARIO_ENTRY.
+    Na execução completa os prontuários já migrados são pulados. Em modo incremental
+    a origem é comparada só pelo Codigo e pelo SHA-256 do Tag (calculado no legado
+    e gravado em CONTROLE_MIGRACAO_PRONTUARIO_TAG para todo prontuário processado,
+    inclusive sem entries): são lidos os prontuários cujo Tag ainda não foi
+    processado ou mudou, e dos já migrados só as entries sem identidade gravada
+    são inseridas. Prontuários migrados antes das identidades são conciliados
+    com as linhas já gravadas no destino (backfill).
+    
+    A origem (Tag incluído) é lida em páginas de batch_size registros (keyset por
+    Codigo, common.incremental.iterar_paginas) que alimentam sob demanda o pool de
+    parse (parsear_em_paralelo); a gravação é feita em lotes de batch_size
+    prontuários de origem, cada um confirmado com seus registros de controle
+    (gravar_lote_prontuarios). A memória fica limitada a algumas páginas.
+    
+    Na execução completa cada lote grava o checkpoint do último Codigo consumido:
+    se a execução for interrompida, a próxima retoma a leitura após o último lote
+    confirmado. O incremental não grava checkpoint (os pendentes não seguem a
+    ordem do keyset); ele retoma pelos hashes do Tag já gravados.
+    
     Args:
-        batch_size: Tamanho do lote (não usado, mantido por compatibilidade)
+        batch_size: Registros por página de leitura e prontuários de origem por transação
         dry_run: Se True, apenas simula
+        incremental: Lê somente os prontuários pendentes ou com Tag alterado
+        parse_workers: Processos de parse (padrão: PRONTUARIOS_PARSE_WORKERS)
+        reiniciar: Ignora o checkpoint e processa desde o início
     
     Returns:
         dict: Estatísticas da migração
     """
+    configurar_logging()
+    
     print("\n" + "="*80)
     print("MIGRAÇÃO DE PRONTUÁRIOS - PARSING DE TEXTO")
     print("="*80 + "\n")
@@ -256,8 +456,20 @@ def migrate_prontuarios_bulk(batch_size: int = 500, dry_run: bool = False):
     tenant_id = get_tenant_id()
     default_vet_fallback = get_default_vet_fallback()
     
+    # Garantir tabela de controle e índices de busca; ler o checkpoint
+    checkpoint = None
+    if not dry_run:
+        ensure_controle_table(dest_engine, tenant_id)
+        ensure_entry_table(dest_engine)
+        
+        if reiniciar:
+            limpar_checkpoint(dest_engine, tenant_id, CHECKPOINT_MIGRACAO)
+        checkpoint = carregar_checkpoint(dest_engine, tenant_id, CHECKPOINT_MIGRACAO)
+    
     print(f"🔑 Tenant ID: {tenant_id}")
     print(f"👨‍⚕️  Veterinário fallback: {default_vet_fallback}\n")
+    if checkpoint is not None and not incremental:
+        print(f"⏯  Retomando após o checkpoint: Codigo > {checkpoint}\n")
     
     # ==================================================================
     # FASE 1: PRE-CARREGAR MAPEAMENTOS
@@ -266,18 +478,7 @@ def migrate_prontuarios_bulk(batch_size: int = 500, dry_run: bool = False):
     
     # Mapeamento de pets
     print("  - Mapeamento de pets...", end=" ", flush=True)
-    pets_map = {}
-    with dest_engine.connect() as conn:
-        result = conn.execute(text(f"""
-            SELECT sValorChaveOrigem, sValorChaveDestino
-            FROM CONTROLE_MIGRACAO_LEGADO
-            WHERE sCdTenant = '{tenant_id}'
-              AND sTabelaOrigem = 'PET_ANIMAL'
-              AND sTabelaDestino = 'PET'
-        """))
-        
-        for row in result:
-            pets_map[int(row.sValorChaveOrigem)] = row.sValorChaveDestino
+    pets_map = mapping_cache.load(dest_engine, tenant_id, "PET_ANIMAL", "PET")
     
     print(f"✓ {len(pets_map):,} pets mapeados")
     
@@ -315,6 +516,9 @@ def migrate_prontuarios_bulk(batch_size: int = 500, dry_run: bool = False):
     
     print(f"  - Veterinário fallback: {default_vet_fallback} ({default_vet_id})")
     
+    # Responsáveis resolvidos uma vez por nome distinto
+    vet_resolver = VeterinarioResolver(veterinarios_map)
+    
     # Prontuários já migrados
     print("  - Prontuários já migrados...", end=" ", flush=True)
     prontuarios_migrados = set()
@@ -333,26 +537,61 @@ def migrate_prontuarios_bulk(batch_size: int = 500, dry_run: bool = False):
     print(f"✓ {len(prontuarios_migrados):,} prontuários")
     
     # ==================================================================
-    # FASE 2: CARREGAR PRONTUÁRIOS DA ORIGEM
+    # FASE 2: PREPARAR A LEITURA DA ORIGEM (páginas de batch_size por Codigo)
     # ==================================================================
-    print("\n🔄 Carregando prontuários da origem...")
-    
-    with origem_engine.connect() as conn:
-        result = conn.execute(text("""
-            SELECT Codigo, Animal, Tag
-            FROM PET_ANIMAL_PRONTUARIO
-            WHERE Tag IS NOT NULL
-            ORDER BY Codigo
-        """))
+    print("\n🔄 Preparando leitura da origem...")
+    
+    # Início do keyset: checkpoint na execução completa, maior Codigo varrido no incremental
+    inicio_keyset = checkpoint if checkpoint is not None and not incremental else -1
+    pendentes = []
+    
+    if incremental:
+        # Delta: Codigos cujo Tag não foi processado ou mudou desde a última gravação,
+        # comparados pelo SHA-256 calculado no legado (sem trafegar o Tag dos demais)
+        hashes_tag_gravados = {}
+        if not dry_run:
+            hashes_tag_gravados = carregar_hashes_tag(dest_engine, tenant_id)
+        
+        alterados = 0
+        with origem_engine.connect() as conn:
+            result = conn.execution_options(stream_results=True).execute(text(f"""
+                SELECT Codigo, {HASH_TAG_SQL}
+                FROM PET_ANIMAL_PRONTUARIO
+                WHERE Tag IS NOT NULL
+                ORDER BY Codigo
+            """))
+            # Os lotes já confirmados saem do delta pelos hashes do Tag gravados
+            for row in result:
+                codigo = int(row.Codigo)
+                inicio_keyset = max(inicio_keyset, codigo)
+                if hashes_tag_gravados.get(codigo) == bytes(row.bHashTag):
+                    continue
+                if dry_run and codigo in prontuarios_migrados:
+                    continue
+                pendentes.append(codigo)
+                if codigo in prontuarios_migrados:
+                    alterados += 1
         
-        all_rows = result.fetchall()
+        total = len(pendentes)
+        print(f"  ⚡ Modo incremental: {total - alterados:,} prontuários pendentes, "
+              f"{alterados:,} já migrados com Tag alterado")
+    else:
+        with origem_engine.connect() as conn:
+            total = conn.execute(text(
+                "SELECT COUNT(*) FROM PET_ANIMAL_PRONTUARIO WHERE Tag IS NOT NULL AND Codigo > :ultimo_codigo"
+            ), {"ultimo_codigo": inicio_keyset}).scalar()
     
-    total = len(all_rows)
     print(f"  Total de registros na origem: {total:,}\n")
     
+    # Pendentes do incremental primeiro, depois o keyset (Codigos criados após a varredura)
+    paginas = iterar_paginas(
+        origem_engine, "PET_ANIMAL_PRONTUARIO", f"Codigo, Animal, Tag, {HASH_TAG_SQL}",
+        batch_size, inicio_keyset, pendentes
+    )
+    
     if dry_run:
         print(f"[DRY-RUN] Processando amostra de 5 registros...\n")
-        all_rows = all_rows[:5]
+        paginas = [list(itertools.islice((row for rows in paginas for row in rows if row.Tag is not None), 5))]
     
     # ==================================================================
     # FASE 3: PROCESSAR E PARSEAR PRONTUÁRIOS
@@ -362,6 +601,9 @@ def migrate_prontuarios_bulk(batch_size: int = 500, dry_run: bool = False):
     prontuarios_para_inserir = []
     receitas_para_inserir = []
     controle_para_inserir = []
+    hashes_por_codigo = {}
+    hashes_tag_lote = {}
+    ultimo_consumido = inicio_keyset  # checkpoint dos lotes (só na execução completa)
     
     stats = {
         'total_registros': 0,
@@ -372,48 +614,110 @@ def migrate_prontuarios_bulk(batch_size: int = 500, dry_run: bool = False):
         'sem_pet': 0,
         'ja_migrado': 0,
         'vet_nao_encontrado': 0,
-        'parse_error': 0
+        'parse_error': 0,
+        'lotes_gravados': 0,
+        'entries_ja_migradas': 0,
+        'backfill': 0
     }
     
-    for i, row in enumerate(all_rows, 1):
-        stats['total_registros'] += 1
-        
+    # Preenchidos página a página pelo gerador e consumidos (pop) no processamento
+    hashes_tag = {}
+    entries_gravadas = {}
+    linhas_destino = {}
+    
+    def registros_para_parse():
+        """Filtra cada página em memória (já migrados e sem pet não vão para o pool)."""
+        for rows in paginas:
+            pagina = []
+            for row in rows:
+                if row.Tag is None:
+                    continue
+                stats['total_registros'] += 1
+                
+                codigo_origem = int(row.Codigo)
+                animal_id = int(row.Animal)
+                
+                # Verificar se já foi migrado (no incremental, os já migrados lidos tiveram o Tag alterado)
+                if codigo_origem in prontuarios_migrados and not incremental:
+                    stats['ja_migrado'] += 1
+                    continue
+                
+                # Verificar se pet foi migrado
+                if animal_id not in pets_map:
+                    stats['sem_pet'] += 1
+                    continue
+                
+                pagina.append((codigo_origem, animal_id, row.Tag))
+                hashes_tag[codigo_origem] = bytes(row.bHashTag)
+            
+            # Identidades das entries já gravadas dos prontuários migrados relidos na página
+            reprocessar = [c for c, _, _ in pagina if c in prontuarios_migrados]
+            if reprocessar and not dry_run:
+                identidades_pagina = carregar_hashes_entries(dest_engine, tenant_id, reprocessar)
+                entries_gravadas.update(identidades_pagina)
+                
+                # Migrados antes das identidades: linhas do pet já gravadas no destino (backfill)
+                sem_identidade = {
+                    c: str(pets_map[a]).lower() for c, a, _ in pagina
+                    if c in prontuarios_migrados and c not in identidades_pagina
+                }
+                if sem_identidade:
+                    linhas = carregar_entries_destino(dest_engine, tenant_id, sem_identidade.values())
+                    for c, sCdPet in sem_identidade.items():
+                        linhas_destino[c] = linhas.setdefault(sCdPet, Counter())
+            
+            yield from pagina
+    
+    workers = parse_workers or PRONTUARIOS_PARSE_WORKERS
+    print(f"  Parse em {workers} processo(s), páginas de {batch_size:,} registros")
+    
+    # Parse do texto no pool de processos, consumido na ordem da origem
+    parseados = parsear_em_paralelo(registros_para_parse(), workers)
+    for i, (codigo_origem, animal_id, entries, erro) in enumerate(parseados, 1):
         # Progresso
         if i % 100 == 0:
-            print(f"  Processando: {i:,}/{len(all_rows):,} registros...")
+            print(f"  Processando: {i:,} parseados ({stats['total_registros']:,}/{total:,} lidos)...")
         
-        codigo_origem = int(row.Codigo)
-        animal_id = int(row.Animal)
-        tag_text = row.Tag
+        hash_tag = hashes_tag.pop(codigo_origem)
+        identidades = entries_gravadas.pop(codigo_origem, None)
+        destino = linhas_destino.pop(codigo_origem, None)
+        ultimo_consumido = max(ultimo_consumido, codigo_origem)
         
-        # Verificar se já foi migrado
-        if codigo_origem in prontuarios_migrados:
-            stats['ja_migrado'] += 1
+        if erro is not None:
+            logger.error(f"Erro ao parsear prontuário {codigo_origem}: {erro}")
+            stats['parse_error'] += 1
             continue
         
-        # Verificar se pet foi migrado
-        if animal_id not in pets_map:
-            stats['sem_pet'] += 1
+        # Tag processado (mesmo sem entries): o incremental não o relê até mudar
+        hashes_tag_lote[codigo_origem] = hash_tag
+        
+        if not entries:
             continue
         
         sCdPet = pets_map[animal_id]
+        ja_migrado = codigo_origem in prontuarios_migrados
+        hashes = hashes_entries(codigo_origem, entries)
         
-        # Parse do texto
-        try:
-            entries = parse_prontuario_entries(tag_text)
-        except Exception as e:
-            logger.error(f"Erro ao parsear prontuário {codigo_origem}: {e}")
-            stats['parse_error'] += 1
-            continue
-        
-        if not entries:
-            continue
+        if ja_migrado and identidades is None:
+            # Migrado antes das identidades por entry: as entries que já têm linha
+            # no destino (mesmo pet, data e conteúdo) são só registradas (backfill)
+            gravadas = entries_ja_gravadas(entries, hashes, destino or Counter())
+            hashes_por_codigo[codigo_origem] = list(gravadas)
+            stats['backfill'] += 1
+        else:
+            gravadas = identidades or set()
         
         stats['total_entries'] += len(entries)
         processed_entries = []
         
-        # Processar cada entry
-        for entry in entries:
+        # Processar cada entry (as já gravadas só alimentam a associação de receitas)
+        for entry, hash_entry in zip(entries, hashes):
+            nova = hash_entry not in gravadas
+            if nova:
+                hashes_por_codigo.setdefault(codigo_origem, []).append(hash_entry)
+            else:
+                stats['entries_ja_migradas'] += 1
+            
             entry_data = entry['data']
             entry_tipo = entry['tipo']
             entry_responsavel = entry['responsavel']
@@ -426,154 +730,130 @@ def migrate_prontuarios_bulk(batch_size: int = 500, dry_run: bool = False):
                     default_vet_id
                 )
                 
-                receitas_para_inserir.append({
-                    'sCdReceitaMedica': str(uuid.uuid4()),
-                    'sCdTenant': tenant_id,
-                    'sCdPet': sCdPet,
-                    'tDtRegistro': entry_data,
-                    'sCdUsuarioRegistro': sCdUsuario,
-                    'tDtAlteracao': None,
-                    'sCdUsuarioAlteracao': None,
-                    'sDsObservacao': '',
-                    'sDsReceitaMedica': entry_conteudo,
-                    'bFlReceitaControlada': 0
-                })
+                if nova:
+                    receitas_para_inserir.append({
+                        'sCdReceitaMedica': str(uuid.uuid4()),
+                        'sCdTenant': tenant_id,
+                        'sCdPet': sCdPet,
+                        'tDtRegistro': entry_data,
+                        'sCdUsuarioRegistro': sCdUsuario,
+                        'tDtAlteracao': None,
+                        'sCdUsuarioAlteracao': None,
+                        'sDsObservacao': '',
+                        'sDsReceitaMedica': entry_conteudo,
+                        'bFlReceitaControlada': 0
+                    })
+                    stats['receitas'] += 1
                 
-                stats['receitas'] += 1
                 # Adicionar à lista de processados (sem sCdUsuario próprio)
                 processed_entries.append(entry)
                 
             elif entry_tipo == 'LABORATORIO':
                 # Registrar como prontuário com observação do laboratório
-                prontuarios_para_inserir.append({
-                    'sCdProntuario': str(uuid.uuid4()),
-                    'sCdTenant': tenant_id,
-                    'sCdPet': sCdPet,
-                    'tDtRegistro': entry_data,
-                    'sCdUsuarioRegistro': default_vet_id,
-                    'sDsObservacao': entry_responsavel,  # Nome do laboratório
-                    'sDsProntuario': entry_conteudo,
-                    'tDtAlteracao': None,
-                    'sCdUsuarioAlteracao': None
-                })
+                if nova:
+                    prontuarios_para_inserir.append({
+                        'sCdProntuario': str(uuid.uuid4()),
+                        'sCdTenant': tenant_id,
+                        'sCdPet': sCdPet,
+                        'tDtRegistro': entry_data,
+                        'sCdUsuarioRegistro': default_vet_id,
+                        'sDsObservacao': entry_responsavel,  # Nome do laboratório
+                        'sDsProntuario': entry_conteudo,
+                        'tDtAlteracao': None,
+                        'sCdUsuarioAlteracao': None
+                    })
+                    stats['laboratorios'] += 1
                 
-                stats['laboratorios'] += 1
                 # Adicionar à lista de processados
                 entry['sCdUsuario'] = default_vet_id
                 processed_entries.append(entry)
                 
             else:  # PRONTUARIO
                 # Buscar veterinário
-                sCdUsuario = find_veterinario_by_name(entry_responsavel, veterinarios_map)
+                sCdUsuario = vet_resolver.buscar(entry_responsavel)
                 
                 if not sCdUsuario:
                     sCdUsuario = default_vet_id
-                    stats['vet_nao_encontrado'] += 1
+                    if nova:
+                        stats['vet_nao_encontrado'] += 1
                 
-                prontuarios_para_inserir.append({
-                    'sCdProntuario': str(uuid.uuid4()),
-                    'sCdTenant': tenant_id,
-                    'sCdPet': sCdPet,
-                    'tDtRegistro': entry_data,
-                    'sCdUsuarioRegistro': sCdUsuario,
-                    'sDsObservacao': '',  # Vazio para prontuários normais
-                    'sDsProntuario': entry_conteudo,
-                    'tDtAlteracao': None,
-                    'sCdUsuarioAlteracao': None
-                })
+                if nova:
+                    prontuarios_para_inserir.append({
+                        'sCdProntuario': str(uuid.uuid4()),
+                        'sCdTenant': tenant_id,
+                        'sCdPet': sCdPet,
+                        'tDtRegistro': entry_data,
+                        'sCdUsuarioRegistro': sCdUsuario,
+                        'sDsObservacao': '',  # Vazio para prontuários normais
+                        'sDsProntuario': entry_conteudo,
+                        'tDtAlteracao': None,
+                        'sCdUsuarioAlteracao': None
+                    })
+                    stats['prontuarios'] += 1
                 
-                stats['prontuarios'] += 1
                 # Adicionar à lista de processados com o veterinário encontrado
                 entry['sCdUsuario'] = sCdUsuario
                 processed_entries.append(entry)
         
-        # Registro de controle (um por registro de origem)
-        controle_para_inserir.append({
-            'sCdTenant': tenant_id,
-            'sTabelaOrigem': 'PET_ANIMAL_PRONTUARIO',
-            'sCampoChaveOrigem': 'Codigo',
-            'sValorChaveOrigem': str(codigo_origem),
-            'sTabelaDestino': 'PRONTUARIO',
-            'sCampoChaveDestino': 'sCdProntuario',
-            'sValorChaveDestino': 'MULTIPLE',  # Indica múltiplos registros
-            'dtMigracao': datetime.now()
-        })
+        # Registro de controle (um por registro de origem, só na primeira migração)
+        if not ja_migrado:
+            controle_para_inserir.append({
+                'sCdTenant': tenant_id,
+                'sTabelaOrigem': 'PET_ANIMAL_PRONTUARIO',
+                'sCampoChaveOrigem': 'Codigo',
+                'sValorChaveOrigem': str(codigo_origem),
+                'sTabelaDestino': 'PRONTUARIO',
+                'sCampoChaveDestino': 'sCdProntuario',
+                'sValorChaveDestino': 'MULTIPLE',  # Indica múltiplos registros
+                'dtMigracao': datetime.now()
+            })
+        
+        # Lote completo: gravar e liberar a memória antes de continuar
+        if not dry_run and len(hashes_tag_lote) >= batch_size:
+            gravar_lote_prontuarios(
+                dest_engine, tenant_id, prontuarios_para_inserir, receitas_para_inserir,
+                controle_para_inserir, None if incremental else ultimo_consumido, chunk_size=batch_size,
+                hashes_por_codigo=hashes_por_codigo, hashes_tag=hashes_tag_lote
+            )
+            stats['lotes_gravados'] += 1
+            print(f"  💾 Lote {stats['lotes_gravados']:,} gravado "
+                  f"({stats['prontuarios']:,} prontuários, {stats['receitas']:,} receitas até agora)", flush=True)
+            prontuarios_para_inserir = []
+            receitas_para_inserir = []
+            controle_para_inserir = []
+            hashes_por_codigo = {}
+            hashes_tag_lote = {}
+    
+    # Último lote (parcial)
+    if not dry_run and hashes_tag_lote:
+        gravar_lote_prontuarios(
+            dest_engine, tenant_id, prontuarios_para_inserir, receitas_para_inserir,
+            controle_para_inserir, None if incremental else ultimo_consumido, chunk_size=batch_size,
+            hashes_por_codigo=hashes_por_codigo, hashes_tag=hashes_tag_lote
+        )
+        stats['lotes_gravados'] += 1
+    
+    # Migração completa: a próxima execução volta a percorrer toda a origem
+    if not dry_run:
+        limpar_checkpoint(dest_engine, tenant_id, CHECKPOINT_MIGRACAO)
     
     print(f"  ✓ Processamento concluído!")
     print(f"    - Prontuários: {stats['prontuarios']:,}")
     print(f"    - Receitas médicas: {stats['receitas']:,}")
     print(f"    - Laboratórios: {stats['laboratorios']:,}")
     print(f"    - Sem pet: {stats['sem_pet']:,}")
-    print(f"    - Vet não encontrado: {stats['vet_nao_encontrado']:,}\n")
+    print(f"    - Entries já migradas (puladas): {stats['entries_ja_migradas']:,}")
+    print(f"    - Prontuários com identidades registradas (backfill): {stats['backfill']:,}")
+    print(f"    - Vet não encontrado: {stats['vet_nao_encontrado']:,} "
+          f"({len(vet_resolver.nao_encontrados):,} responsáveis distintos)\n")
+    
+    # Um registro por responsável (fuzzy matches e não encontrados), não por entry
+    vet_resolver.registrar_resumo()
     
     if dry_run:
         print("[DRY-RUN] Simulação concluída. Nenhum dado foi inserido.\n")
         return stats
     
-    # ==================================================================
-    # FASE 4: INSERIR NO BANCO
-    # ==================================================================
-    print("💾 Salvando no banco de dados...")
-    
-    with dest_engine.begin() as conn:
-        # Inserir prontuários
-        if prontuarios_para_inserir:
-            print(f"  - Inserindo {len(prontuarios_para_inserir):,} prontuários...", end=" ", flush=True)
-            
-            insert_pront_sql = text("""
-                INSERT INTO PRONTUARIO (
-                    sCdProntuario, sCdTenant, sCdPet, tDtRegistro,
-                    sCdUsuarioRegistro, sDsObservacao, sDsProntuario,
-                    tDtAlteracao, sCdUsuarioAlteracao
-                )
-                VALUES (
-                    :sCdProntuario, :sCdTenant, :sCdPet, :tDtRegistro,
-                    :sCdUsuarioRegistro, :sDsObservacao, :sDsProntuario,
-                    :tDtAlteracao, :sCdUsuarioAlteracao
-                )
-            """)
-            
-            conn.execute(insert_pront_sql, prontuarios_para_inserir)
-            print("✓")
-        
-        # Inserir receitas
-        if receitas_para_inserir:
-            print(f"  - Inserindo {len(receitas_para_inserir):,} receitas médicas...", end=" ", flush=True)
-            
-            insert_rec_sql = text("""
-                INSERT INTO RECEITA_MEDICA (
-                    sCdReceitaMedica, sCdTenant, sCdPet, tDtRegistro,
-                    sCdUsuarioRegistro, tDtAlteracao, sCdUsuarioAlteracao,
-                    sDsObservacao, sDsReceitaMedica, bFlReceitaControlada
-                )
-                VALUES (
-                    :sCdReceitaMedica, :sCdTenant, :sCdPet, :tDtRegistro,
-                    :sCdUsuarioRegistro, :tDtAlteracao, :sCdUsuarioAlteracao,
-                    :sDsObservacao, :sDsReceitaMedica, :bFlReceitaControlada
-                )
-            """)
-            
-            conn.execute(insert_rec_sql, receitas_para_inserir)
-            print("✓")
-        
-        # Registrar controle
-        if controle_para_inserir:
-            print(f"  - Registrando {len(controle_para_inserir):,} mapeamentos...", end=" ", flush=True)
-            
-            insert_controle_sql = text("""
-                INSERT INTO CONTROLE_MIGRACAO_LEGADO (
-                    sCdTenant, sTabelaOrigem, sCampoChaveOrigem, sValorChaveOrigem,
-                    sTabelaDestino, sCampoChaveDestino, sValorChaveDestino, dtMigracao
-                )
-                VALUES (
-                    :sCdTenant, :sTabelaOrigem, :sCampoChaveOrigem, :sValorChaveOrigem,
-                    :sTabelaDestino, :sCampoChaveDestino, :sValorChaveDestino, :dtMigracao
-                )
-            """)
-            
-            conn.execute(insert_controle_sql, controle_para_inserir)
-            print("✓")
-    
     # ==================================================================
     # ESTATÍSTICAS FINAIS
     # ==================================================================
@@ -588,6 +868,7 @@ def migrate_prontuarios_bulk(batch_size: int = 500, dry_run: bool = False):
     print(f"  Sem pet migrado: {stats['sem_pet']:,}")
     print(f"  Veterinário não encontrado (usou fallback): {stats['vet_nao_encontrado']:,}")
     print(f"  Erros de parsing: {stats['parse_error']:,}")
+    print(f"  Lotes gravados: {stats['lotes_gravados']:,}")
     print("="*80 + "\n")
     
     return stats
@@ -597,12 +878,14 @@ if __name__ == "__main__":
     import argparse
     
     parser = argparse.ArgumentParser(description="Migração de Prontuários com Parse de Texto")
-    parser.add_argument("--batch-size", type=int, default=500, help="Não utilizado (compatibilidade)")
+    parser.add_argument("--batch-size", type=int, default=500, help="Prontuários de origem por transação")
     parser.add_argument("--dry-run", action="store_true", help="Simula migração sem inserir dados")
+    parser.add_argument("--incremental", action="store_true", help="Lê somente prontuários ainda não migrados")
+    parser.add_argument("--parse-workers", type=int, default=None,
+                        help="Processos para o parse do campo Tag (padrão: núcleos da máquina)")
+    parser.add_argument("--reiniciar", action="store_true", help="Ignora o checkpoint e recomeça do início")
     
     args = parser.parse_args()
     
-    # Criar diretório de logs se não existir
-    Path("logs").mkdir(exist_ok=True)
-    
-    migrate_prontuarios_bulk(batch_size=args.batch_size, dry_run=args.dry_run)
+    migrate_prontuarios_bulk(batch_size=args.batch_size, dry_run=args.dry_run, incremental=args.incremental,
+                             parse_workers=args.parse_workers, reiniciar=args.reiniciar)
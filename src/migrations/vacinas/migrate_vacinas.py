@@ -13,7 +13,9 @@ sys.path.insert(0, str(Path(__file__).parent.parent.parent))
 import uuid
 from datetime import datetime
 from sqlalchemy import text
-from common.db_utils import get_engine_from_env, ensure_controle_table, insert_controle, get_tenant_id
+from common.db_utils import get_engine_from_env, ensure_controle_table, insert_controle_bulk, get_tenant_id
+from common.mapping_cache import mapping_cache
+from common.incremental import preparar_incremental, iterar_paginas, salvar_fingerprints
 
 
 def map_origem_to_destino(row, tenant_id: str):
@@ -96,7 +98,7 @@ def map_origem_to_destino(row, tenant_id: str):
     }
 
 
-def insert_or_update_vacina(dest_engine, registro: dict, dry_run: bool = False):
+def insert_or_update_vacina(conn, registro: dict):
     """
     Insere ou atualiza registro na tabela VACINA.
     
@@ -104,12 +106,11 @@ def insert_or_update_vacina(dest_engine, registro: dict, dry_run: bool = False):
     Se existir, atualiza. Caso contrário, insere novo.
     
     Args:
-        dest_engine: Engine do banco destino
+        conn: Conexão dentro da transação da página
         registro: Dicionário com dados do registro
-        dry_run: Se True, apenas simula (não insere/atualiza)
     
     Returns:
-        str: ID da vacina inserida/atualizada
+        tuple: (ID da vacina inserida/atualizada, True se já existia)
     """
     check_sql = text(
         """
@@ -152,43 +153,39 @@ VALUES (
 """
     )
 
-    if dry_run:
-        print(f"  [dry-run] VACINA: {registro['sNmVacina']}")
-        return registro["sCdVacina"]
-
-    with dest_engine.begin() as conn:
-        # Verificar se já existe
-        result = conn.execute(check_sql, {
-            "sCdTenant": registro["sCdTenant"],
-            "sNmVacina": registro["sNmVacina"]
-        })
-        existing = result.fetchone()
+    # Verificar se já existe
+    result = conn.execute(check_sql, {
+        "sCdTenant": registro["sCdTenant"],
+        "sNmVacina": registro["sNmVacina"]
+    })
+    existing = result.fetchone()
+    
+    if existing:
+        # Atualizar registro existente
+        scd_existente = str(existing[0])
+        registro_update = registro.copy()
+        registro_update["sCdVacina"] = scd_existente
         
-        if existing:
-            # Atualizar registro existente
-            scd_existente = str(existing[0])
-            registro_update = registro.copy()
-            registro_update["sCdVacina"] = scd_existente
-            
-            conn.execute(update_sql, registro_update)
-            print(f"  ✓ Atualizado: {registro['sNmVacina']}")
-            
-            return scd_existente
-        else:
-            # Inserir novo registro
-            conn.execute(insert_sql, registro)
-            print(f"  ✓ Inserido: {registro['sNmVacina']}")
+        conn.execute(update_sql, registro_update)
+        print(f"  ✓ Atualizado: {registro['sNmVacina']}")
+        
+        return scd_existente, True
+    
+    # Inserir novo registro
+    conn.execute(insert_sql, registro)
+    print(f"  ✓ Inserido: {registro['sNmVacina']}")
     
-    return registro["sCdVacina"]
+    return registro["sCdVacina"], False
 
 
-def migrate_vacinas(batch_size=500, dry_run=False):
+def migrate_vacinas(batch_size=500, dry_run=False, incremental=False):
     """
     Executa a migração de vacinas.
     
     Args:
         batch_size: Quantidade de registros por batch
         dry_run: Se True, apenas simula (não insere)
+        incremental: Lê apenas vacinas novas ou alteradas desde a última execução
     
     Returns:
         dict: Estatísticas da migração
@@ -204,58 +201,73 @@ def migrate_vacinas(batch_size=500, dry_run=False):
     # Garantir que a tabela de controle exista
     ensure_controle_table(dest_engine, tenant_id)
 
-    # Ler vacinas da origem
-    select_sql = text("SELECT * FROM PET_VACINA ORDER BY Codigo")
-
     total = 0
     inseridos = 0
     atualizados = 0
 
-    with legacy_engine.connect() as src_conn:
-        result = src_conn.execution_options(stream_results=True).execute(select_sql)
-        
-        while True:
-            rows = result.fetchmany(batch_size)
-            if not rows:
-                break
+    # Ler vacinas da origem (todas ou apenas o delta em modo incremental)
+    ultimo_codigo = -1
+    codigos_alterados = []
+    if incremental and not dry_run:
+        ultimo_codigo, codigos_alterados = preparar_incremental(legacy_engine, dest_engine, tenant_id, "PET_VACINA")
+
+    paginas = iterar_paginas(
+        legacy_engine, "PET_VACINA", "*", batch_size,
+        ultimo_codigo, codigos_alterados, com_fingerprint=incremental
+    )
+
+    for rows in paginas:
+        registros = []
+        for r in rows:
+            row = dict(r._mapping)
+            codigo_origem = str(row.get("Codigo"))
+            fingerprint = row.pop("bFingerprint", None)
             
-            for r in rows:
-                row = dict(r._mapping)
-                codigo_origem = str(row.get("Codigo"))
-                
-                print(f"[{total + 1}] Processando: {row.get('Descricao')} (Código: {codigo_origem})")
-                
-                # Mapear
-                registro = map_origem_to_destino(row, tenant_id)
-                
-                # Verificar se já existe (para estatísticas)
-                if not dry_run:
-                    with dest_engine.begin() as conn:
-                        check = conn.execute(
-                            text("SELECT sCdVacina FROM VACINA WHERE sCdTenant = :t AND UPPER(LTRIM(RTRIM(sNmVacina))) = UPPER(LTRIM(RTRIM(:n)))"),
-                            {"t": tenant_id, "n": registro["sNmVacina"]}
-                        )
-                        exists = check.fetchone() is not None
-                
+            total += 1
+            print(f"[{total}] Processando: {row.get('Descricao')} (Código: {codigo_origem})")
+            
+            # Mapear
+            registros.append((codigo_origem, fingerprint, map_origem_to_destino(row, tenant_id)))
+        
+        if dry_run:
+            for _, _, registro in registros:
+                print(f"  [dry-run] VACINA: {registro['sNmVacina']}")
+            continue
+        
+        controle_para_inserir = []
+        fingerprints = {}
+        
+        # Vacinas, controle e fingerprints da página confirmados em uma única transação
+        with dest_engine.begin() as conn:
+            for codigo_origem, fingerprint, registro in registros:
                 # Inserir ou atualizar
-                sCdVacina = insert_or_update_vacina(dest_engine, registro, dry_run=dry_run)
+                sCdVacina, existia = insert_or_update_vacina(conn, registro)
                 
                 # Atualizar estatísticas
-                if not dry_run:
-                    if exists:
-                        atualizados += 1
-                    else:
-                        inseridos += 1
-                
-                # Registrar mapeamento na tabela de controle (apenas se não for dry-run)
-                if not dry_run:
-                    insert_controle(
-                        dest_engine, tenant_id,
-                        "PET_VACINA", "Codigo", codigo_origem,
-                        "VACINA", "sCdVacina", sCdVacina
-                    )
+                if existia:
+                    atualizados += 1
+                else:
+                    inseridos += 1
                 
-                total += 1
+                # Registrar mapeamento na tabela de controle
+                controle_para_inserir.append({
+                    'sCdTenant': tenant_id,
+                    'sTabelaOrigem': 'PET_VACINA',
+                    'sCampoChaveOrigem': 'Codigo',
+                    'sValorChaveOrigem': codigo_origem,
+                    'sTabelaDestino': 'VACINA',
+                    'sCampoChaveDestino': 'sCdVacina',
+                    'sValorChaveDestino': sCdVacina,
+                    'dtMigracao': datetime.now()
+                })
+                if incremental:
+                    fingerprints[int(codigo_origem)] = fingerprint
+            
+            insert_controle_bulk(conn, controle_para_inserir, chunk_size=batch_size)
+            salvar_fingerprints(conn, tenant_id, "PET_VACINA", fingerprints, chunk_size=batch_size)
+        
+        # Transação confirmada: refletir os novos mapeamentos no cache do processo
+        mapping_cache.register_controle(controle_para_inserir)
 
     print("\n" + "="*60)
     print("✓ Migração finalizada!")
@@ -278,7 +290,8 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Migração de Vacinas")
     parser.add_argument("--dry-run", action="store_true", help="Executar em modo simulação")
     parser.add_argument("--batch-size", type=int, default=500, help="Tamanho do batch")
+    parser.add_argument("--incremental", action="store_true", help="Migra apenas registros novos ou alterados")
     
     args = parser.parse_args()
     
-    migrate_vacinas(batch_size=args.batch_size, dry_run=args.dry_run)
+    migrate_vacinas(batch_size=args.batch_size, dry_run=args.dry_run, incremental=args.incremental)
@@ -0,0 +1,105 @@
+"""
+Micro-benchmark do parse do campo Tag dos prontuários.
+
+Compara o parser atual (regex compilada + finditer, data montada à mão) com a
+implementação anterior (re.findall não compilado + strptime) sobre Tags
+sintéticos no formato do legado.
+
+Uso:
+    python src/tests/bench_prontuario_parsing.py [--registros 2000] [--entries 20] [--repeticoes 5]
+"""
+import re
+import sys
+import random
+import timeit
+import argparse
+from datetime import datetime, timedelta
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from migrations.prontuarios.migrate_prontuarios import parse_prontuario_entries
+
+
+RESPONSAVEIS = ["DRA MIRELLA", "DRA JULIANA", "DR. CARLOS", "RECEITA MÉDICA", "CITOVET LABORATORIO"]
+
+
+def parse_prontuario_entries_anterior(tag_text: str):
+    """Implementação anterior (referência do benchmark)."""
+    if not tag_text or not tag_text.strip():
+        return []
+
+    pattern = r'\[(\d{2}/\d{2}/\d{4}\s+\d{2}:\d{2}:\d{2})\s*-\s*([^\]]+)\]:\s*([^\[]*)'
+    matches = re.findall(pattern, tag_text, re.DOTALL)
+
+    entries = []
+    for data_str, responsavel, conteudo in matches:
+        try:
+            data = datetime.strptime(data_str.strip(), '%d/%m/%Y %H:%M:%S')
+        except ValueError:
+            continue
+
+        responsavel = responsavel.strip()
+        conteudo = conteudo.strip()
+        if not conteudo:
+            continue
+
+        tipo = 'PRONTUARIO'
+        responsavel_upper = responsavel.upper()
+        if 'RECEITA' in responsavel_upper:
+            tipo = 'RECEITA_MEDICA'
+        elif any(lab in responsavel_upper for lab in ['CITOVET', 'LABVET', 'LABORATORIO']):
+            tipo = 'LABORATORIO'
+
+        entries.append({'data': data, 'responsavel': responsavel, 'conteudo': conteudo, 'tipo': tipo})
+
+    entries.sort(key=lambda x: x['data'])
+    return entries
+
+
+def gerar_tags(registros: int, entries: int, seed: int = 42):
+    """Gera Tags sintéticos (sem '[' no conteúdo, para os dois parsers concordarem)."""
+    rnd = random.Random(seed)
+    inicio = datetime(2015, 1, 1)
+    tags = []
+    for _ in range(registros):
+        partes = []
+        for _ in range(entries):
+            data = inicio + timedelta(minutes=rnd.randint(0, 5_000_000))
+            conteudo = " ".join(rnd.choice(["paciente", "vacina", "V10", "retorno", "peso", "exame",
+                                            "dipirona 1ml", "2x ao dia", "sem alterações"])
+                                for _ in range(rnd.randint(10, 80)))
+            partes.append(f"[{data:%d/%m/%Y %H:%M:%S} - {rnd.choice(RESPONSAVEIS)}]:\n{conteudo}\n")
+        tags.append("\n".join(partes))
+    return tags
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do parse de prontuários")
+    parser.add_argument("--registros", type=int, default=2000, help="Tags gerados")
+    parser.add_argument("--entries", type=int, default=20, help="Entries por Tag")
+    parser.add_argument("--repeticoes", type=int, default=5, help="Repetições (vale o melhor tempo)")
+    args = parser.parse_args()
+
+    tags = gerar_tags(args.registros, args.entries)
+
+    # Os dois parsers precisam produzir o mesmo resultado na amostra
+    for tag in tags[:50]:
+        assert parse_prontuario_entries(tag) == parse_prontuario_entries_anterior(tag)
+
+    anterior = min(timeit.repeat(lambda: [parse_prontuario_entries_anterior(t) for t in tags],
+                                 number=1, repeat=args.repeticoes))
+    atual = min(timeit.repeat(lambda: [parse_prontuario_entries(t) for t in tags],
+                              number=1, repeat=args.repeticoes))
+
+    total = args.registros * args.entries
+    print("=" * 60)
+    print(f"PARSE DE PRONTUÁRIOS ({args.registros:,} Tags, {total:,} entries)")
+    print("=" * 60)
+    print(f"  Anterior (findall + strptime): {anterior:.3f}s ({total / anterior:,.0f} entries/s)")
+    print(f"  Atual (finditer + data fixa):  {atual:.3f}s ({total / atual:,.0f} entries/s)")
+    print(f"  Ganho: {anterior / atual:.2f}x")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
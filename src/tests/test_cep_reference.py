@@ -0,0 +1,92 @@
+"""
+Testes da base offline de faixas de CEP (CSV e SQLite).
+"""
+import sys
+import sqlite3
+import tempfile
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from common.cep_reference import CepRangeReference
+
+
+FAIXAS = [
+    ("89010*", "89099*", "Blumenau", "sc"),
+    ("88000000", "88099999", "Florianópolis", "SC"),
+    ("01000-000", "01599-999", "São Paulo", "SP"),
+]
+
+
+def verificar(referencia):
+    assert len(referencia) == 3
+    assert referencia.buscar("89010-000") == {"cep": "89010-000", "localidade": "Blumenau", "uf": "SC"}
+    assert referencia.buscar("89099999")["localidade"] == "Blumenau"
+    assert referencia.buscar("88015100")["localidade"] == "Florianópolis"
+    assert referencia.buscar("01001000")["uf"] == "SP"
+    # Fora das faixas, antes da primeira e CEP inválido
+    assert referencia.buscar("89100000") is None
+    assert referencia.buscar("00000001") is None
+    assert referencia.buscar("123") is None
+
+
+def test_referencia_csv():
+    """Faixas em CSV (com prefixos e máscara) resolvem por busca binária."""
+    with tempfile.TemporaryDirectory() as tmp:
+        arquivo = Path(tmp) / "faixas.csv"
+        linhas = ["cep_inicio;cep_fim;localidade;uf"] + [";".join(f) for f in FAIXAS]
+        arquivo.write_text("\n".join(linhas), encoding="utf-8")
+
+        verificar(CepRangeReference(arquivo))
+        print("✓ Referência CSV OK")
+
+
+def test_referencia_sqlite():
+    """Faixas em SQLite (tabela faixas_cep) resolvem igual ao CSV."""
+    with tempfile.TemporaryDirectory() as tmp:
+        arquivo = Path(tmp) / "faixas.sqlite"
+        conn = sqlite3.connect(str(arquivo))
+        conn.execute("CREATE TABLE faixas_cep (cep_inicio TEXT, cep_fim TEXT, localidade TEXT, uf TEXT)")
+        conn.executemany("INSERT INTO faixas_cep VALUES (?, ?, ?, ?)", FAIXAS)
+        conn.commit()
+        conn.close()
+
+        verificar(CepRangeReference(arquivo))
+        print("✓ Referência SQLite OK")
+
+
+def test_ceps_numericos():
+    """CEPs numéricos (sem o zero à esquerda) não são lidos como prefixo."""
+    with tempfile.TemporaryDirectory() as tmp:
+        arquivo = Path(tmp) / "faixas.sqlite"
+        conn = sqlite3.connect(str(arquivo))
+        conn.execute("CREATE TABLE faixas_cep (cep_inicio INTEGER, cep_fim REAL, localidade TEXT, uf TEXT)")
+        conn.executemany("INSERT INTO faixas_cep VALUES (?, ?, ?, ?)", [
+            (1000000, 1099999.0, "São Paulo", "SP"),
+            (10000000, 10999999.0, "Outra", "SP"),
+        ])
+        conn.commit()
+        conn.close()
+
+        referencia = CepRangeReference(arquivo)
+        assert referencia.buscar("01001-000")["localidade"] == "São Paulo"
+        assert referencia.buscar("10000000")["localidade"] == "Outra"
+        assert referencia.buscar("01100000") is None
+
+        arquivo = Path(tmp) / "faixas.csv"
+        arquivo.write_text("cep_inicio,cep_fim,localidade,uf\n"
+                           "1000000,1099999,São Paulo,SP\n"
+                           "02000-000,02999-999,São Paulo,SP\n"
+                           "890*,,Blumenau,SC\n", encoding="utf-8")
+
+        referencia = CepRangeReference(arquivo)
+        assert referencia.buscar("01099999")["localidade"] == "São Paulo"
+        assert referencia.buscar("02500000")["localidade"] == "São Paulo"
+        assert referencia.buscar("89012345")["localidade"] == "Blumenau"
+        assert referencia.buscar("10000000") is None
+        print("✓ CEPs numéricos e com zero à esquerda OK")
+
+
+if __name__ == "__main__":
+    test_referencia_csv()
+    test_referencia_sqlite()
+    test_ceps_numericos()
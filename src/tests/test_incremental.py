@@ -0,0 +1,151 @@
+"""
+Testes do fingerprint (SHA-256 por lista explícita de colunas) do modo incremental.
+
+O engine falso do legado responde a lista de colunas (sys.columns) e calcula o
+hash das linhas em Python, como o HASHBYTES do SQL Server faria, para as
+colunas presentes na expressão montada pela migração.
+"""
+import re
+import sys
+import hashlib
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from common.incremental import montar_fingerprint_sql, fingerprint_sql, calcular_delta
+
+
+# PET_ANIMAL_PRONTUARIO no legado: Tag é text (ignorado pelo BINARY_CHECKSUM)
+COLUNAS = [("Codigo", "int"), ("Animal", "int"), ("Tag", "text"), ("Foto", "image"), ("Data", "datetime")]
+
+
+class Resultado(list):
+    def scalar(self):
+        return self[0][0] if self else None
+
+
+class ConexaoFalsa:
+    def __init__(self, engine):
+        self.engine = engine
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def execution_options(self, **kwargs):
+        return self
+
+    def execute(self, sql, params=None):
+        return Resultado(self.engine.responder(str(sql), params or {}))
+
+
+class LegadoFalso:
+    url = "mssql://legado"
+
+    def __init__(self, linhas, versao=13):
+        self.linhas = linhas
+        self.versao = versao
+        self.consultas = []
+
+    def connect(self):
+        return ConexaoFalsa(self)
+
+    def responder(self, sql, params):
+        self.consultas.append(sql)
+        if "SERVERPROPERTY" in sql:
+            return [(self.versao,)]
+        if "sys.columns" in sql:
+            return list(COLUNAS)
+        # Colunas que entram no hash: as citadas na expressão montada
+        presentes = re.findall(r"\[(\w+)\]", sql)
+        return [
+            (codigo, hash_linha(linha, presentes))
+            for codigo, linha in sorted(self.linhas.items())
+            if codigo <= params["watermark"]
+        ]
+
+
+class DestinoFalso:
+    url = "mssql://destino"
+
+    def __init__(self, fingerprints):
+        self.fingerprints = fingerprints
+
+    def connect(self):
+        return ConexaoFalsa(self)
+
+    def begin(self):
+        return ConexaoFalsa(self)
+
+    def responder(self, sql, params):
+        if "SELECT nCodigoOrigem, bFingerprint" in sql:
+            return list(self.fingerprints.items())
+        return []
+
+
+def hash_linha(linha, colunas):
+    texto = "\x1f".join("\x00" if linha.get(c) is None else str(linha[c]) for c in colunas)
+    return hashlib.sha256(texto.encode("utf-8")).digest()
+
+
+def test_expressao_por_coluna():
+    """Todas as colunas entram no hash, com conversão própria para text, image e datas."""
+    sql = montar_fingerprint_sql(COLUNAS)
+    assert sql.startswith("HASHBYTES('SHA2_256', CONCAT(")
+    assert sql.endswith(", CHAR(31))) AS bFingerprint")
+    assert "ISNULL(CAST([Tag] AS nvarchar(max)), CHAR(0)), CHAR(31)" in sql
+    assert "CONCAT_WS" not in sql
+    assert "CONVERT(varchar(max), CAST([Foto] AS varbinary(max)), 2)" in sql
+    assert "CONVERT(varchar(40), [Data], 126)" in sql
+    assert re.findall(r"\[(\w+)\]", sql) == [nome for nome, _ in COLUNAS]
+    assert "BINARY_CHECKSUM" not in sql
+
+    # Nome com colchete escapado; uma única coluna ainda dá dois argumentos ao CONCAT
+    assert "[Obs]]x]" in montar_fingerprint_sql([("Obs]x", "ntext")])
+    assert montar_fingerprint_sql([("Codigo", "int")]) == (
+        "HASHBYTES('SHA2_256', CONCAT(ISNULL(CAST([Codigo] AS nvarchar(max)), CHAR(0)), CHAR(31))) AS bFingerprint"
+    )
+    print("✓ Expressão do fingerprint por coluna")
+
+
+def test_edicao_em_coluna_text():
+    """Edição só no Tag (text), mesmo mantendo o tamanho, aparece no delta."""
+    linhas = {
+        1: {"Codigo": 1, "Animal": 10, "Tag": "[01/02/2024 10:00:00 - DRA MIRELLA]:\nConsulta", "Data": "2024-02-01"},
+        2: {"Codigo": 2, "Animal": 20, "Tag": "[01/02/2024 11:00:00 - DRA MIRELLA]:\nRetorno", "Data": "2024-02-01"},
+        3: {"Codigo": 3, "Animal": 30, "Tag": None, "Data": None},
+    }
+    nomes = [nome for nome, _ in COLUNAS]
+    gravados = {codigo: hash_linha(linha, nomes) for codigo, linha in linhas.items()}
+
+    legado = LegadoFalso(linhas)
+    destino = DestinoFalso(gravados)
+    assert calcular_delta(legado, destino, "T", "PET_ANIMAL_PRONTUARIO") == (3, [])
+
+    linhas[2]["Tag"] = linhas[2]["Tag"].replace("Retorno", "Retirou")
+    assert calcular_delta(legado, destino, "T", "PET_ANIMAL_PRONTUARIO") == (3, [2])
+
+    # Lista de colunas consultada uma vez por engine e tabela
+    assert sum("sys.columns" in sql for sql in legado.consultas) == 1
+    assert fingerprint_sql(legado, "PET_ANIMAL_PRONTUARIO") == montar_fingerprint_sql(COLUNAS)
+    print("✓ Edição em coluna text detectada")
+
+
+def test_versao_minima_do_legado():
+    """Legado anterior ao SQL Server 2016 falha com erro explícito."""
+    legado = LegadoFalso({}, versao=12)
+    legado.url = "mssql://legado-2014"
+    try:
+        fingerprint_sql(legado, "PET_ANIMAL")
+    except RuntimeError as e:
+        assert "SQL Server 2016" in str(e) and "12" in str(e)
+    else:
+        raise AssertionError("versão antiga do legado aceita")
+    print("✓ Versão mínima do legado verificada")
+
+
+if __name__ == "__main__":
+    test_expressao_por_coluna()
+    test_edicao_em_coluna_text()
+    test_versao_minima_do_legado()
@@ -0,0 +1,153 @@
+"""
+Testes da leitura paralela por faixas de Codigo contra um engine falso em memória.
+
+O engine interpreta as três consultas do leitor (MIN/MAX, NTILE e a página
+TOP/keyset) sobre uma lista de Codigos com buracos, como no legado.
+"""
+import sys
+import threading
+import time
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from common.parallel_reader import calcular_faixas, iterar_paginas_paralelas
+
+
+class Linha:
+    def __init__(self, codigo):
+        self._mapping = {"Codigo": codigo}
+
+
+class Resultado(list):
+    def fetchall(self):
+        return list(self)
+
+    def fetchone(self):
+        return self[0] if self else None
+
+
+class ConexaoFalsa:
+    def __init__(self, engine):
+        self.engine = engine
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def execute(self, sql, params):
+        sql = str(sql)
+        codigos = [c for c in self.engine.codigos if c > params["ultimo_codigo"]]
+
+        if "NTILE" in sql:
+            n = params["particoes"]
+            tamanho, resto = divmod(len(codigos), n)
+            faixas, inicio = [], 0
+            for i in range(n):
+                fim = inicio + tamanho + (1 if i < resto else 0)
+                if fim > inicio:
+                    faixas.append((codigos[inicio], codigos[fim - 1]))
+                inicio = fim
+            return Resultado(faixas)
+
+        if "MIN(Codigo)" in sql:
+            return Resultado([(min(codigos), max(codigos)) if codigos else (None, None)])
+
+        with self.engine.lock:
+            self.engine.paginas_lidas += 1
+        if self.engine.falhar_em is not None and params["ultimo_codigo"] >= self.engine.falhar_em:
+            raise RuntimeError("conexão perdida")
+        if "fim" in params:
+            codigos = [c for c in codigos if c <= params["fim"]]
+        return Resultado([Linha(c) for c in codigos[:params["limite"]]])
+
+
+class EngineFalso:
+    def __init__(self, codigos, falhar_em=None):
+        self.codigos = sorted(codigos)
+        self.falhar_em = falhar_em
+        self.paginas_lidas = 0
+        self.lock = threading.Lock()
+
+    def connect(self):
+        return ConexaoFalsa(self)
+
+
+# Codigos com buracos e um bloco denso no fim (faixas MIN/MAX desiguais)
+CODIGOS = [1, 2, 3, 7, 10, 11, 12, 13, 20, 21, 40, 41, 42, 43, 44, 45, 46, 47, 48, 49] + list(range(100, 160))
+
+
+def ler(engine, **kwargs):
+    return [
+        [linha._mapping["Codigo"] for linha in pagina]
+        for pagina in iterar_paginas_paralelas(engine, "PET_ANIMAL", "Codigo", **kwargs)
+    ]
+
+
+def test_ordem_sem_buracos_nem_duplicados():
+    """Todas as combinações entregam os Codigos em ordem, uma única vez cada."""
+    for particoes in (1, 2, 3, 7):
+        for equilibrar in (False, True):
+            for ultimo_codigo in (-1, 12, 49):
+                paginas = ler(EngineFalso(CODIGOS), batch_size=4, ultimo_codigo=ultimo_codigo,
+                              particoes=particoes, max_fila=1, equilibrar=equilibrar)
+                lidos = [c for pagina in paginas for c in pagina]
+                esperado = [c for c in CODIGOS if c > ultimo_codigo]
+                assert lidos == esperado, (particoes, equilibrar, ultimo_codigo, lidos)
+                assert all(0 < len(p) <= 4 for p in paginas)
+    print("✓ Ordem por Codigo sem buracos nem duplicados nas fronteiras das faixas")
+
+
+def test_faixas_contiguas():
+    """As faixas cobrem de MIN a MAX sem sobreposição."""
+    faixas = calcular_faixas(EngineFalso(CODIGOS), "PET_ANIMAL", 4)
+    assert faixas[0][0] == min(CODIGOS) and faixas[-1][1] == max(CODIGOS)
+    assert all(fim + 1 == proximo for (_, fim), (proximo, _) in zip(faixas, faixas[1:]))
+
+    equilibradas = calcular_faixas(EngineFalso(CODIGOS), "PET_ANIMAL", 4, equilibrar=True)
+    assert [sum(1 for c in CODIGOS if i <= c <= f) for i, f in equilibradas] == [20, 20, 20, 20]
+    assert calcular_faixas(EngineFalso([]), "PET_ANIMAL", 4) == []
+    print("✓ Faixas contíguas (MIN/MAX e NTILE)")
+
+
+def test_fechamento_antecipado():
+    """Fechar o gerador para as threads de leitura (sem continuar buscando páginas)."""
+    antes = threading.active_count()
+    engine = EngineFalso(list(range(1, 10001)))
+    paginas = iterar_paginas_paralelas(engine, "PET_ANIMAL", "Codigo", 10,
+                                       particoes=4, max_fila=1)
+    primeira = next(paginas)
+    assert primeira[0]._mapping["Codigo"] == 1
+
+    paginas.close()
+    lidas = engine.paginas_lidas
+    time.sleep(0.3)
+
+    assert engine.paginas_lidas == lidas, "threads continuaram lendo após o fechamento"
+    assert threading.active_count() == antes, "threads de leitura ainda ativas"
+    # Fila limitada: cada faixa buscou no máximo a página entregue + max_fila + 1 em andamento
+    assert lidas <= 4 * 3
+    print(f"✓ Fechamento antecipado para as threads ({lidas} páginas lidas de 1000)")
+
+
+def test_erro_na_leitura():
+    """Erro em uma faixa é relançado para o consumidor na ordem de entrega."""
+    engine = EngineFalso(CODIGOS, falhar_em=100)
+    lidos = []
+    try:
+        for pagina in iterar_paginas_paralelas(engine, "PET_ANIMAL", "Codigo", 5, particoes=3):
+            lidos.extend(linha._mapping["Codigo"] for linha in pagina)
+    except RuntimeError as e:
+        assert "conexão perdida" in str(e)
+    else:
+        raise AssertionError("erro da thread de leitura não foi relançado")
+    assert lidos == [c for c in CODIGOS if c <= 104][:len(lidos)]
+    print("✓ Erro de leitura relançado")
+
+
+if __name__ == "__main__":
+    test_ordem_sem_buracos_nem_duplicados()
+    test_faixas_contiguas()
+    test_fechamento_antecipado()
+    test_erro_na_leitura()
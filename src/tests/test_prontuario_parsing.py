@@ -4,10 +4,13 @@ Testes para validar o parsing de prontuários.
 Testa a extração de entries do campo Tag com padrão [DD/MM/YYYY HH:MM:SS - RESPONSÁVEL]:
 """
 import sys
+from collections import Counter
+from datetime import datetime
 from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from migrations.prontuarios.migrate_prontuarios import parse_prontuario_entries
+from migrations.prontuarios.migrate_prontuarios import parse_prontuario_entries, parsear_em_paralelo
+from common.prontuario_entries import hashes_entries, entries_ja_gravadas
 
 
 def test_sample_parsing():
@@ -107,12 +110,140 @@ Outro entry"""
     assert "Linha 2" in entries[0]['conteudo']
     print("✓ Múltiplas linhas no conteúdo")
     
+    # Colchetes dentro do conteúdo não cortam o entry
+    com_colchetes = """[08/11/2025 10:54:05 - DRA MIRELLA]:
+Exame [hemograma] solicitado; retorno em [7] dias
+[08/11/2025 10:55:00 - RECEITA MÉDICA]:
+1. Dipirona [gotas]"""
+    
+    entries = parse_prontuario_entries(com_colchetes)
+    assert len(entries) == 2
+    assert entries[0]['conteudo'] == "Exame [hemograma] solicitado; retorno em [7] dias"
+    assert entries[1]['conteudo'] == "1. Dipirona [gotas]"
+    assert entries[1]['tipo'] == 'RECEITA_MEDICA'
+    print("✓ Colchetes no conteúdo")
+    
+    # Data inexistente é descartada; espaços extras entre data e hora são aceitos
+    datas = "[31/02/2025 10:00:00 - DRA X]:a[01/03/2025   09:05:07 - DRA X]:b"
+    entries = parse_prontuario_entries(datas)
+    assert len(entries) == 1
+    assert entries[0]['data'] == datetime(2025, 3, 1, 9, 5, 7)
+    print("✓ Datas inválidas e espaçamento")
+    
     print("\n✓ Todos os casos extremos passaram!")
 
 
+def test_identidade_entries():
+    """Identidade por entry: estável, sensível ao Codigo e sem colisão entre entries repetidas."""
+    
+    tag = """[08/11/2025 10:54:05 - DRA MIRELLA]:
+Consulta de rotina
+[08/11/2025 10:54:05 - DRA MIRELLA]:
+Consulta de rotina"""
+    
+    entries = parse_prontuario_entries(tag)
+    hashes = hashes_entries(10, entries)
+    assert len(hashes) == 2 and len(set(hashes)) == 2
+    assert all(len(h) == 20 for h in hashes)
+    assert hashes_entries(10, entries) == hashes
+    assert hashes_entries(11, entries)[0] != hashes[0]
+    
+    # Entry nova acrescentada ao Tag: as anteriores mantêm a identidade
+    novas = parse_prontuario_entries(tag + "\n[09/11/2025 08:00:00 - DRA JULIANA]:\nRetorno")
+    hashes_novas = hashes_entries(10, novas)
+    assert [h for h in hashes_novas if h not in hashes] == [hashes_novas[-1]]
+    print("✓ Identidade das entries")
+
+
+def test_backfill_pelo_destino():
+    """Backfill: só as entries com linha no destino (data e conteúdo) contam como gravadas."""
+    
+    tag = """[08/11/2025 10:54:05 - DRA MIRELLA]:
+Consulta de rotina
+[08/11/2025 10:54:05 - DRA MIRELLA]:
+Consulta de rotina
+[01/01/2020 09:00:00 - RECEITA MÉDICA]:
+Dipirona
+[09/11/2025 08:00:00 - DRA JULIANA]:
+Retorno"""
+    
+    entries = parse_prontuario_entries(tag)
+    hashes = hashes_entries(10, entries)
+    
+    # Gravadas antes: uma das consultas repetidas e a receita (data antiga não basta)
+    destino = Counter({
+        (datetime(2025, 11, 8, 10, 54, 5), "Consulta de rotina"): 1,
+        (datetime(2020, 1, 1, 9, 0, 0), "Dipirona"): 1,
+        (datetime(2025, 11, 9, 8, 0, 0), "Retorno editado"): 1,
+    })
+    gravadas = entries_ja_gravadas(entries, hashes, destino)
+    
+    novas = [e['conteudo'] for e, h in zip(entries, hashes) if h not in gravadas]
+    assert novas == ["Consulta de rotina", "Retorno"]
+    assert len(gravadas) == 2
+    assert destino[(datetime(2025, 11, 8, 10, 54, 5), "Consulta de rotina")] == 0
+    print("✓ Backfill pelas linhas do destino")
+
+
+def test_backfill_conteudo_com_colchete():
+    """Entry com '[' gravada cortada pelo parser anterior não é inserida de novo."""
+    
+    tag = """[08/11/2025 10:54:05 - DRA MIRELLA]:
+Exame [hemograma] normal
+[08/11/2025 11:00:00 - RECEITA MÉDICA]:
+Dipirona [1ml] 2x ao dia
+[09/11/2025 08:00:00 - DRA JULIANA]:
+Retorno [sem queixas]"""
+    
+    entries = parse_prontuario_entries(tag)
+    assert entries[0]['conteudo'] == "Exame [hemograma] normal"
+    hashes = hashes_entries(10, entries)
+    
+    # Parser anterior: conteúdo até o primeiro '['; a última entry é nova
+    destino = Counter({
+        (datetime(2025, 11, 8, 10, 54, 5), "Exame"): 1,
+        (datetime(2025, 11, 8, 11, 0, 0), "Dipirona"): 1,
+    })
+    gravadas = entries_ja_gravadas(entries, hashes, destino)
+    
+    novas = [e['conteudo'] for e, h in zip(entries, hashes) if h not in gravadas]
+    assert novas == ["Retorno [sem queixas]"]
+    assert sum(destino.values()) == 0
+    
+    # Linha já gravada com o conteúdo completo (parser atual) também vale
+    destino = Counter({(datetime(2025, 11, 8, 10, 54, 5), "Exame [hemograma] normal"): 1})
+    assert entries_ja_gravadas(entries[:1], hashes[:1], destino) == {hashes[0]}
+    print("✓ Backfill de entries com '[' (parser anterior)")
+
+
+def test_parse_em_paralelo_janela():
+    """Pool de parse: ordem da origem e registros consumidos sob demanda (janela limitada)."""
+    consumidos = []
+    
+    def registros():
+        for codigo in range(1, 201):
+            consumidos.append(codigo)
+            yield (codigo, codigo * 10, f"[01/02/2024 10:00:00 - DRA MIRELLA]:\nConsulta {codigo}")
+    
+    parseados = parsear_em_paralelo(registros(), workers=2, chunk_size=5)
+    primeiro = next(parseados)
+    assert primeiro[0] == 1 and primeiro[2][0]['conteudo'] == "Consulta 1"
+    # 2 x workers lotes de 5 em andamento (não os 200 registros de uma vez)
+    assert len(consumidos) <= 2 * 2 * 5, len(consumidos)
+    
+    resto = list(parseados)
+    assert [r[0] for r in [primeiro] + resto] == list(range(1, 201))
+    assert all(erro is None for _, _, _, erro in resto)
+    print(f"✓ Parse em paralelo com janela limitada ({len(consumidos)} registros lidos no 1º resultado)")
+
+
 if __name__ == "__main__":
     test_sample_parsing()
     test_edge_cases()
+    test_identidade_entries()
+    test_backfill_pelo_destino()
+    test_backfill_conteudo_com_colchete()
+    test_parse_em_paralelo_janela()
     
     print("\n" + "="*80)
     print("RESUMO: TODOS OS TESTES CONCLUÍDOS COM SUCESSO!")
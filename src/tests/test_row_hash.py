@@ -0,0 +1,52 @@
+"""
+Testes do hash de conteúdo usado para pular UPDATEs sem mudança.
+"""
+import sys
+from datetime import datetime
+from decimal import Decimal
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from common.row_hash import hash_linha, calcular_hashes, filtrar_alterados
+
+
+COLUNAS = ["sCdPet", "nVlPeso", "tDtPesagem"]
+
+
+def nova_linha(chave, peso, alteracao=None):
+    return {
+        "sCdPetPeso": chave,
+        "sCdPet": "PET-1",
+        "nVlPeso": Decimal(peso),
+        "tDtPesagem": datetime(2024, 5, 1, 10, 30),
+        "tDtAlteracao": alteracao or datetime.now(),
+    }
+
+
+def test_reexecucao_sem_mudancas():
+    """Linhas iguais (fora das colunas do hash) não vão para o UPDATE."""
+    primeira = [nova_linha("A", "10.500"), nova_linha("B", "3.000")]
+    gravados = calcular_hashes(primeira, "sCdPetPeso", COLUNAS)
+
+    segunda = [nova_linha("a", "10.500", datetime(2030, 1, 1)), nova_linha("B", "3.000")]
+    alterados, hashes = filtrar_alterados(segunda, "sCdPetPeso", COLUNAS, gravados)
+    assert alterados == []
+    assert hashes == {}
+    print("✓ Reexecução sem mudanças: nenhum UPDATE")
+
+
+def test_detecta_alteracao():
+    """Só a linha alterada (ou sem hash gravado) é devolvida, com o hash novo."""
+    gravados = calcular_hashes([nova_linha("A", "10.500"), nova_linha("B", "3.000")], "sCdPetPeso", COLUNAS)
+
+    linhas = [nova_linha("A", "10.500"), nova_linha("B", "3.250"), nova_linha("C", "1.000")]
+    alterados, hashes = filtrar_alterados(linhas, "sCdPetPeso", COLUNAS, gravados)
+    assert [r["sCdPetPeso"] for r in alterados] == ["B", "C"]
+    assert set(hashes) == {"b", "c"}
+    assert hashes["b"] == hash_linha(linhas[1], COLUNAS) != gravados["b"]
+    print("✓ Alterações detectadas")
+
+
+if __name__ == "__main__":
+    test_reexecucao_sem_mudancas()
+    test_detecta_alteracao()
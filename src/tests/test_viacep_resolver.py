@@ -0,0 +1,175 @@
+"""
+Testes do resolver concorrente da ViaCEP contra um servidor HTTP local.
+
+O servidor simula a API: CEPs conhecidos, {"erro": true} para desconhecidos
+e um 503 na primeira chamada de um CEP para exercitar as retentativas.
+"""
+import sys
+import json
+import threading
+import time
+import tempfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from common.local_cache import LocalCache
+from common.viacep_client import (
+    ViaCepResolver, TokenBucket,
+    STATUS_OK, STATUS_NAO_ENCONTRADO, STATUS_FALHA
+)
+
+
+CEPS = {
+    "89010000": {"cep": "89010-000", "localidade": "Blumenau", "uf": "SC"},
+    "01001000": {"cep": "01001-000", "localidade": "São Paulo", "uf": "SP"},
+    "88015100": {"cep": "88015-100", "localidade": "Florianópolis", "uf": "SC"},
+}
+
+
+class FakeViaCep(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    chamadas = {}
+    lock = threading.Lock()
+
+    def do_GET(self):
+        cep = self.path.strip("/").split("/")[-2]  # /ws/<cep>/json/
+        with self.lock:
+            self.chamadas[cep] = self.chamadas.get(cep, 0) + 1
+            chamada = self.chamadas[cep]
+
+        if cep == "88015100" and chamada == 1:
+            self._responder(503, {"mensagem": "indisponível"})
+        elif cep == "99999999":
+            self._responder(500, {"mensagem": "sempre falha"})
+        elif cep in CEPS:
+            self._responder(200, CEPS[cep])
+        else:
+            self._responder(200, {"erro": True})
+
+    def _responder(self, status, corpo):
+        dados = json.dumps(corpo).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(dados)))
+        self.end_headers()
+        self.wfile.write(dados)
+
+    def log_message(self, *args):
+        pass
+
+
+def iniciar_servidor():
+    FakeViaCep.chamadas = {}
+    servidor = ThreadingHTTPServer(("127.0.0.1", 0), FakeViaCep)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor, f"http://127.0.0.1:{servidor.server_address[1]}/ws"
+
+
+def test_resolver_muitos():
+    """Resolve CEPs em paralelo, deduplica e repete em falhas transitórias."""
+    servidor, base_url = iniciar_servidor()
+    try:
+        resolver = ViaCepResolver(base_url=base_url, max_workers=4, rate_per_second=100,
+                                  max_retries=3, backoff_seconds=0.01, timeout=5)
+
+        ceps = ["89010-000", "89010000", "01001000", "88015-100", "00000000", "123", "99999999"]
+        resultados = resolver.resolver_muitos(ceps)
+
+        print(json.dumps({k: v[0] for k, v in resultados.items()}, indent=2))
+
+        assert resultados["89010000"] == (STATUS_OK, CEPS["89010000"])
+        assert resultados["01001000"][1]["uf"] == "SP"
+        assert resultados["88015100"][0] == STATUS_OK, "503 deveria ser repetido"
+        assert resultados["00000000"] == (STATUS_NAO_ENCONTRADO, None)
+        assert resultados["123"] == (STATUS_NAO_ENCONTRADO, None)
+        assert resultados["99999999"] == (STATUS_FALHA, None)
+
+        # CEP repetido (com e sem máscara) é consultado uma única vez
+        assert FakeViaCep.chamadas["89010000"] == 1
+        assert FakeViaCep.chamadas["88015100"] == 2
+        assert FakeViaCep.chamadas["99999999"] == 3
+        assert "123" not in FakeViaCep.chamadas
+
+        print("\n✓ Resolver concorrente OK")
+    finally:
+        servidor.shutdown()
+
+
+def test_resolver_com_cache():
+    """Encontrados e inexistentes vêm do cache na segunda execução; falhas são repetidas."""
+    servidor, base_url = iniciar_servidor()
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = LocalCache("viacep_teste", path=Path(tmp) / "cache.sqlite")
+            cache.enabled = True
+
+            def novo_resolver():
+                return ViaCepResolver(base_url=base_url, max_workers=4, rate_per_second=100,
+                                      max_retries=2, backoff_seconds=0.01, timeout=5, cache=cache)
+
+            ceps = ["89010-000", "01001000", "00000000", "99999999"]
+            primeira = novo_resolver().resolver_muitos(ceps)
+            chamadas = dict(FakeViaCep.chamadas)
+
+            segunda = novo_resolver().resolver_muitos(ceps)
+
+            assert segunda["89010000"] == primeira["89010000"] == (STATUS_OK, CEPS["89010000"])
+            assert segunda["00000000"] == (STATUS_NAO_ENCONTRADO, None)
+            assert segunda["99999999"] == (STATUS_FALHA, None)
+
+            # Somente o CEP com falha voltou a ser consultado
+            for cep in ("89010000", "01001000", "00000000"):
+                assert FakeViaCep.chamadas[cep] == chamadas[cep], f"{cep} deveria vir do cache"
+            assert FakeViaCep.chamadas["99999999"] == chamadas["99999999"] + 2
+
+            print("✓ Cache do resolver OK")
+    finally:
+        servidor.shutdown()
+
+
+def test_cache_negativo_desativado():
+    """Com TTL negativo 0 os CEPs inexistentes não são guardados (voltam a ser consultados)."""
+    servidor, base_url = iniciar_servidor()
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = LocalCache("viacep_teste", path=Path(tmp) / "cache.sqlite")
+            cache.enabled = True
+
+            def novo_resolver():
+                return ViaCepResolver(base_url=base_url, max_workers=2, rate_per_second=100,
+                                      max_retries=1, backoff_seconds=0.01, timeout=5,
+                                      cache=cache, ttl_negativo=0)
+
+            novo_resolver().resolver_muitos(["89010000", "00000000"])
+            assert cache.get("00000000") is None
+            assert cache.get("89010000") is not None
+
+            segunda = novo_resolver().resolver_muitos(["89010000", "00000000"])
+            assert segunda["00000000"] == (STATUS_NAO_ENCONTRADO, None)
+            assert FakeViaCep.chamadas["00000000"] == 2
+            assert FakeViaCep.chamadas["89010000"] == 1
+
+            print("✓ Cache negativo desativado com TTL 0")
+    finally:
+        servidor.shutdown()
+
+
+def test_token_bucket():
+    """O token bucket limita a taxa depois de consumir a rajada inicial."""
+    bucket = TokenBucket(rate=50, capacity=1)
+    inicio = time.monotonic()
+    for _ in range(11):
+        bucket.acquire()
+    decorrido = time.monotonic() - inicio
+
+    # 1 token imediato + 10 a 50/s = ~0.2s
+    assert decorrido >= 0.18, f"Token bucket liberou rápido demais ({decorrido:.3f}s)"
+    print(f"✓ Token bucket OK ({decorrido:.3f}s para 11 retiradas a 50/s)")
+
+
+if __name__ == "__main__":
+    test_resolver_muitos()
+    test_resolver_com_cache()
+    test_cache_negativo_desativado()
+    test_token_bucket()
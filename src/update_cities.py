@@ -1,11 +1,10 @@
 import os
-import time
 import argparse
-import requests
 from pathlib import Path
 from sqlalchemy import text
 from dotenv import load_dotenv
 from db import get_engine_from_env
+from common.staging_utils import bulk_update_via_staging
 
 try:
     from rapidfuzz import fuzz, process
@@ -24,16 +23,30 @@ env_path = Path(__file__).parent.parent / ".env"
 load_dotenv(dotenv_path=env_path)
 
 DEFAULT_TENANT = os.getenv("DEFAULT_TENANT", "dfedd5f4-f30c-45ea-bc1e-695081d8415c")
-VIACEP_DELAY_SECONDS = int(os.getenv("VIACEP_DELAY_SECONDS", "5"))
-VIACEP_BATCH_SIZE = int(os.getenv("VIACEP_BATCH_SIZE", "100"))
 FUZZY_MIN_SCORE = int(os.getenv("FUZZY_MIN_SCORE", "85"))
+UPDATE_BATCH_SIZE = int(os.getenv("UPDATE_CITIES_BATCH_SIZE", "1000"))
+CEP_REFERENCE_FILE = os.getenv("CEP_REFERENCE_FILE", "")
 
+# Colunas de endereço gravadas em massa; as opcionais vazias não sobrescrevem o valor atual
+ENDERECO_UPDATE_COLUMNS = ["sCdCidade", "sDsEndereco", "sNmBairro", "sDsComplemento"]
+ENDERECO_COLUNAS_OPCIONAIS = ["sDsEndereco", "sNmBairro", "sDsComplemento"]
 
-def clean_cep(cep: str) -> str:
-    """Remove caracteres não numéricos do CEP."""
-    if not cep:
-        return ""
-    return "".join(filter(str.isdigit, str(cep)))
+# Importado depois do load_dotenv para que as variáveis VIACEP_* do .env valham
+from common.viacep_client import (
+    ViaCepResolver, criar_cache_viacep, clean_cep, STATUS_OK, STATUS_FALHA,
+    VIACEP_BASE_URL, VIACEP_MAX_WORKERS, VIACEP_RATE_PER_SECOND, VIACEP_MAX_RETRIES
+)
+from common.cep_reference import CepRangeReference
+
+_resolver_padrao = None
+
+
+def get_resolver() -> ViaCepResolver:
+    """Retorna o resolver ViaCEP compartilhado (sessões keep-alive e cache em disco)."""
+    global _resolver_padrao
+    if _resolver_padrao is None:
+        _resolver_padrao = ViaCepResolver(cache=criar_cache_viacep())
+    return _resolver_padrao
 
 
 def consulta_viacep(cep: str) -> dict:
@@ -41,107 +54,136 @@ def consulta_viacep(cep: str) -> dict:
     
     Retorna dict com localidade, uf, ibge ou None se houver erro.
     """
-    cep_limpo = clean_cep(cep)
-    if len(cep_limpo) != 8:
-        return None
-    
-    url = f"http://viacep.com.br/ws/{cep_limpo}/json/"
-    try:
-        response = requests.get(url, timeout=10)
-        if response.status_code == 200:
-            data = response.json()
-            if "erro" not in data:
-                return data
-    except Exception as e:
-        print(f"Erro ao consultar CEP {cep_limpo}: {e}")
-    return None
+    return get_resolver().consultar(cep)
 
 
-def buscar_cidade_por_nome_uf(dest_engine, nome_cidade: str, uf: str, tenant_id: str):
-    """Busca cidade pelo nome (com fuzzy matching) e UF.
-    
-    Retorna o sCdCidade que melhor corresponde ao nome + UF.
-    Em caso de empate, prefere cidades de SC.
+class CidadeIndex:
     """
-    if not nome_cidade or not uf:
-        return None
+    Tabela CIDADE em memória, carregada uma única vez.
     
-    # Buscar todas as cidades da UF (ou todas se não encontrar na UF)
-    select_sql = text("""
-SELECT sCdCidade, sNmCidade, sCdUf
-FROM CIDADE
-WHERE sCdUf = :uf
-""")
-    
-    select_all_sql = text("""
-SELECT sCdCidade, sNmCidade, sCdUf
-FROM CIDADE
-""")
+    Mantém as opções de fuzzy matching por UF (e de todas as cidades) já montadas,
+    um hash de nomes normalizados para match exato e a memória das resoluções
+    (localidade, UF) -> sCdCidade, então cada pessoa custa um lookup em dicionário.
+    """
     
-    cidades = []
-    with dest_engine.connect() as conn:
-        try:
-            result = conn.execute(select_sql, {"uf": uf.upper()})
-            cidades = result.fetchall()
-            
-            # Se não encontrou nenhuma cidade na UF, buscar em todas
-            if not cidades:
-                result = conn.execute(select_all_sql)
-                cidades = result.fetchall()
-        except Exception as e:
-            print(f"  Erro ao buscar cidades: {e}")
-            return None
+    _compartilhados = {}
     
-    if not cidades:
-        return None
+    def __init__(self, dest_engine, min_score: int = None):
+        self.min_score = FUZZY_MIN_SCORE if min_score is None else min_score
+        self.por_uf = {}        # {UF: {sNmCidade: sCdCidade}}
+        self.todas = {}         # {sNmCidade: (sCdCidade, UF)}
+        self.exatos = {}        # {(UF, NOME NORMALIZADO): sCdCidade}
+        self._resolvidos = {}   # {(localidade, UF): sCdCidade ou None}
+        
+        with dest_engine.connect() as conn:
+            result = conn.execute(text("SELECT sCdCidade, sNmCidade, sCdUf FROM CIDADE"))
+            for scd_cidade, nome, uf in result:
+                if not nome:
+                    continue
+                uf = (uf or "").upper()
+                self.por_uf.setdefault(uf, {})[nome] = str(scd_cidade)
+                self.todas[nome] = (str(scd_cidade), uf)
+                self.exatos[(uf, self.normalizar(nome))] = str(scd_cidade)
+        
+        print(f"✓ {len(self.todas)} cidades carregadas em memória ({len(self.por_uf)} UFs)")
     
-    # Se não temos biblioteca de fuzzy matching, tentar match exato
-    if FUZZY_LIB is None:
-        for cidade in cidades:
-            if cidade[1].upper() == nome_cidade.upper():
-                return str(cidade[0])
-        return None
+    @classmethod
+    def shared(cls, dest_engine):
+        """
+        Retorna o índice do processo para esse banco (carregado na primeira chamada).
+        
+        Usado só na thread principal (as threads do resolver ViaCEP apenas consultam
+        CEPs), por isso não há lock.
+        """
+        chave = str(dest_engine.url)
+        if chave not in cls._compartilhados:
+            cls._compartilhados[chave] = cls(dest_engine)
+        return cls._compartilhados[chave]
     
-    # Criar lista de tuplas (sNmCidade, (sCdCidade, sCdUf)) para o fuzzy matching
-    choices = {cidade[1]: (str(cidade[0]), cidade[2]) for cidade in cidades}
+    @staticmethod
+    def normalizar(nome: str) -> str:
+        """Nome em maiúsculas com espaços colapsados (chave do match exato)."""
+        return " ".join(nome.split()).upper()
     
-    # Fazer fuzzy matching
-    result = process.extractOne(
-        nome_cidade, 
-        choices.keys(), 
-        scorer=fuzz.ratio,
-        score_cutoff=FUZZY_MIN_SCORE
-    )
+    def buscar(self, nome_cidade: str, uf: str):
+        """Retorna o sCdCidade de (localidade, UF) ou None (resultado memorizado)."""
+        if not nome_cidade or not uf:
+            return None
+        
+        chave = (nome_cidade, uf.upper())
+        if chave not in self._resolvidos:
+            self._resolvidos[chave] = self._resolver(nome_cidade, uf.upper())
+        return self._resolvidos[chave]
     
-    if result:
-        cidade_match, score, _ = result if len(result) == 3 else (result[0], result[1], None)
-        scd_cidade, uf_match = choices[cidade_match]
+    def _resolver(self, nome_cidade: str, uf: str):
+        # Match exato (nome normalizado) na própria UF
+        scd_cidade = self.exatos.get((uf, self.normalizar(nome_cidade)))
+        if scd_cidade:
+            return scd_cidade
+        
+        cidades_uf = self.por_uf.get(uf)
+        
+        # Se não temos biblioteca de fuzzy matching, só existe o match exato
+        if FUZZY_LIB is None:
+            if cidades_uf:
+                return None
+            for nome, (scd_cidade, _) in self.todas.items():
+                if nome.upper() == nome_cidade.upper():
+                    return scd_cidade
+            return None
+        
+        # Cidades da UF (ou todas se a UF não tiver nenhuma)
+        if cidades_uf:
+            choices = cidades_uf
+        else:
+            choices = self.todas
+        
+        result = process.extractOne(nome_cidade, choices.keys(), scorer=fuzz.ratio, score_cutoff=self.min_score)
+        if not result:
+            return None
+        
+        cidade_match, score = result[0], result[1]
+        if cidades_uf:
+            scd_cidade, uf_match = cidades_uf[cidade_match], uf
+        else:
+            scd_cidade, uf_match = self.todas[cidade_match]
         
         print(f"  Match fuzzy: '{nome_cidade}' -> '{cidade_match}' ({uf_match}) [score: {score}%]")
         
         # Se o score for < 95 e a UF não bater, tentar encontrar em SC
-        if score < 95 and uf_match != uf.upper() and uf.upper() != "SC":
-            # Buscar especificamente em SC
-            cidades_sc = [c for c in cidades if c[2] == "SC"]
-            if cidades_sc:
-                choices_sc = {cidade[1]: (str(cidade[0]), cidade[2]) for cidade in cidades_sc}
+        if score < 95 and uf_match != uf and uf != "SC":
+            choices_sc = self.por_uf.get("SC")
+            if choices_sc:
                 result_sc = process.extractOne(
                     nome_cidade,
                     choices_sc.keys(),
                     scorer=fuzz.ratio,
-                    score_cutoff=FUZZY_MIN_SCORE - 10  # Aceitar score menor para SC
+                    score_cutoff=self.min_score - 10  # Aceitar score menor para SC
                 )
                 if result_sc:
-                    cidade_sc, score_sc, _ = result_sc if len(result_sc) == 3 else (result_sc[0], result_sc[1], None)
+                    cidade_sc, score_sc = result_sc[0], result_sc[1]
                     # Se o score de SC for próximo (diferença < 15), preferir SC
                     if score_sc >= score - 15:
-                        scd_cidade_sc, _ = choices_sc[cidade_sc]
                         print(f"  ⭐ Preferência SC: '{cidade_sc}' [score: {score_sc}%]")
-                        return scd_cidade_sc
+                        return choices_sc[cidade_sc]
         
         return scd_cidade
+
+
+def buscar_cidade_por_nome_uf(dest_engine, nome_cidade: str, uf: str, tenant_id: str):
+    """Busca cidade pelo nome (com fuzzy matching) e UF.
     
-    return None
+    Retorna o sCdCidade que melhor corresponde ao nome + UF.
+    Em caso de empate, prefere cidades de SC.
+    """
+    if not nome_cidade or not uf:
+        return None
+    
+    try:
+        return CidadeIndex.shared(dest_engine).buscar(nome_cidade, uf)
+    except Exception as e:
+        print(f"  Erro ao buscar cidades: {e}")
+        return None
 
 
 def buscar_cidade_por_ibge(dest_engine, codigo_ibge: str, tenant_id: str):
@@ -192,16 +234,55 @@ WHERE sCdPessoa = :pessoa
         conn.execute(update_sql, params)
 
 
+def montar_linha_endereco(scd_pessoa: str, dados_endereco: dict) -> dict:
+    """Converte dados_endereco em uma linha da staging (campos vazios viram NULL)."""
+    return {
+        "sCdPessoa": scd_pessoa,
+        "sCdCidade": dados_endereco["scd_cidade"],
+        "sDsEndereco": dados_endereco.get("logradouro") or None,
+        "sNmBairro": dados_endereco.get("bairro") or None,
+        "sDsComplemento": dados_endereco.get("complemento") or None,
+    }
+
+
+def gravar_enderecos(dest_engine, linhas: list, chunk_size: int = None) -> int:
+    """
+    Aplica os endereços em massa (staging + UPDATE ... FROM) em uma transação.
+    
+    Args:
+        dest_engine: Engine do banco destino
+        linhas: Linhas geradas por montar_linha_endereco
+        chunk_size: Registros por UPDATE (padrão UPDATE_CITIES_BATCH_SIZE)
+    
+    Returns:
+        int: Total de pessoas atualizadas
+    """
+    if not linhas:
+        return 0
+    
+    with dest_engine.begin() as conn:
+        return bulk_update_via_staging(
+            conn, "PESSOA", ["sCdPessoa"], ENDERECO_UPDATE_COLUMNS, linhas,
+            chunk_size=chunk_size or UPDATE_BATCH_SIZE,
+            coalesce_columns=ENDERECO_COLUNAS_OPCIONAIS
+        )
+
+
 def update_cities(args):
     """Atualiza as cidades das pessoas consultando a API ViaCEP."""
     dest_engine = get_engine_from_env("DEST_DB_URL")
     tenant_id = args.tenant or DEFAULT_TENANT
+    batch_size = getattr(args, "batch_size", None) or UPDATE_BATCH_SIZE
+    arquivo_referencia = getattr(args, "cep_reference", None) or CEP_REFERENCE_FILE
     
     print(f"\n{'='*60}")
     print(f"CONFIGURAÇÃO:")
-    print(f"  • Batch size: {VIACEP_BATCH_SIZE} requisições")
-    print(f"  • Delay entre lotes: {VIACEP_DELAY_SECONDS} segundos")
+    print(f"  • ViaCEP: {VIACEP_BASE_URL}")
+    print(f"  • Requisições simultâneas: {VIACEP_MAX_WORKERS}")
+    print(f"  • Limite: {VIACEP_RATE_PER_SECOND:g} req/s ({VIACEP_MAX_RETRIES} tentativas por CEP)")
+    print(f"  • Base offline de CEPs: {arquivo_referencia or 'não (somente ViaCEP)'}")
     print(f"  • Score mínimo fuzzy: {FUZZY_MIN_SCORE}%")
+    print(f"  • Lote de atualização: {batch_size}")
     print(f"  • Dry-run: {'SIM' if args.dry_run else 'NÃO'}")
     print(f"{'='*60}\n")
     
@@ -220,21 +301,48 @@ ORDER BY tDtCadastro
         pessoas = result.fetchall()
     
     total = len(pessoas)
-    print(f"Total de pessoas com CEP para processar: {total}")
+    
+    # Agrupar pessoas pelo CEP limpo: cada CEP é consultado e resolvido uma única vez
+    pessoas_por_cep = {}
+    for row in pessoas:
+        pessoas_por_cep.setdefault(clean_cep(row[1]), []).append(str(row[0]))
+    
+    total_ceps = len(pessoas_por_cep)
+    print(f"Total de pessoas com CEP para processar: {total} ({total_ceps} CEPs distintos)")
+    
+    # Resolver primeiro pela base offline de faixas de CEP (sem rede)
+    consultas = {}
+    ceps_viacep = list(pessoas_por_cep)
+    if arquivo_referencia:
+        referencia = CepRangeReference(arquivo_referencia)
+        print(f"\n📚 Base offline: {len(referencia)} faixas de CEP carregadas")
+        for cep in pessoas_por_cep:
+            dados_cep = referencia.buscar(cep)
+            if dados_cep:
+                consultas[cep] = (STATUS_OK, dados_cep)
+        ceps_viacep = [cep for cep in pessoas_por_cep if cep not in consultas]
+        print(f"✓ {len(consultas)} CEPs resolvidos offline, {len(ceps_viacep)} sem faixa")
+    
+    # Consultar ViaCEP em paralelo apenas os CEPs restantes (limitado pelo token bucket)
+    if ceps_viacep:
+        print(f"\n🌐 Consultando ViaCEP...")
+        consultas.update(get_resolver().resolver_muitos(ceps_viacep))
+    print(f"✓ {len(consultas)} CEPs resolvidos")
+    
+    # Tabela CIDADE em memória (uma carga para todas as pessoas)
+    CidadeIndex.shared(dest_engine)
+    print()
     
     processados = 0
     atualizados = 0
     erros = 0
+    pendentes = []
     
-    for idx, row in enumerate(pessoas, start=1):
-        scd_pessoa = str(row[0])
-        cep = str(row[1])
-        cidade_atual = str(row[2]) if row[2] else None
-        
-        print(f"[{idx}/{total}] Processando pessoa {scd_pessoa}, CEP: {cep}")
+    for idx, (cep, scd_pessoas) in enumerate(pessoas_por_cep.items(), start=1):
+        print(f"[{idx}/{total_ceps}] CEP: {cep} ({len(scd_pessoas)} pessoa(s))")
         
-        # Consultar ViaCEP
-        dados_cep = consulta_viacep(cep)
+        # Resultado da consulta ViaCEP (já feita em paralelo)
+        status, dados_cep = consultas.get(cep, (None, None))
         
         if dados_cep:
             localidade = dados_cep.get("localidade")
@@ -261,23 +369,35 @@ ORDER BY tDtCadastro
                     "complemento": complemento
                 }
                 
-                # Atualizar endereço completo (não só cidade)
-                atualizar_endereco_pessoa(dest_engine, scd_pessoa, dados_endereco, dry_run=args.dry_run)
-                print(f"  ✓ Endereço atualizado completo")
-                atualizados += 1
+                # Endereço completo (não só cidade) de todas as pessoas do CEP
+                for scd_pessoa in scd_pessoas:
+                    if args.dry_run:
+                        atualizar_endereco_pessoa(dest_engine, scd_pessoa, dados_endereco, dry_run=True)
+                    else:
+                        pendentes.append(montar_linha_endereco(scd_pessoa, dados_endereco))
+                print(f"  ✓ Endereço completo resolvido")
+                atualizados += len(scd_pessoas)
             else:
                 print(f"  ⚠ Cidade '{localidade}/{uf}' não encontrada no banco destino (score < {FUZZY_MIN_SCORE}%)")
-                erros += 1
+                erros += len(scd_pessoas)
         else:
-            print(f"  ✗ CEP inválido ou não encontrado no ViaCEP")
-            erros += 1
+            if status == STATUS_FALHA:
+                print(f"  ✗ Falha ao consultar o ViaCEP (rede/limite de requisições)")
+            else:
+                print(f"  ✗ CEP inválido ou não encontrado no ViaCEP")
+            erros += len(scd_pessoas)
         
-        processados += 1
+        processados += len(scd_pessoas)
         
-        # Delay a cada VIACEP_BATCH_SIZE registros para respeitar rate limit da API
-        if idx % VIACEP_BATCH_SIZE == 0 and idx < total:
-            print(f"\n💤 Processados {idx}/{total} - Aguardando {VIACEP_DELAY_SECONDS} segundos (rate limit ViaCEP)...\n")
-            time.sleep(VIACEP_DELAY_SECONDS)
+        # Gravar em lotes (poucos comandos por milhar de pessoas)
+        if len(pendentes) >= batch_size:
+            print(f"  💾 Gravando {len(pendentes)} endereços...")
+            gravar_enderecos(dest_engine, pendentes, batch_size)
+            pendentes = []
+    
+    if pendentes:
+        print(f"\n💾 Gravando {len(pendentes)} endereços...")
+        gravar_enderecos(dest_engine, pendentes, batch_size)
     
     print("\n" + "="*60)
     print(f"Processamento concluído!")
@@ -297,6 +417,17 @@ def main():
         action="store_true", 
         help="Não atualiza o banco, apenas mostra operações"
     )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=UPDATE_BATCH_SIZE,
+        help=f"Pessoas por lote de atualização (padrão: {UPDATE_BATCH_SIZE})"
+    )
+    parser.add_argument(
+        "--cep-reference",
+        default=CEP_REFERENCE_FILE,
+        help="Arquivo CSV/SQLite de faixas de CEP -> cidade/UF (ViaCEP só para CEPs sem faixa)"
+    )
     args = parser.parse_args()
     update_cities(args)
 